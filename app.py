@@ -56,14 +56,9 @@ def date_diff_filter(date):
 
 @login_manager.user_loader
 def load_user(user_id):
-    from models import Admin
-    return Admin.query.get(int(user_id))
+    # Served from a per-worker cache rather than a query per request
+    from principals import load_principal
+    return load_principal(int(user_id))
 
 # Create upload directory
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-with app.app_context():
-    # Import models here to ensure tables are created
-    import models  # noqa: F401
-    db.create_all()
-    logging.info("Database tables created")
\ No newline at end of file
@@ -0,0 +1,90 @@
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import Sequence, bindparam, select, text, update, insert
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Numbers leased per trip to the database. It is also the sequence's
+# INCREMENT, so changing it needs the sequence altered to match.
+BLOCK_SIZE = 50
+SUFFIX_LENGTH = 4
+SUFFIX_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+application_id_sequence = Sequence('application_id_seq', start=1, increment=BLOCK_SIZE, metadata=db.metadata)
+
+def encode(number):
+    """Base36 suffix, zero padded to four characters (longer once they run out)"""
+    digits = ''
+    while number:
+        number, remainder = divmod(number, 36)
+        digits = SUFFIX_ALPHABET[remainder] + digits
+    return digits.rjust(SUFFIX_LENGTH, '0')
+
+def format_application_id(day, number):
+    return f"APP-{day}-{encode(number)}"
+
+class ApplicationIdAllocator:
+    """Hands out APP-YYYYMMDD-XXXX ids from a global counter.
+
+    The suffix is the counter in base36 and the counter never repeats, so ids
+    are unique without any lookup. On PostgreSQL each worker leases blocks of
+    BLOCK_SIZE numbers from a sequence; nextval is never rolled back, so a
+    failed transaction only leaves a gap. SQLite has no sequences, so there a
+    counter row is bumped in the inserting transaction (SQLite serializes
+    writers, and a rollback takes the number back with the row).
+
+    Ids issued before this allocator were random, so each block is checked
+    once against existing ids for the day and any clashes are skipped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+        self._skip = set()
+        self._checked_day = None
+
+    def allocate(self, connection):
+        day = datetime.utcnow().strftime('%Y%m%d')
+        if connection.dialect.name != 'postgresql':
+            return self._allocate_from_counter(connection, day)
+        with self._lock:
+            while True:
+                if self._next >= self._end:
+                    self._next = connection.execute(select(application_id_sequence.next_value())).scalar()
+                    self._end = self._next + BLOCK_SIZE
+                    self._checked_day = None
+                if self._checked_day != day:
+                    self._skip = self._existing(connection, day, range(self._next, self._end))
+                    self._checked_day = day
+                number = self._next
+                self._next += 1
+                if number not in self._skip:
+                    return format_application_id(day, number)
+
+    def _allocate_from_counter(self, connection, day):
+        from models import IdCounter
+        counters = IdCounter.__table__
+        while True:
+            bumped = connection.execute(
+                update(counters).where(counters.c.name == 'application_id').values(value=counters.c.value + 1)
+            ).rowcount
+            if not bumped:
+                connection.execute(insert(counters).values(name='application_id', value=1))
+            number = connection.execute(select(counters.c.value).where(counters.c.name == 'application_id')).scalar()
+            if not self._existing(connection, day, [number]):
+                return format_application_id(day, number)
+
+    @staticmethod
+    def _existing(connection, day, numbers):
+        """Numbers whose id was already taken, e.g. by a legacy random id"""
+        candidates = {format_application_id(day, number): number for number in numbers}
+        taken = connection.execute(
+            text('SELECT application_id FROM applications WHERE application_id IN :ids')
+            .bindparams(bindparam('ids', expanding=True)),
+            {'ids': list(candidates)}
+        ).scalars()
+        return {candidates[application_id] for application_id in taken}
+
+allocator = ApplicationIdAllocator()
@@ -0,0 +1,296 @@
+"""Micro-benchmarks for the admin listing, search and export pages.
+
+Seeds synthetic datasets (by default 1k, 100k and 1M completed applications
+across 300 internships) with core bulk inserts, then times the admin hot
+paths at each size: the dashboard, /internships, /applications (plain,
+filtered, searched and deep-paginated), /shortlisted and both export
+formats. For every case it reports latency, statements per request and the
+peak Python heap of one request.
+
+    python -m benchmarks.admin_views
+    python -m benchmarks.admin_views --sizes 1k,10k --repeat 10
+    python -m benchmarks.admin_views --sizes 100k --only applications,export_csv
+    python -m benchmarks.admin_views --database-url postgresql://localhost/internship_bench
+
+Datasets are cumulative: the 100k run tops up the 1k data rather than
+starting over. As with webhook_load, DATABASE_URL is ignored and the default
+is a temporary SQLite file.
+"""
+import os
+import sys
+import time
+import shutil
+import random
+import logging
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks.harness import (
+    StatementCounter, latency_summary, peak_rss_mb, baseline_path, load_baseline,
+    save_baseline, compare_to_baseline, print_table
+)
+
+BENCHMARK = 'admin_views'
+SEED_CHUNK = 20000
+STATUS_WEIGHTS = {'pending': 60, 'shortlisted': 15, 'selected': 5, 'rejected': 20}
+FIRST_NAMES = ['Tendai', 'Rudo', 'Farai', 'Chipo', 'Tatenda', 'Nyasha', 'Kudzai', 'Tafadzwa', 'Rumbi', 'Simba',
+               'Anesu', 'Tinashe', 'Ruvimbo', 'Takudzwa', 'Munashe', 'Vimbai']
+LAST_NAMES = ['Moyo', 'Ncube', 'Dube', 'Sibanda', 'Mpofu', 'Chikwanha', 'Mutasa', 'Ndlovu', 'Banda', 'Phiri',
+              'Zhou', 'Chirwa', 'Makoni', 'Marufu', 'Gumbo', 'Shumba']
+
+def parse_size(text):
+    text = text.strip().lower()
+    multiplier = {'k': 1000, 'm': 1000000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+def format_size(size):
+    if size >= 1000000 and size % 1000000 == 0:
+        return f'{size // 1000000}M'
+    if size >= 1000 and size % 1000 == 0:
+        return f'{size // 1000}k'
+    return str(size)
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='1k,100k,1M', help='application counts to benchmark (default 1k,100k,1M)')
+    parser.add_argument('--internships', type=int, default=300, help='internships to spread applications over')
+    parser.add_argument('--repeat', type=int, default=5, help='timed requests per case (default 5)')
+    parser.add_argument('--only', help='comma-separated case names to run')
+    parser.add_argument('--database-url', help='database to run against (default: a temporary SQLite file)')
+    parser.add_argument('--existing-data', action='store_true',
+                        help='benchmark the data already in --database-url instead of seeding')
+    parser.add_argument('--seed', type=int, default=42, help='random seed for the synthetic data')
+    parser.add_argument('--baseline', help='baseline file (default: benchmarks/baselines/admin_views-<backend>.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed regression vs the baseline (default 0.2)')
+    return parser.parse_args(argv)
+
+class Seeder:
+    """Bulk-inserts internships and applications with SQLAlchemy core inserts"""
+
+    def __init__(self, db, internship_count, seed):
+        self.db = db
+        self.internship_count = internship_count
+        self.random = random.Random(seed)
+        self.internship_ids = []
+        self.seeded = 0
+
+    def seed_internships(self, admin_id):
+        from models import Internship
+        now = datetime.utcnow()
+        rows = []
+        for index in range(self.internship_count):
+            rows.append({
+                'title': f'{self.random.choice(["Software", "Data", "Finance", "Marketing", "Design"])} Intern {index}',
+                'description': 'Synthetic benchmark internship',
+                'requirements': 'None',
+                'position_code': f'Q{index:05d}',
+                'secret_code': f'S{index:05d}',
+                # A tenth already closed, so the deadline filters have something to do
+                'deadline': now + timedelta(days=self.random.randint(-30, -1) if index % 10 == 0 else self.random.randint(1, 60)),
+                'is_active': True,
+                'accepting_applications': index % 10 != 0,
+                'created_by': admin_id,
+                'created_at': now - timedelta(days=self.random.randint(0, 365)),
+                'updated_at': now,
+            })
+        self.db.session.execute(Internship.__table__.insert(), rows)
+        self.db.session.commit()
+        self.internship_ids = [row.id for row in self.db.session.query(Internship.id).filter(Internship.position_code.like('Q%'))]
+
+    def _application_row(self, number, now, statuses, weights):
+        first, last = self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES)
+        applied_at = now - timedelta(minutes=self.random.randint(0, 365 * 24 * 60))
+        phone = f'+26377{number:07d}'
+        return {
+            'application_id': f'APP-{applied_at:%Y%m%d}-{number:07d}',
+            'internship_id': self.random.choice(self.internship_ids),
+            'full_name': f'{first} {last}',
+            'email': f'{first.lower()}.{last.lower()}{number}@example.com',
+            'phone_number': phone,
+            'whatsapp_number': phone,
+            'cover_letter': 'Please see attached CV for details',
+            'cv_filename': f'bench-{number}.pdf',
+            'cv_original_filename': 'cv_attachment.pdf',
+            'status': self.random.choices(statuses, weights)[0],
+            'applied_at': applied_at,
+            'updated_at': applied_at,
+            'conversation_state': 'completed',
+            'temp_data': {},
+        }
+
+    def seed_applications_to(self, total):
+        from models import Application
+        now = datetime.utcnow()
+        statuses, weights = list(STATUS_WEIGHTS), list(STATUS_WEIGHTS.values())
+        started = time.perf_counter()
+        while self.seeded < total:
+            count = min(SEED_CHUNK, total - self.seeded)
+            rows = [self._application_row(self.seeded + offset, now, statuses, weights) for offset in range(count)]
+            self.db.session.execute(Application.__table__.insert(), rows)
+            self.db.session.commit()
+            self.seeded += count
+        return time.perf_counter() - started
+
+def build_cases(internship_id):
+    """Case name -> URL; the internship filter uses one real internship from the data"""
+    return {
+        'dashboard': '/',
+        'internships': '/internships',
+        'internships_closed': '/internships?status=closed',
+        'applications': '/applications',
+        'applications_page_200': '/applications?page=200',
+        'applications_filtered': f'/applications?internship_id={internship_id}&status=shortlisted',
+        'applications_search': '/applications?search=Moyo',
+        'applications_search_email': '/applications?search=tendai.ncube1',
+        'shortlisted': '/shortlisted',
+        'shortlisted_filtered': f'/shortlisted?internship_id={internship_id}',
+        'export_csv': '/applications/export?format=csv',
+        'export_csv_filtered': f'/applications/export?format=csv&internship_id={internship_id}&status=pending',
+        'export_zip': '/applications/export?format=zip',
+    }
+
+def measure(client, counter, url, repeat):
+    """Time `repeat` requests (after one warm-up) and one more under tracemalloc"""
+    response = client.get(url)
+    response.get_data()
+    status = response.status_code
+
+    timings = []
+    statements = 0
+    for _ in range(repeat):
+        before = counter.in_requests
+        started = time.perf_counter()
+        response = client.get(url)
+        # Exports are streamed from disk; include reading the whole body
+        body = response.get_data()
+        timings.append(time.perf_counter() - started)
+        statements = counter.in_requests - before
+        status = response.status_code
+
+    tracemalloc.start()
+    client.get(url).get_data()
+    heap_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    summary = latency_summary(timings)
+    return {
+        'status': status,
+        'p50_ms': summary['p50_ms'],
+        'p95_ms': summary['p95_ms'],
+        'max_ms': summary['max_ms'],
+        'queries': statements,
+        'heap_peak_mb': round(heap_peak / (1024 * 1024), 1),
+        'response_kb': round(len(body) / 1024, 1),
+    }
+
+def main(argv=None):
+    args = parse_args(argv)
+    work_dir = tempfile.mkdtemp(prefix='bench-admin-')
+    # The export views write their files with tempfile; keep them inside the
+    # work directory so they are removed with it
+    tempfile.tempdir = work_dir
+    try:
+        database_url = args.database_url or f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+        os.environ['DATABASE_URL'] = database_url
+        backend = database_url.split(':', 1)[0].split('+', 1)[0]
+
+        import main as _routes  # noqa: F401  (registers routes)
+        from app import app, db
+        from schema import init_db
+        from models import Admin, Application
+
+        logging.getLogger().setLevel(logging.WARNING)
+        app.config['UPLOAD_FOLDER'] = os.path.join(work_dir, 'uploads')
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+        with app.app_context():
+            init_db()
+            existing = Application.query.count()
+            if args.existing_data:
+                sizes = [existing]
+            elif existing:
+                raise SystemExit('Refusing to seed a database that already has applications; '
+                                 'use an empty database or pass --existing-data')
+            else:
+                sizes = sorted(parse_size(size) for size in args.sizes.split(','))
+
+            seeder = Seeder(db, args.internships, args.seed)
+            admin_id = Admin.query.first().id
+            if args.existing_data:
+                sample_internship = db.session.query(Application.internship_id).filter(
+                    Application.internship_id.isnot(None)).limit(1).scalar()
+            else:
+                seeder.seed_internships(admin_id)
+                sample_internship = seeder.internship_ids[0]
+
+        client = app.test_client()
+        with client.session_transaction() as session:
+            # Log in without going through the password hash on every run
+            session['_user_id'] = str(admin_id)
+            session['_fresh'] = True
+
+        counter = StatementCounter().install()
+        cases = build_cases(sample_internship)
+        if args.only:
+            wanted = set(args.only.split(','))
+            cases = {name: url for name, url in cases.items() if name in wanted}
+
+        results = {}
+        for size in sizes:
+            label = format_size(size)
+            if not args.existing_data:
+                with app.app_context():
+                    seconds = seeder.seed_applications_to(size)
+                print(f'\nSeeded {label} applications across {args.internships} internships in {seconds:.1f}s')
+            rows = []
+            for name, url in cases.items():
+                result = measure(client, counter, url, args.repeat)
+                results[f'{label}.{name}'] = result
+                status = '' if result['status'] == 200 else f"  [HTTP {result['status']}]"
+                rows.append((name, f"p50 {result['p50_ms']:>9} ms  p95 {result['p95_ms']:>9} ms  "
+                                   f"{result['queries']:>3} queries  heap {result['heap_peak_mb']:>7} MB  "
+                                   f"{result['response_kb']:>9} KB{status}"))
+            print_table(f'Admin views at {label} applications ({backend})', rows)
+        print(f'\nPeak RSS {peak_rss_mb()} MB')
+
+        metrics = {}
+        for key, result in results.items():
+            for field in ('p50_ms', 'queries', 'heap_peak_mb'):
+                metrics[f'{key}.{field}'] = result[field]
+        checks = {key: 'lower' for key in metrics}
+        outcome = {
+            'benchmark': BENCHMARK,
+            'backend': backend,
+            'params': {'sizes': sizes, 'internships': args.internships, 'repeat': args.repeat, 'seed': args.seed,
+                       'existing_data': args.existing_data},
+            'metrics': metrics,
+        }
+
+        path = args.baseline or baseline_path(BENCHMARK, backend)
+        if args.save_baseline:
+            save_baseline(path, outcome)
+            print(f'Saved baseline to {path}')
+            return 0
+        baseline = load_baseline(path)
+        if baseline is None:
+            print(f'No baseline at {path}; run with --save-baseline to record one')
+            return 0
+        if baseline.get('params') != outcome['params']:
+            print(f'Baseline {path} was recorded with different parameters; not comparing')
+            return 0
+        regressions = compare_to_baseline(metrics, baseline['metrics'], checks, args.tolerance)
+        if regressions:
+            print(f'Regressions vs baseline ({args.tolerance:.0%} tolerance):')
+            for line in regressions:
+                print(f'  {line}')
+            return 1
+        print(f'No regressions vs baseline recorded {baseline.get("recorded_at")}')
+        return 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    sys.exit(main())
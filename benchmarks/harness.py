@@ -0,0 +1,131 @@
+"""Shared plumbing for the benchmark scripts: statistics, statement counting,
+memory readings and baseline files."""
+import os
+import sys
+import json
+import math
+import resource
+import threading
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+def percentile(values, pct):
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def latency_summary(seconds):
+    """p50/p95/p99/max/mean of a list of durations, in milliseconds"""
+    if not seconds:
+        return {'count': 0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0, 'mean_ms': 0.0}
+    return {
+        'count': len(seconds),
+        'p50_ms': round(percentile(seconds, 50) * 1000, 2),
+        'p95_ms': round(percentile(seconds, 95) * 1000, 2),
+        'p99_ms': round(percentile(seconds, 99) * 1000, 2),
+        'max_ms': round(max(seconds) * 1000, 2),
+        'mean_ms': round(sum(seconds) / len(seconds) * 1000, 2),
+    }
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 1)
+
+class StatementCounter:
+    """Counts every statement the engine executes, split by where it ran.
+
+    Statements issued from request handlers are bucketed by URL rule;
+    everything else (pipeline stages, outbox dispatcher, status batcher)
+    counts as background. Threads registered with ignore_current_thread()
+    (the benchmark's own polling) are not counted at all.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ignored = set()
+        self.by_route = {}
+        self.background = 0
+
+    def install(self):
+        event.listen(Engine, 'after_cursor_execute', self._count)
+        return self
+
+    def uninstall(self):
+        event.remove(Engine, 'after_cursor_execute', self._count)
+
+    def ignore_current_thread(self):
+        self._ignored.add(threading.get_ident())
+
+    def reset(self):
+        with self._lock:
+            self.by_route = {}
+            self.background = 0
+
+    @property
+    def total(self):
+        with self._lock:
+            return self.background + sum(self.by_route.values())
+
+    @property
+    def in_requests(self):
+        with self._lock:
+            return sum(self.by_route.values())
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() in self._ignored:
+            return
+        from flask import has_request_context, request
+        with self._lock:
+            if has_request_context():
+                route = request.url_rule.rule if request.url_rule else request.path
+                self.by_route[route] = self.by_route.get(route, 0) + 1
+            else:
+                self.background += 1
+
+def baseline_path(name, backend):
+    return os.path.join(BASELINE_DIR, f'{name}-{backend}.json')
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_baseline(path, result):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(dict(result, recorded_at=datetime.utcnow().isoformat(timespec='seconds')), f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def compare_to_baseline(metrics, baseline_metrics, checks, tolerance):
+    """Return a line per metric that got worse than the baseline by more than `tolerance`.
+
+    `checks` maps metric name to 'lower' or 'higher' (the better direction).
+    """
+    regressions = []
+    for name, better in checks.items():
+        if name not in metrics or name not in baseline_metrics:
+            continue
+        current, previous = metrics[name], baseline_metrics[name]
+        if not previous:
+            continue
+        change = (current - previous) / previous
+        worse = change > tolerance if better == 'lower' else change < -tolerance
+        if worse:
+            regressions.append(f'{name}: {previous} -> {current} ({change:+.0%})')
+    return regressions
+
+def print_table(title, rows):
+    print(f'\n{title}')
+    width = max(len(label) for label, _ in rows)
+    for label, value in rows:
+        print(f'  {label.ljust(width)}  {value}')
@@ -0,0 +1,154 @@
+"""Cold-start benchmark: how long a fresh worker process takes to import the
+app and answer its first request.
+
+Each run starts a new interpreter, imports main the way gunicorn does, then
+sends one request to /health through the test client. It reports the import
+time (and how much of it is Flask/SQLAlchemy themselves), the time to the
+first response, the statements executed during import (should be none: the
+schema is handled by `flask init-db`), and whether optional heavy modules
+were imported eagerly.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 20 --database-url postgresql://localhost/internship_bench
+
+As with the other benchmarks, DATABASE_URL is ignored and the default is a
+temporary SQLite file, initialized once before the runs.
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks.harness import (
+    latency_summary, baseline_path, load_baseline, save_baseline, compare_to_baseline, print_table
+)
+
+BENCHMARK = 'startup'
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Should only be imported when a request needs them
+LAZY_MODULES = ('twilio', 'qrcode', 'requests')
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import flask, flask_login, flask_sqlalchemy, sqlalchemy.orm
+frameworks = time.perf_counter() - started
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+statements = []
+event.listen(Engine, 'after_cursor_execute', lambda *args: statements.append(args[2]))
+import main
+imported = time.perf_counter() - started
+import_statements = len(statements)
+eager = [name for name in %(lazy)r if name in sys.modules]
+response = main.app.test_client().get('/health')
+first_request = time.perf_counter() - started
+print(json.dumps({
+    'frameworks': frameworks, 'imported': imported, 'first_request': first_request,
+    'import_statements': import_statements, 'request_statements': len(statements) - import_statements,
+    'status': response.status_code, 'eager': eager,
+}))
+''' % {'lazy': LAZY_MODULES}
+
+INIT = '''
+import json, time
+import main
+from schema import init_db
+started = time.perf_counter()
+with main.app.app_context():
+    init_db()
+print(json.dumps({'init_db': time.perf_counter() - started}))
+'''
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10, help='fresh processes to start (default 10)')
+    parser.add_argument('--database-url', help='database to run against (default: a temporary SQLite file)')
+    parser.add_argument('--baseline', help='baseline file (default: benchmarks/baselines/startup-<backend>.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed regression vs the baseline (default 0.2)')
+    return parser.parse_args(argv)
+
+def run_python(code, env):
+    """Run `code` in a fresh interpreter and return the JSON it prints last"""
+    completed = subprocess.run([sys.executable, '-c', code], cwd=REPO_DIR, env=env,
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise SystemExit(f'Probe process failed:\n{completed.stderr[-2000:]}')
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def main(argv=None):
+    args = parse_args(argv)
+    work_dir = tempfile.mkdtemp(prefix='bench-startup-')
+    try:
+        database_url = args.database_url or f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+        backend = database_url.split(':', 1)[0].split('+', 1)[0]
+        env = dict(os.environ, DATABASE_URL=database_url)
+        for name in ('SQL_PROFILER', 'PYTHONDONTWRITEBYTECODE'):
+            env.pop(name, None)
+
+        init_seconds = run_python(INIT, env)['init_db']
+        # One unmeasured start so .pyc files exist, as they would on a deployed instance
+        run_python(PROBE, env)
+        runs = [run_python(PROBE, env) for _ in range(args.runs)]
+
+        imports = latency_summary([run['imported'] for run in runs])
+        frameworks = latency_summary([run['frameworks'] for run in runs])
+        first_requests = latency_summary([run['first_request'] for run in runs])
+        import_statements = max(run['import_statements'] for run in runs)
+        request_statements = max(run['request_statements'] for run in runs)
+        eager = sorted({name for run in runs for name in run['eager']})
+        statuses = sorted({run['status'] for run in runs})
+
+        print_table(f'Cold start ({backend}, {args.runs} fresh processes)', [
+            ('import main p50/p95', f"{imports['p50_ms']} / {imports['p95_ms']} ms"),
+            ('  of which Flask/SQLAlchemy', f"{frameworks['p50_ms']} ms (p50)"),
+            ('first response p50/p95', f"{first_requests['p50_ms']} / {first_requests['p95_ms']} ms (HTTP {', '.join(map(str, statuses))})"),
+            ('statements during import', import_statements),
+            ('statements in first request', request_statements),
+            ('optional modules imported eagerly', ', '.join(eager) or 'none'),
+            ('flask init-db (deploy step)', f'{init_seconds * 1000:.1f} ms'),
+        ])
+
+        metrics = {
+            'import_p50_ms': imports['p50_ms'],
+            'app_import_p50_ms': round(imports['p50_ms'] - frameworks['p50_ms'], 2),
+            'first_request_p50_ms': first_requests['p50_ms'],
+            'import_statements': import_statements,
+        }
+        checks = {key: 'lower' for key in metrics}
+        outcome = {
+            'benchmark': BENCHMARK,
+            'backend': backend,
+            'params': {'runs': args.runs},
+            'metrics': metrics,
+        }
+
+        path = args.baseline or baseline_path(BENCHMARK, backend)
+        if args.save_baseline:
+            save_baseline(path, outcome)
+            print(f'Saved baseline to {path}')
+            return 0
+        baseline = load_baseline(path)
+        if baseline is None:
+            print(f'No baseline at {path}; run with --save-baseline to record one')
+            return 0
+        if baseline.get('params') != outcome['params']:
+            print(f'Baseline {path} was recorded with different parameters; not comparing')
+            return 0
+        regressions = compare_to_baseline(metrics, baseline['metrics'], checks, args.tolerance)
+        if regressions:
+            print(f'Regressions vs baseline ({args.tolerance:.0%} tolerance):')
+            for line in regressions:
+                print(f'  {line}')
+            return 1
+        print(f'No regressions vs baseline recorded {baseline.get("recorded_at")}')
+        return 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    sys.exit(main())
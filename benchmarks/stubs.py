@@ -0,0 +1,269 @@
+"""Local stand-ins for Twilio, the WhatsApp media host and the SMTP server.
+
+Each stub is a real network server on 127.0.0.1, so the app exercises the
+same clients (aiohttp for Twilio, requests for media, smtplib for email)
+it uses in production, just without leaving the machine.
+"""
+import os
+import ssl
+import json
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+import subprocess
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode
+from urllib.request import Request, urlopen
+
+# A minimal one-page PDF, enough to pass header/trailer checks
+SAMPLE_PDF = (
+    b'%PDF-1.4\n'
+    b'1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n'
+    b'2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n'
+    b'3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 612 792]>>endobj\n'
+    b'trailer<</Root 1 0 R>>\n'
+    b'%%EOF\n'
+)
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class _HTTPStub:
+    handler_class = None
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _count(self):
+        with self._lock:
+            self.requests += 1
+
+    def start(self):
+        stub = self
+
+        class Handler(self.handler_class):
+            pass
+        Handler.stub = stub
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name=type(self).__name__, daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+class _MediaHandler(_QuietHandler):
+    def do_GET(self):
+        self.stub._count()
+        if self.stub.latency:
+            time.sleep(self.stub.latency)
+        self._reply(200, self.stub.content, 'application/pdf')
+
+class MediaServer(_HTTPStub):
+    """Serves the same PDF for any path, like Twilio's media URLs"""
+    handler_class = _MediaHandler
+
+    def __init__(self, latency=0.0, content=SAMPLE_PDF):
+        super().__init__(latency)
+        self.content = content
+
+    def media_url(self, name):
+        return f'{self.url}/media/{name}.pdf'
+
+class _TwilioHandler(_QuietHandler):
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+        if not self.path.endswith('/Messages.json'):
+            self._reply(404, b'{"code": 20404, "message": "Not found"}', 'application/json')
+            return
+        self.stub._count()
+        if self.stub.latency:
+            time.sleep(self.stub.latency)
+
+        sid = 'SM' + uuid.uuid4().hex
+        body = json.dumps({
+            'sid': sid,
+            'status': 'queued',
+            'to': form.get('To'),
+            'from': form.get('From'),
+            'body': form.get('Body'),
+            'num_segments': '1',
+            'direction': 'outbound-api',
+        }).encode()
+        self._reply(201, body, 'application/json')
+
+        if form.get('StatusCallback') and self.stub.send_status_callbacks:
+            self.stub.schedule_callbacks(form['StatusCallback'], sid)
+
+class TwilioStub(_HTTPStub):
+    """Accepts Messages.json creates and optionally posts sent/delivered callbacks back"""
+    handler_class = _TwilioHandler
+
+    def __init__(self, latency=0.0, send_status_callbacks=True, auth_token=None):
+        super().__init__(latency)
+        self.send_status_callbacks = send_status_callbacks
+        # Callbacks are signed like Twilio's when set
+        self.auth_token = auth_token
+        self.callbacks_sent = 0
+        self.callback_errors = 0
+
+    def schedule_callbacks(self, callback_url, sid):
+        threading.Thread(target=self._post_callbacks, args=(callback_url, sid), daemon=True).start()
+
+    def _post_callbacks(self, callback_url, sid):
+        for status in ('sent', 'delivered'):
+            params = {'MessageSid': sid, 'MessageStatus': status}
+            headers = {}
+            if self.auth_token:
+                from twilio.request_validator import RequestValidator
+                headers['X-Twilio-Signature'] = RequestValidator(self.auth_token).compute_signature(callback_url, params)
+            try:
+                urlopen(Request(callback_url, data=urlencode(params).encode(), headers=headers, method='POST'),
+                        timeout=10).close()
+                with self._lock:
+                    self.callbacks_sent += 1
+            except Exception:
+                with self._lock:
+                    self.callback_errors += 1
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _send(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+        self.wfile.flush()
+
+    def handle(self):
+        stub = self.server.stub
+        tls = False
+        self._send('220 benchmark-smtp ESMTP')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb == 'EHLO':
+                extensions = ['250-benchmark-smtp', '250-8BITMIME', '250-AUTH PLAIN']
+                if not tls:
+                    extensions.append('250-STARTTLS')
+                extensions[-1] = '250 ' + extensions[-1][4:]
+                for extension in extensions:
+                    self._send(extension)
+            elif verb == 'HELO':
+                self._send('250 benchmark-smtp')
+            elif verb == 'STARTTLS' and not tls:
+                self._send('220 Ready to start TLS')
+                self.connection = stub.ssl_context.wrap_socket(self.connection, server_side=True)
+                self.rfile = self.connection.makefile('rb')
+                self.wfile = self.connection.makefile('wb')
+                tls = True
+            elif verb == 'AUTH':
+                self._send('235 Authentication successful')
+            elif verb in ('MAIL', 'RCPT', 'RSET', 'NOOP'):
+                self._send('250 OK')
+            elif verb == 'DATA':
+                self._send('354 End data with <CR><LF>.<CR><LF>')
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b'.\r\n', b'.\n'):
+                        break
+                if stub.latency:
+                    time.sleep(stub.latency)
+                stub.record_message()
+                self._send('250 OK queued')
+            elif verb == 'QUIT':
+                self._send('221 Bye')
+                return
+            else:
+                self._send('502 Command not implemented')
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class SMTPStub:
+    """SMTP server with STARTTLS and AUTH PLAIN that accepts and discards mail.
+
+    The app's pool always upgrades with STARTTLS on ports other than 465, so
+    the stub needs a certificate; a throwaway self-signed one is generated
+    with the openssl CLI.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.messages = 0
+        self.sessions = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._cert_dir = None
+        self.ssl_context = None
+
+    def record_message(self):
+        with self._lock:
+            self.messages += 1
+
+    def _make_certificate(self):
+        if not shutil.which('openssl'):
+            raise RuntimeError('The SMTP stub needs the openssl CLI to create a self-signed certificate')
+        self._cert_dir = tempfile.mkdtemp(prefix='bench-smtp-')
+        cert = os.path.join(self._cert_dir, 'cert.pem')
+        key = os.path.join(self._cert_dir, 'key.pem')
+        subprocess.run(
+            ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+             '-subj', '/CN=localhost', '-keyout', key, '-out', cert],
+            check=True, capture_output=True
+        )
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(cert, key)
+        return context
+
+    def start(self):
+        self.ssl_context = self._make_certificate()
+        stub = self
+
+        class Handler(_SMTPHandler):
+            def setup(self):
+                super().setup()
+                with stub._lock:
+                    stub.sessions += 1
+
+        self._server = _ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self._server.stub = self
+        threading.Thread(target=self._server.serve_forever, name='SMTPStub', daemon=True).start()
+        return self
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._cert_dir:
+            shutil.rmtree(self._cert_dir, ignore_errors=True)
@@ -0,0 +1,370 @@
+"""Load test for the WhatsApp application conversation.
+
+Simulates N applicants running APPLY -> name -> email -> CV against
+/webhook/whatsapp concurrently, with Twilio, the media host and SMTP
+replaced by local stubs (see stubs.py), and reports webhook latency
+percentiles, throughput, database statements per conversation and peak
+memory. Results can be saved as a baseline and later runs are compared
+against it.
+
+    python -m benchmarks.webhook_load --applicants 200 --concurrency 20
+    python -m benchmarks.webhook_load --save-baseline
+    python -m benchmarks.webhook_load --database-url postgresql://localhost/internship_bench
+
+The default database is a throwaway SQLite file. DATABASE_URL from the
+environment is deliberately ignored so a run can never point at a live
+database by accident; pass --database-url to benchmark PostgreSQL, and use a
+dedicated database for it.
+"""
+import os
+import sys
+import time
+import shutil
+import random
+import string
+import logging
+import argparse
+import tempfile
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.harness import (
+    StatementCounter, latency_summary, peak_rss_mb, baseline_path, load_baseline,
+    save_baseline, compare_to_baseline, print_table
+)
+from benchmarks.stubs import MediaServer, TwilioStub, SMTPStub
+
+BENCHMARK = 'webhook_load'
+TWILIO_AUTH_TOKEN = 'benchmark'
+
+# Metric -> better direction, checked against the baseline
+REGRESSION_CHECKS = {
+    'webhook_p50_ms': 'lower',
+    'webhook_p95_ms': 'lower',
+    'webhook_p99_ms': 'lower',
+    'messages_per_sec': 'higher',
+    'db_statements_per_conversation': 'lower',
+    'peak_rss_mb': 'lower',
+}
+
+# Settings that would make the app talk to real providers instead of the stubs
+PROVIDER_SETTINGS = ('smtp_server', 'smtp_username', 'smtp_password', 'twilio_account_sid', 'twilio_auth_token')
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--applicants', type=int, default=100, help='conversations to run (default 100)')
+    parser.add_argument('--concurrency', type=int, default=10, help='applicants messaging at the same time (default 10)')
+    parser.add_argument('--think-time', type=float, default=0.0, help='seconds each applicant waits between messages')
+    parser.add_argument('--database-url', help='database to run against (default: a temporary SQLite file)')
+    parser.add_argument('--twilio-latency', type=float, default=0.05, help='simulated Twilio API latency in seconds')
+    parser.add_argument('--media-latency', type=float, default=0.05, help='simulated media download latency in seconds')
+    parser.add_argument('--smtp-latency', type=float, default=0.01, help='simulated SMTP DATA latency in seconds')
+    parser.add_argument('--no-status-callbacks', action='store_true', help='do not simulate Twilio status callbacks')
+    parser.add_argument('--keep-rate-limits', action='store_true',
+                        help='keep the production per-channel rate limits (by default they are lifted)')
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help='also report peak Python heap via tracemalloc (slows the run down)')
+    parser.add_argument('--drain-timeout', type=float, default=300, help='seconds to wait for background work to finish')
+    parser.add_argument('--baseline', help='baseline file (default: benchmarks/baselines/webhook_load-<backend>.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='allowed regression vs the baseline (default 0.15)')
+    return parser.parse_args(argv)
+
+def configure_environment(args, work_dir, twilio, smtp):
+    """Must run before the app is imported: app.py reads its config at import time"""
+    database_url = args.database_url or f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+    os.environ['DATABASE_URL'] = database_url
+    os.environ['TWILIO_ACCOUNT_SID'] = 'AC' + '0' * 32
+    os.environ['TWILIO_AUTH_TOKEN'] = TWILIO_AUTH_TOKEN
+    os.environ['SMTP_SERVER'] = '127.0.0.1'
+    os.environ['SMTP_PORT'] = str(smtp.port)
+    os.environ['SMTP_USERNAME'] = 'benchmark'
+    os.environ['SMTP_PASSWORD'] = 'benchmark'
+    os.environ['FROM_EMAIL'] = 'benchmark@example.com'
+    os.environ.pop('TWILIO_STATUS_CALLBACK_URL', None)
+    if not args.keep_rate_limits:
+        for channel in ('WHATSAPP', 'SMS', 'EMAIL'):
+            os.environ[f'{channel}_RATE_LIMIT'] = '1000000'
+    return database_url
+
+def route_twilio_to(url):
+    """Point the app's Twilio clients at the stub instead of api.twilio.com"""
+    from delivery import TwilioTransport
+    create_client = TwilioTransport._get_client
+
+    def _get_client(transport):
+        client = create_client(transport)
+        client.api.base_url = url.rstrip('/')
+        return client
+
+    TwilioTransport._get_client = _get_client
+
+def backend_name(database_url):
+    return database_url.split(':', 1)[0].split('+', 1)[0]
+
+def create_internship(app, db):
+    from models import Admin, Internship, SystemSettings
+    from datetime import datetime, timedelta
+
+    with app.app_context():
+        configured = [key for key in PROVIDER_SETTINGS if SystemSettings.get_setting(key)]
+        if configured:
+            raise SystemExit(
+                f"Refusing to run: this database has provider settings configured ({', '.join(configured)}), "
+                "so messages could reach real recipients. Use a dedicated benchmark database."
+            )
+        run_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+        internship = Internship(
+            title=f'Benchmark {run_code}',
+            description='Load test position',
+            requirements='None',
+            position_code=f'B{run_code}',
+            secret_code=f'S{run_code}',
+            deadline=datetime.utcnow() + timedelta(days=7),
+            created_by=Admin.query.first().id,
+        )
+        db.session.add(internship)
+        db.session.commit()
+        return internship.id, internship.position_code, internship.secret_code
+
+class Conversations:
+    """Drives applicants through the WhatsApp flow over HTTP"""
+
+    def __init__(self, base_url, media, position_code, secret_code, think_time):
+        self.webhook_url = f'{base_url}/webhook/whatsapp'
+        self.media = media
+        self.position_code = position_code
+        self.secret_code = secret_code
+        self.think_time = think_time
+        self.prefix = f'+26377{random.randint(10, 99)}'
+        self.latencies = []
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _session(self):
+        import requests
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def phone(self, index):
+        return f'{self.prefix}{index:05d}'
+
+    def _post(self, data):
+        started = time.perf_counter()
+        try:
+            response = self._session().post(self.webhook_url, data=data, timeout=60)
+            ok = response.status_code < 400
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.latencies.append(elapsed)
+            if not ok:
+                self.errors += 1
+
+    def run(self, index):
+        sender = f'whatsapp:{self.phone(index)}'
+        texts = [
+            f'APPLY {self.position_code} {self.secret_code}',
+            f'Benchmark Applicant {index}',
+            f'applicant{index}@example.com',
+        ]
+        for step, text in enumerate(texts):
+            self._post({'From': sender, 'Body': text, 'NumMedia': '0', 'MessageSid': f'SMbench{index}x{step}'})
+            if self.think_time:
+                time.sleep(self.think_time)
+        self._post({
+            'From': sender,
+            'NumMedia': '1',
+            'MediaUrl0': self.media.media_url(f'cv-{index}'),
+            'MediaContentType0': 'application/pdf',
+            'MessageSid': f'SMbench{index}xcv',
+        })
+
+def background_idle(app, db, internship_id, expected, since, twilio):
+    """True once every conversation is complete and nothing is left to send or record"""
+    from models import Application, OutboxMessage
+    from pipeline import stage_stats
+    from delivery_status import batcher
+
+    with app.app_context():
+        completed = Application.query.filter_by(internship_id=internship_id, conversation_state='completed').count()
+        outstanding = OutboxMessage.query.filter(
+            OutboxMessage.created_at >= since,
+            OutboxMessage.status.in_(['pending', 'sending'])
+        ).count()
+        db.session.remove()
+    stages_busy = any(stats['queued'] or stats['in_flight'] for stats in stage_stats().values())
+    callbacks_done = (not twilio.send_status_callbacks or
+                      twilio.callbacks_sent + twilio.callback_errors >= 2 * twilio.requests)
+    return (completed >= expected and not outstanding and not stages_busy
+            and callbacks_done and batcher.pending_count() == 0)
+
+def wait_until_idle(app, db, internship_id, expected, since, twilio, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if background_idle(app, db, internship_id, expected, since, twilio):
+            return True
+        time.sleep(0.1)
+    return False
+
+def count_completed(app, db, internship_id):
+    from models import Application
+    with app.app_context():
+        count = Application.query.filter_by(internship_id=internship_id, conversation_state='completed').count()
+        db.session.remove()
+    return count
+
+def main(argv=None):
+    args = parse_args(argv)
+    work_dir = tempfile.mkdtemp(prefix='bench-webhook-')
+    media = MediaServer(latency=args.media_latency).start()
+    twilio = TwilioStub(latency=args.twilio_latency, send_status_callbacks=not args.no_status_callbacks,
+                        auth_token=TWILIO_AUTH_TOKEN).start()
+    smtp = SMTPStub(latency=args.smtp_latency).start()
+    server = None
+    try:
+        database_url = configure_environment(args, work_dir, twilio, smtp)
+        backend = backend_name(database_url)
+
+        import main as _routes  # noqa: F401  (registers routes)
+        route_twilio_to(twilio.url)
+        from app import app, db
+        from schema import init_db
+        from werkzeug.serving import make_server
+        from datetime import datetime
+
+        logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        app.config['UPLOAD_FOLDER'] = os.path.join(work_dir, 'uploads')
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+        with app.app_context():
+            init_db()
+        internship_id, position_code, secret_code = create_internship(app, db)
+
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, name='bench-http', daemon=True).start()
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        if not args.no_status_callbacks:
+            os.environ['TWILIO_STATUS_CALLBACK_URL'] = f'{base_url}/webhook/whatsapp/status'
+
+        counter = StatementCounter().install()
+        counter.ignore_current_thread()
+        conversations = Conversations(base_url, media, position_code, secret_code, args.think_time)
+
+        # Warm up connections, transports and the SMTP pool outside the measurement
+        started_at = datetime.utcnow()
+        conversations.run(99999)
+        if not wait_until_idle(app, db, internship_id, 1, started_at, twilio, args.drain_timeout):
+            raise SystemExit('Warm-up conversation did not complete; check the application logs')
+        conversations.latencies.clear()
+        counter.reset()
+        sends_before = twilio.requests + smtp.messages
+        rss_before = peak_rss_mb()
+        if args.tracemalloc:
+            tracemalloc.start()
+
+        load_started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(conversations.run, range(args.applicants)))
+        load_seconds = time.perf_counter() - load_started
+
+        idle = wait_until_idle(app, db, internship_id, args.applicants + 1, started_at, twilio, args.drain_timeout)
+        total_seconds = time.perf_counter() - load_started
+        heap_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+        if args.tracemalloc:
+            tracemalloc.stop()
+        completed = count_completed(app, db, internship_id) - 1
+
+        webhook = latency_summary(conversations.latencies)
+        webhook_statements = counter.by_route.get('/webhook/whatsapp', 0)
+        callback_statements = counter.by_route.get('/webhook/whatsapp/status', 0)
+        sends = twilio.requests + smtp.messages - sends_before
+        metrics = {
+            'webhook_p50_ms': webhook['p50_ms'],
+            'webhook_p95_ms': webhook['p95_ms'],
+            'webhook_p99_ms': webhook['p99_ms'],
+            'webhook_max_ms': webhook['max_ms'],
+            'webhook_errors': conversations.errors,
+            'messages_per_sec': round(webhook['count'] / load_seconds, 1),
+            'conversations_per_sec': round(completed / total_seconds, 1),
+            'outbound_sends_per_sec': round(sends / total_seconds, 1),
+            'db_statements_per_conversation': round(counter.total / max(args.applicants, 1), 1),
+            'db_statements_per_webhook': round(webhook_statements / max(webhook['count'], 1), 1),
+            'db_statements_per_status_callback': round(callback_statements / max(twilio.callbacks_sent, 1), 2),
+            'peak_rss_mb': peak_rss_mb(),
+            'rss_growth_mb': round(peak_rss_mb() - rss_before, 1),
+        }
+        if heap_peak is not None:
+            metrics['python_heap_peak_mb'] = round(heap_peak / (1024 * 1024), 1)
+
+        result = {
+            'benchmark': BENCHMARK,
+            'backend': backend,
+            'params': {
+                'applicants': args.applicants,
+                'concurrency': args.concurrency,
+                'think_time': args.think_time,
+                'twilio_latency': args.twilio_latency,
+                'media_latency': args.media_latency,
+                'smtp_latency': args.smtp_latency,
+                'status_callbacks': not args.no_status_callbacks,
+                'rate_limits': args.keep_rate_limits,
+                # tracemalloc slows everything down, so those runs only compare with each other
+                'tracemalloc': args.tracemalloc,
+            },
+            'metrics': metrics,
+        }
+
+        print_table(f'WhatsApp webhook load ({backend}, {args.applicants} applicants x {args.concurrency} concurrent)', [
+            ('webhook requests', f"{webhook['count']} ({conversations.errors} errors)"),
+            ('latency p50/p95/p99', f"{webhook['p50_ms']} / {webhook['p95_ms']} / {webhook['p99_ms']} ms"),
+            ('latency max/mean', f"{webhook['max_ms']} / {webhook['mean_ms']} ms"),
+            ('inbound messages/sec', metrics['messages_per_sec']),
+            ('completed conversations', f'{completed}/{args.applicants} in {total_seconds:.1f}s'),
+            ('outbound sends/sec', f"{metrics['outbound_sends_per_sec']} ({twilio.requests} Twilio, {smtp.messages} SMTP over {smtp.sessions} sessions)"),
+            ('DB statements/conversation', metrics['db_statements_per_conversation']),
+            ('DB statements/webhook', metrics['db_statements_per_webhook']),
+            ('DB statements/status callback', metrics['db_statements_per_status_callback']),
+            ('peak RSS', f"{metrics['peak_rss_mb']} MB (+{metrics['rss_growth_mb']} MB during the run)"),
+        ] + ([('Python heap peak', f"{metrics['python_heap_peak_mb']} MB")] if heap_peak is not None else []))
+
+        failed = False
+        if not idle or completed < args.applicants or conversations.errors:
+            print(f'\nIncomplete run: {completed}/{args.applicants} conversations completed, '
+                  f'{conversations.errors} webhook errors, background idle: {idle}')
+            failed = True
+
+        path = args.baseline or baseline_path(BENCHMARK, backend)
+        if args.save_baseline:
+            save_baseline(path, result)
+            print(f'\nSaved baseline to {path}')
+        else:
+            baseline = load_baseline(path)
+            if baseline is None:
+                print(f'\nNo baseline at {path}; run with --save-baseline to record one')
+            elif baseline.get('params') != result['params']:
+                print(f'\nBaseline {path} was recorded with different parameters; not comparing')
+            else:
+                regressions = compare_to_baseline(metrics, baseline['metrics'], REGRESSION_CHECKS, args.tolerance)
+                if regressions:
+                    print(f'\nRegressions vs baseline ({args.tolerance:.0%} tolerance):')
+                    for line in regressions:
+                        print(f'  {line}')
+                    failed = True
+                else:
+                    print(f'\nNo regressions vs baseline recorded {baseline.get("recorded_at")}')
+        return 1 if failed else 0
+    finally:
+        if server is not None:
+            server.shutdown()
+        for stub in (media, twilio, smtp):
+            stub.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    sys.exit(main())
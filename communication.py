@@ -1,26 +1,66 @@
 import os
 import logging
-import requests
 from datetime import datetime
 from app import db
 from models import NotificationLog, SystemSettings
-import smtplib
+from smtp_pool import get_smtp_pool
+from delivery import Delivery, Route, TwilioTransport, SMTPTransport, get_engine
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
 logger = logging.getLogger(__name__)
 
+def status_callback_url():
+    """Public URL Twilio should post delivery status updates to, if configured"""
+    return SystemSettings.get_setting('twilio_status_callback_url') or os.environ.get('TWILIO_STATUS_CALLBACK_URL')
+
+def whatsapp_transport():
+    """Async Twilio transport for WhatsApp, or None when credentials are missing"""
+    # Force use environment variables directly
+    account_sid = os.environ.get('TWILIO_ACCOUNT_SID')
+    auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
+    if not account_sid or not auth_token:
+        return None
+    
+    # Use live WhatsApp number or fallback to sandbox
+    live_number = SystemSettings.get_setting('twilio_whatsapp_number', '+14155238886')
+    callback_url = status_callback_url()
+    return get_engine().transport(
+        ('whatsapp', account_sid, auth_token, live_number, callback_url),
+        lambda: TwilioTransport(account_sid, auth_token, live_number, address_prefix='whatsapp:',
+                                status_callback=callback_url)
+    )
+
+def sms_transport():
+    """Async Twilio transport for SMS, or None when credentials are missing"""
+    # Get credentials from system settings first, fallback to environment variables
+    account_sid = SystemSettings.get_setting('twilio_account_sid') or os.environ.get('TWILIO_ACCOUNT_SID')
+    auth_token = SystemSettings.get_setting('twilio_auth_token') or os.environ.get('TWILIO_AUTH_TOKEN')
+    from_number = SystemSettings.get_setting('twilio_phone_number') or os.environ.get('TWILIO_PHONE_NUMBER')
+    if not account_sid or not auth_token or not from_number:
+        return None
+    callback_url = status_callback_url()
+    return get_engine().transport(
+        ('sms', account_sid, auth_token, from_number, callback_url),
+        lambda: TwilioTransport(account_sid, auth_token, from_number, status_callback=callback_url)
+    )
+
+def email_transport():
+    """SMTP transport over the pooled connections, or None when credentials are missing"""
+    smtp = get_smtp_settings()
+    if not smtp['username'] or not smtp['password']:
+        return None
+    return get_engine().transport(
+        ('email', smtp['server'], smtp['port'], smtp['username'], smtp['password'], smtp['from_email']),
+        lambda: SMTPTransport(get_mailer(smtp), smtp['from_email'])
+    )
+
 def send_whatsapp_message(to_number, message, application_id=None):
     """Send WhatsApp message using Twilio WhatsApp API"""
     try:
-        import os
-        from twilio.rest import Client
-        
-        # Force use environment variables directly
-        account_sid = os.environ.get('TWILIO_ACCOUNT_SID')
-        auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
+        transport = whatsapp_transport()
         
-        if not account_sid or not auth_token:
+        if not transport:
             logger.error("Twilio credentials not found in environment")
             logger.info(f"WhatsApp message (would send to {to_number}): {message}")
             log_notification(
@@ -33,28 +73,19 @@ def send_whatsapp_message(to_number, message, application_id=None):
             )
             return False
         
-        # Use live WhatsApp number or fallback to sandbox
-        live_number = SystemSettings.get_setting('twilio_whatsapp_number', '+14155238886')
-        from_number = f"whatsapp:{live_number}" 
-        to_whatsapp = f"whatsapp:{to_number}"
-        
-        client = Client(account_sid, auth_token)
-        
-        message_obj = client.messages.create(
-            body=message,
-            from_=from_number,
-            to=to_whatsapp
-        )
+        result = get_engine().send(Delivery(
+            message,
+            [Route('whatsapp', to_number, transport)],
+            application_id=application_id
+        ))
+        log_delivery_result(result)
         
-        logger.info(f"WhatsApp message sent successfully to {to_number}, SID: {message_obj.sid}")
-        log_notification(
-            application_id=application_id,
-            channel='whatsapp',
-            recipient=to_number,
-            message=message,
-            status='sent'
-        )
-        return True
+        if result.success:
+            logger.info(f"WhatsApp message sent successfully to {to_number}, SID: {result.provider_sid}")
+        else:
+            # For debugging, log what message would be sent
+            logger.info(f"WhatsApp message (failed to send to {to_number}): {message}")
+        return result.success
             
     except Exception as e:
         logger.error(f"Error sending WhatsApp message via Twilio: {e}")
@@ -70,91 +101,119 @@ def send_whatsapp_message(to_number, message, application_id=None):
         )
         return False
 
+def get_smtp_settings():
+    """Resolve SMTP settings from system settings, falling back to environment variables"""
+    smtp_username = SystemSettings.get_setting('smtp_username') or os.environ.get('SMTP_USERNAME')
+    return {
+        'server': SystemSettings.get_setting('smtp_server') or os.environ.get('SMTP_SERVER', 'smtp.gmail.com'),
+        'port': int(SystemSettings.get_setting('smtp_port') or os.environ.get('SMTP_PORT', '587')),
+        'username': smtp_username,
+        'password': SystemSettings.get_setting('smtp_password') or os.environ.get('SMTP_PASSWORD'),
+        'from_email': SystemSettings.get_setting('from_email') or os.environ.get('FROM_EMAIL', smtp_username),
+    }
+
+def build_email(from_email, to_email, subject, message):
+    msg = MIMEMultipart()
+    msg['From'] = from_email
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(message, 'plain'))
+    return msg
+
+def get_mailer(smtp):
+    """Shared connection pool for the configured SMTP account"""
+    return get_smtp_pool(smtp['server'], smtp['port'], smtp['username'], smtp['password'])
+
 def send_email(to_email, subject, message, application_id=None):
     """Send email using SMTP"""
     try:
-        # Get credentials from system settings first, fallback to environment variables
-        smtp_server = SystemSettings.get_setting('smtp_server') or os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
-        smtp_port = int(SystemSettings.get_setting('smtp_port') or os.environ.get('SMTP_PORT', '587'))
-        smtp_username = SystemSettings.get_setting('smtp_username') or os.environ.get('SMTP_USERNAME')
-        smtp_password = SystemSettings.get_setting('smtp_password') or os.environ.get('SMTP_PASSWORD')
-        from_email = SystemSettings.get_setting('from_email') or os.environ.get('FROM_EMAIL', smtp_username)
+        transport = email_transport()
         
-        if not smtp_username or not smtp_password:
+        if not transport:
             logger.error("Email credentials not configured in system settings")
             return False
         
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = from_email
-        msg['To'] = to_email
-        msg['Subject'] = subject
+        # Sent over a pooled, already-authenticated connection
+        result = get_engine().send(Delivery(
+            message,
+            [Route('email', to_email, transport)],
+            subject=subject,
+            application_id=application_id
+        ))
+        log_delivery_result(result)
         
-        msg.attach(MIMEText(message, 'plain'))
+        if result.success:
+            logger.info(f"Email sent to {to_email}")
+        return result.success
         
-        # Send email
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(smtp_username, smtp_password)
-            server.send_message(msg)
-        
-        # Log the notification
+    except Exception as e:
+        logger.error(f"Error sending email: {e}")
         log_notification(
             application_id=application_id,
             channel='email',
             recipient=to_email,
             message=message,
-            status='sent'
+            status='failed',
+            error_message=str(e)
         )
-        
-        logger.info(f"Email sent to {to_email}")
-        return True
-        
+        return False
+
+def send_emails(emails):
+    """Send many emails over shared SMTP connections.
+
+    `emails` is a list of (to_email, subject, message, application_id) tuples.
+    Returns the number of emails sent.
+    """
+    smtp = get_smtp_settings()
+    if not smtp['username'] or not smtp['password']:
+        logger.error("Email credentials not configured in system settings")
+        return 0
+    
+    messages = [build_email(smtp['from_email'], to_email, subject, message)
+                for to_email, subject, message, _ in emails]
+    try:
+        results = get_mailer(smtp).send_many(messages)
     except Exception as e:
-        logger.error(f"Error sending email: {e}")
+        # Could not even open a connection
+        results = [(msg, e) for msg in messages]
+    
+    sent = 0
+    for (to_email, subject, message, application_id), (_, error) in zip(emails, results):
         log_notification(
             application_id=application_id,
             channel='email',
             recipient=to_email,
             message=message,
-            status='failed',
-            error_message=str(e)
+            status='failed' if error else 'sent',
+            error_message=str(error) if error else None
         )
-        return False
+        if error:
+            logger.error(f"Error sending email to {to_email}: {error}")
+        else:
+            sent += 1
+    
+    logger.info(f"Sent {sent}/{len(emails)} emails")
+    return sent
 
 def send_sms(to_number, message, application_id=None):
     """Send SMS using Twilio"""
     try:
-        from twilio.rest import Client
-        
-        # Get credentials from system settings first, fallback to environment variables
-        account_sid = SystemSettings.get_setting('twilio_account_sid') or os.environ.get('TWILIO_ACCOUNT_SID')
-        auth_token = SystemSettings.get_setting('twilio_auth_token') or os.environ.get('TWILIO_AUTH_TOKEN')
-        from_number = SystemSettings.get_setting('twilio_phone_number') or os.environ.get('TWILIO_PHONE_NUMBER')
+        transport = sms_transport()
         
-        if not account_sid or not auth_token or not from_number:
+        if not transport:
             logger.error("Twilio credentials not configured in system settings")
             return False
         
-        client = Client(account_sid, auth_token)
-        
-        sms_message = client.messages.create(
-            body=message,
-            from_=from_number,
-            to=to_number
-        )
-        
-        # Log the notification
-        log_notification(
-            application_id=application_id,
-            channel='sms',
-            recipient=to_number,
-            message=message,
-            status='sent'
-        )
+        result = get_engine().send(Delivery(
+            message,
+            [Route('sms', to_number, transport)],
+            application_id=application_id
+        ))
+        log_delivery_result(result)
         
-        logger.info(f"SMS sent to {to_number}, SID: {sms_message.sid}")
-        return True
+        if result.success:
+            logger.info(f"SMS sent to {to_number}, SID: {result.provider_sid}")
+        return result.success
         
     except Exception as e:
         logger.error(f"Error sending SMS: {e}")
@@ -168,48 +227,76 @@ def send_sms(to_number, message, application_id=None):
         )
         return False
 
+def notification_routes(application, channels):
+    """Fallback chain of routes for an application, in channel preference order"""
+    transports = {
+        'whatsapp': whatsapp_transport,
+        'email': email_transport,
+        'sms': sms_transport,
+    }
+    addresses = {
+        'whatsapp': application.whatsapp_number,
+        'email': application.email,
+        'sms': application.phone_number,
+    }
+    routes = []
+    for channel in channels:
+        if channel not in transports or not addresses[channel]:
+            continue
+        transport = transports[channel]()
+        if transport:
+            routes.append(Route(channel, addresses[channel], transport))
+    return routes
+
 def send_bulk_notification(applications, message, channels=['whatsapp']):
-    """Send bulk notifications to multiple applications"""
+    """Send bulk notifications to multiple applications.
+    
+    All recipients are sent concurrently by the delivery engine; for each one
+    the channels are tried in order until one succeeds.
+    """
     results = {'sent': 0, 'failed': 0}
     
+    deliveries = []
     for application in applications:
-        success = False
-        
-        for channel in channels:
-            try:
-                if channel == 'whatsapp' and application.whatsapp_number:
-                    success = send_whatsapp_message(
-                        application.whatsapp_number, 
-                        message, 
-                        application.id
-                    )
-                elif channel == 'email' and application.email:
-                    success = send_email(
-                        application.email,
-                        f"Update: {application.internship.title}",
-                        message,
-                        application.id
-                    )
-                elif channel == 'sms' and application.phone_number:
-                    success = send_sms(
-                        application.phone_number, 
-                        message, 
-                        application.id
-                    )
-                
-                if success:
-                    results['sent'] += 1
-                    break  # Success on one channel, don't try others
-                    
-            except Exception as e:
-                logger.error(f"Error sending {channel} notification to application {application.id}: {e}")
-        
-        if not success:
+        routes = notification_routes(application, channels)
+        if not routes:
+            logger.error(f"No configured channel can reach application {application.id}")
             results['failed'] += 1
+            continue
+        subject = f"Update: {application.internship.title}" if 'email' in channels else None
+        deliveries.append(Delivery(message, routes, subject=subject, application_id=application.id))
+    
+    for result in get_engine().send_many(deliveries):
+        log_delivery_result(result, commit=False)
+        if result.success:
+            results['sent'] += 1
+        else:
+            results['failed'] += 1
+    
+    try:
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"Error logging notifications: {e}")
+        db.session.rollback()
     
     return results
 
-def log_notification(application_id, channel, recipient, message, status, error_message=None):
+def log_delivery_result(result, commit=True):
+    """Record every route the engine tried for a delivery"""
+    delivery = result.delivery
+    for route, error in result.attempts:
+        log_notification(
+            application_id=delivery.application_id,
+            channel=route.channel,
+            recipient=route.recipient,
+            message=delivery.message,
+            status='failed' if error else 'sent',
+            error_message=str(error) if error else None,
+            commit=commit,
+            provider_sid=None if error else result.provider_sid
+        )
+
+def log_notification(application_id, channel, recipient, message, status, error_message=None, commit=True, provider_sid=None):
     """Log notification attempt to database"""
     try:
         notification_log = NotificationLog(
@@ -219,11 +306,13 @@ def log_notification(application_id, channel, recipient, message, status, error_
             message=message,
             status=status,
             sent_at=datetime.utcnow() if status == 'sent' else None,
-            error_message=error_message
+            error_message=error_message,
+            provider_sid=provider_sid
         )
         
         db.session.add(notification_log)
-        db.session.commit()
+        if commit:
+            db.session.commit()
         
     except Exception as e:
         logger.error(f"Error logging notification: {e}")
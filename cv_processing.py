@@ -0,0 +1,254 @@
+# CV validation and normalization. Parsing a PDF is CPU-bound, so it runs in
+# a small pool of separate processes rather than on request threads; the CV
+# fetcher hands each stored file over and waits for the verdict. The pool
+# starts its processes with spawn and each one imports this module, so only
+# the standard library is imported here.
+import os
+import re
+import zlib
+import shutil
+import hashlib
+import logging
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import cv_text
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.environ.get('CV_PROCESS_WORKERS', '2'))
+MAX_BYTES = int(os.environ.get('CV_MAX_BYTES', str(10 * 1024 * 1024)))
+MAX_PAGES = int(os.environ.get('CV_MAX_PAGES', '30'))
+# Files above this size are rewritten (attachments dropped, streams
+# recompressed) when qpdf is available
+NORMALIZE_BYTES = int(os.environ.get('CV_NORMALIZE_BYTES', str(2 * 1024 * 1024)))
+# Linearized ("fast web view") files start rendering before they are fully downloaded
+LINEARIZE = os.environ.get('CV_LINEARIZE', '0') == '1'
+TIMEOUT = float(os.environ.get('CV_PROCESS_TIMEOUT', '60'))
+# Enough for any CV; keeps one odd file from bloating the row
+TEXT_LIMIT = 100_000
+
+STATUS_OK = 'ok'
+STATUS_NORMALIZED = 'normalized'
+# The applicant is asked to send the CV again
+REJECTED_STATUSES = ('invalid', 'encrypted', 'too_large', 'too_many_pages')
+
+PAGE_PATTERN = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+OBJECT_PATTERN = re.compile(rb'(\d+)\s+\d+\s+obj\b')
+ENCRYPT_PATTERN = re.compile(rb'/Encrypt\s*(?:\d+\s+\d+\s+R|<<)')
+STREAM_PATTERN = re.compile(rb'stream\r?\n')
+
+class InvalidPdf(Exception):
+    pass
+
+def _object_streams(data):
+    """(count, first offset, decompressed body) of each compressed object stream (PDF 1.5+)"""
+    for match in re.finditer(rb'/Type\s*/ObjStm', data):
+        start = STREAM_PATTERN.search(data, match.end())
+        if start is None:
+            continue
+        header = data[data.rfind(b'obj', 0, match.start()):start.start()]
+        count = re.search(rb'/N\s+(\d+)', header)
+        first = re.search(rb'/First\s+(\d+)', header)
+        if b'/FlateDecode' not in header or not count or not first:
+            continue
+        end = data.find(b'endstream', start.end())
+        try:
+            body = zlib.decompressobj().decompress(data[start.end():end if end != -1 else None])
+        except zlib.error:
+            continue
+        yield int(count.group(1)), int(first.group(1)), body
+
+def _page_objects(body):
+    """Object numbers in `body` whose dictionary is a page"""
+    pages = set()
+    matches = list(OBJECT_PATTERN.finditer(body))
+    for index, match in enumerate(matches):
+        end = matches[index + 1].start() if index + 1 < len(matches) else len(body)
+        # Only the dictionary, not the stream data after it
+        header = body[match.end():end].split(b'stream', 1)[0]
+        if PAGE_PATTERN.search(header):
+            pages.add(int(match.group(1)))
+    return pages
+
+def _object_stream_pages(count, first, body):
+    """Page objects inside an object stream: `count` number/offset pairs, then the objects from `first`"""
+    pages = set()
+    numbers = [int(value) for value in body[:first].split()[:2 * count]]
+    entries = list(zip(numbers[::2], numbers[1::2]))
+    for index, (number, offset) in enumerate(entries):
+        end = first + entries[index + 1][1] if index + 1 < len(entries) else len(body)
+        if PAGE_PATTERN.search(body[first + offset:end]):
+            pages.add(number)
+    return pages
+
+def inspect_pdf(data):
+    """Page count and encryption of a PDF, without third-party libraries.
+
+    This is a structural scan rather than a full parse: it checks the
+    header and trailer and counts page objects, including those packed into
+    compressed object streams. Raises InvalidPdf for anything that isn't one.
+    Any encryption counts: telling an empty user password apart would need
+    the decryption itself.
+    """
+    if b'%PDF-' not in data[:1024]:
+        raise InvalidPdf('missing %PDF header')
+    if b'%%EOF' not in data[-2048:]:
+        raise InvalidPdf('truncated (no %%EOF marker)')
+    encrypted = bool(ENCRYPT_PATTERN.search(data))
+    pages = _page_objects(data)
+    for count, first, body in _object_streams(data):
+        pages |= _object_stream_pages(count, first, body)
+    if not pages and not encrypted:
+        raise InvalidPdf('no pages found')
+    return {'pages': len(pages), 'encrypted': encrypted}
+
+def extract_text(path, data=None):
+    """CV text for relevance ranking, capped at TEXT_LIMIT characters"""
+    if shutil.which('pdftotext'):
+        completed = subprocess.run(['pdftotext', '-q', '-enc', 'UTF-8', '-l', str(MAX_PAGES), path, '-'],
+                                   capture_output=True, timeout=TIMEOUT)
+        if completed.returncode == 0:
+            return completed.stdout.decode('utf-8', 'replace')[:TEXT_LIMIT]
+    if data is None:
+        with open(path, 'rb') as f:
+            data = f.read()
+    return cv_text.extract_text(data)[:TEXT_LIMIT]
+
+def _qpdf(*args):
+    """Run qpdf; exit status 3 means it succeeded with warnings"""
+    completed = subprocess.run(['qpdf', *args], capture_output=True, text=True, timeout=TIMEOUT)
+    return completed.returncode, completed.stdout.strip()
+
+def _inspect_with_qpdf(path):
+    code, _ = _qpdf('--requires-password', path)
+    # 0: needs a password, 3: encrypted but opens without one, 2: not encrypted
+    if code == 0:
+        return {'pages': 0, 'encrypted': True}
+    code, output = _qpdf('--show-npages', path)
+    if code not in (0, 3) or not output.isdigit():
+        raise InvalidPdf('qpdf could not read it')
+    return {'pages': int(output), 'encrypted': False}
+
+def _attachments(path):
+    code, output = _qpdf('--list-attachments', path)
+    if code not in (0, 3):
+        return []
+    return [line.split(' -> ', 1)[0].strip() for line in output.splitlines() if ' -> ' in line]
+
+def normalize(path):
+    """Rewrite the PDF with qpdf: attachments dropped, streams recompressed,
+    optionally linearized. Returns True when the file was replaced.
+    """
+    attachments = _attachments(path)
+    if not attachments and not LINEARIZE and os.path.getsize(path) <= NORMALIZE_BYTES:
+        return False
+    rewritten = f'{path}.normalized'
+    args = [path, rewritten, '--compress-streams=y', '--object-streams=generate',
+            '--remove-unreferenced-resources=yes']
+    args += [f'--remove-attachment={key}' for key in attachments]
+    if LINEARIZE:
+        args.append('--linearize')
+    code, _ = _qpdf(*args)
+    if code not in (0, 3):
+        logger.warning(f"qpdf could not normalize {path}; keeping the original")
+        if os.path.exists(rewritten):
+            os.remove(rewritten)
+        return False
+    os.replace(rewritten, path)
+    return True
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def process_cv_file(path):
+    """Validate and normalize a stored CV; runs in a pool process.
+
+    Returns a dict with status, pages, size, sha256, text and, when
+    rejected, reason.
+    """
+    size = os.path.getsize(path)
+    result = {'status': STATUS_OK, 'pages': None, 'size': size, 'sha256': None, 'text': None, 'reason': None}
+    if size > MAX_BYTES:
+        return dict(result, status='too_large', reason=f'{size} bytes')
+
+    has_qpdf = shutil.which('qpdf') is not None
+    try:
+        if has_qpdf:
+            info = _inspect_with_qpdf(path)
+        else:
+            with open(path, 'rb') as f:
+                info = inspect_pdf(f.read())
+    except InvalidPdf as e:
+        return dict(result, status='invalid', reason=str(e))
+    result['pages'] = info['pages']
+    if info['encrypted']:
+        return dict(result, status='encrypted', reason='password protected')
+    if info['pages'] > MAX_PAGES:
+        return dict(result, status='too_many_pages', reason=f"{info['pages']} pages")
+
+    if has_qpdf and normalize(path):
+        result['status'] = STATUS_NORMALIZED
+        result['size'] = os.path.getsize(path)
+    result['sha256'] = _sha256(path)
+    result['text'] = extract_text(path)
+    return result
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    # Started on first use so importing the app stays cheap; spawn because
+    # forking a threaded worker isn't safe
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+def _discard_executor(executor, kill=False):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    if kill:
+        # A job past its timeout keeps running otherwise; other jobs still in
+        # this pool fail with BrokenProcessPool and are retried by their stage.
+        # _processes is private to ProcessPoolExecutor, so don't count on it
+        processes = getattr(executor, '_processes', None) or {}
+        if not processes:
+            logger.warning("Could not find the CV processing pool's processes; the timed-out job may keep running")
+        for process in list(processes.values()):
+            process.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def run_in_pool(func, *args, timeout=TIMEOUT):
+    """Run a top-level function of a stdlib-only module in the pool and wait for its result.
+
+    Raises on timeouts and crashed pool processes so the calling stage can
+    retry; the pool is replaced for the next call, and on a timeout its
+    processes are stopped so the runaway job doesn't hold a worker.
+    """
+    executor = _get_executor()
+    future = executor.submit(func, *args)
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        if not future.cancel():
+            logger.error(f"{func.__name__} timed out after {timeout}s; replacing the CV processing pool")
+            _discard_executor(executor, kill=True)
+        raise
+    except BrokenProcessPool:
+        logger.error("CV processing pool crashed; starting a new one")
+        _discard_executor(executor)
+        raise
+
+def process_cv(path, timeout=TIMEOUT):
+    """Check a stored CV in the pool (see process_cv_file)"""
+    return run_in_pool(process_cv_file, path, timeout=timeout)
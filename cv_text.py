@@ -0,0 +1,223 @@
+# Plain-text extraction from PDF CVs with the standard library, used for
+# relevance ranking when poppler's pdftotext isn't installed. It reads the
+# text-showing operators of each page's content streams and decodes them
+# through the fonts' ToUnicode maps, which covers the composite (CID) fonts
+# word processors embed. Layout is not reconstructed: ranking only needs the
+# words. Runs in the CV processing pool, so only the standard library is
+# imported here.
+import re
+import zlib
+
+OBJECT_PATTERN = re.compile(rb'(\d+)\s+\d+\s+obj\b')
+STREAM_PATTERN = re.compile(rb'stream\r?\n')
+LENGTH_PATTERN = re.compile(rb'/Length\s+(\d+)(?!\s+\d+\s+R)')
+REFERENCE_PATTERN = re.compile(rb'(\d+)\s+\d+\s+R')
+PAGE_PATTERN = re.compile(rb'/Type\s*/Page(?![A-Za-z])')
+CONTENT_TOKEN_PATTERN = re.compile(
+    rb'\((?:\\.|[^\\)])*\)|<[0-9A-Fa-f\s]*>|\[|\]|/[^\s/\[\]()<>{}%]+|-?\d*\.?\d+|Tj|TJ|Tf|\'|"'
+)
+ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+# A TJ adjustment this far left (thousandths of an em) separates words
+WORD_GAP = -200
+MAX_PARENT_DEPTH = 10
+
+def decode_stream(header, raw):
+    if b'/FlateDecode' in header:
+        try:
+            return zlib.decompressobj().decompress(raw)
+        except zlib.error:
+            return None
+    return None if b'/Filter' in header else raw
+
+def parse_objects(data):
+    """{number: (dictionary, decoded stream or None)}, including objects packed
+    in object streams; later definitions (incremental updates) win.
+    """
+    objects = {}
+    for match in OBJECT_PATTERN.finditer(data):
+        end = data.find(b'endobj', match.end())
+        end = len(data) if end == -1 else end
+        stream = STREAM_PATTERN.search(data, match.end(), end)
+        if stream is None:
+            objects[int(match.group(1))] = (data[match.end():end], None)
+            continue
+        header = data[match.end():stream.start()]
+        length = LENGTH_PATTERN.search(header)
+        if length:
+            raw = data[stream.end():stream.end() + int(length.group(1))]
+        else:
+            stream_end = data.find(b'endstream', stream.end())
+            raw = data[stream.end():stream_end if stream_end != -1 else None]
+        objects[int(match.group(1))] = (header, decode_stream(header, raw))
+
+    for header, body in list(objects.values()):
+        if body is None or not re.search(rb'/Type\s*/ObjStm', header):
+            continue
+        count = re.search(rb'/N\s+(\d+)', header)
+        first = re.search(rb'/First\s+(\d+)', header)
+        if not count or not first:
+            continue
+        first = int(first.group(1))
+        numbers = [int(value) for value in body[:first].split()[:2 * int(count.group(1))]]
+        entries = list(zip(numbers[::2], numbers[1::2]))
+        for index, (number, offset) in enumerate(entries):
+            end = first + entries[index + 1][1] if index + 1 < len(entries) else len(body)
+            objects.setdefault(number, (body[first + offset:end], None))
+    return objects
+
+def _inline_dictionary(source, start):
+    """The balanced << ... >> starting at `start`"""
+    depth = 0
+    index = start
+    while index < len(source) - 1:
+        pair = source[index:index + 2]
+        if pair == b'<<':
+            depth += 1
+            index += 2
+        elif pair == b'>>':
+            depth -= 1
+            index += 2
+            if depth == 0:
+                return source[start:index]
+        else:
+            index += 1
+    return source[start:]
+
+def dictionary_value(objects, dictionary, key):
+    """The dictionary stored under `key`, inline or by reference, or b''"""
+    match = re.search(rb'/' + key + rb'\s*(<<|\d+\s+\d+\s+R)', dictionary)
+    if not match:
+        return b''
+    if match.group(1) == b'<<':
+        return _inline_dictionary(dictionary, match.start(1))
+    reference = int(REFERENCE_PATTERN.match(match.group(1)).group(1))
+    return objects.get(reference, (b'', None))[0]
+
+def _utf16(hex_digits):
+    if len(hex_digits) % 2:
+        hex_digits += b'0'
+    return bytes.fromhex(hex_digits.decode()).decode('utf-16-be', 'replace')
+
+def parse_cmap(cmap):
+    """(code width in bytes, {code: text}) from a ToUnicode CMap"""
+    mapping = {}
+    for block in re.findall(rb'beginbfchar(.*?)endbfchar', cmap, re.S):
+        for source, target in re.findall(rb'<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]*)>', block):
+            mapping[int(source, 16)] = _utf16(target)
+    for block in re.findall(rb'beginbfrange(.*?)endbfrange', cmap, re.S):
+        for low, high, target in re.findall(rb'<([0-9A-Fa-f]+)>\s*<([0-9A-Fa-f]+)>\s*(<[0-9A-Fa-f]*>|\[[^\]]*\])', block):
+            low, high = int(low, 16), int(high, 16)
+            if target.startswith(b'['):
+                for offset, item in enumerate(re.findall(rb'<([0-9A-Fa-f]*)>', target)):
+                    mapping[low + offset] = _utf16(item)
+                continue
+            digits = target[1:-1]
+            base = int(digits or b'0', 16)
+            for code in range(low, min(high, low + 0xFFFF) + 1):
+                mapping[code] = _utf16(f'{base + code - low:0{len(digits)}X}'.encode())
+    space = re.search(rb'begincodespacerange\s*<([0-9A-Fa-f]+)>', cmap)
+    width = len(space.group(1)) // 2 if space else 2
+    return max(width, 1), mapping
+
+def _literal_bytes(token):
+    out = bytearray()
+    body = token[1:-1]
+    index = 0
+    while index < len(body):
+        char = body[index:index + 1]
+        if char == b'\\' and index + 1 < len(body):
+            octal = re.match(rb'[0-7]{1,3}', body[index + 1:index + 4])
+            if octal:
+                out.append(int(octal.group(), 8) & 0xFF)
+                index += 1 + len(octal.group())
+                continue
+            following = body[index + 1:index + 2]
+            out += ESCAPES.get(following, following)
+            index += 2
+            continue
+        out += char
+        index += 1
+    return bytes(out)
+
+def _decode(raw, font):
+    if font is None:
+        return raw.decode('latin-1')
+    width, mapping = font
+    codes = (int.from_bytes(raw[index:index + width], 'big') for index in range(0, len(raw), width))
+    return ''.join(mapping.get(code, '') for code in codes)
+
+def content_text(content, fonts=None):
+    """Text shown by one page's content, decoded through `fonts` ({resource name: parsed CMap})"""
+    fonts = fonts or {}
+    font = None
+    name = None
+    in_array = False
+    parts = []
+    pending = []
+    for token in CONTENT_TOKEN_PATTERN.findall(content):
+        first = token[:1]
+        if first == b'(':
+            pending.append(_decode(_literal_bytes(token), font))
+        elif first == b'<':
+            digits = re.sub(rb'\s', b'', token[1:-1])
+            if len(digits) % 2:
+                digits += b'0'
+            pending.append(_decode(bytes.fromhex(digits.decode()), font))
+        elif token == b'[':
+            in_array = True
+        elif token == b']':
+            in_array = False
+        elif first == b'/':
+            name = token[1:]
+        elif token == b'Tf':
+            font = fonts.get(name)
+        elif token in (b'Tj', b'TJ', b"'", b'"'):
+            parts.append(''.join(pending))
+            pending = []
+        elif in_array and float(token) <= WORD_GAP:
+            pending.append(' ')
+    return ' '.join(part for part in parts if part.strip())
+
+def _page_fonts(objects, page, cmaps):
+    """{resource name: parsed CMap} for a page, following /Parent for inherited resources"""
+    dictionary = page
+    for _ in range(MAX_PARENT_DEPTH):
+        resources = dictionary_value(objects, dictionary, b'Resources')
+        if resources:
+            break
+        parent = re.search(rb'/Parent\s+(\d+)\s+\d+\s+R', dictionary)
+        if not parent:
+            return {}
+        dictionary = objects.get(int(parent.group(1)), (b'', None))[0]
+    fonts = {}
+    for name, reference in re.findall(rb'/([^\s/<>\[\]()]+)\s+(\d+)\s+\d+\s+R', dictionary_value(objects, resources, b'Font')):
+        reference = int(reference)
+        if reference not in cmaps:
+            cmaps[reference] = None
+            to_unicode = re.search(rb'/ToUnicode\s+(\d+)\s+\d+\s+R', objects.get(reference, (b'', None))[0])
+            if to_unicode:
+                cmap = objects.get(int(to_unicode.group(1)), (b'', None))[1]
+                if cmap:
+                    cmaps[reference] = parse_cmap(cmap)
+        if cmaps[reference]:
+            fonts[name] = cmaps[reference]
+    return fonts
+
+def extract_text(data):
+    """Text of every page, one page per line"""
+    objects = parse_objects(data)
+    cmaps = {}
+    pages = []
+    for number in sorted(objects):
+        header, _ = objects[number]
+        if not PAGE_PATTERN.search(header):
+            continue
+        contents = re.search(rb'/Contents\s*(\[[^\]]*\]|\d+\s+\d+\s+R)', header)
+        if not contents:
+            continue
+        content = b'\n'.join(
+            objects.get(int(reference), (b'', None))[1] or b''
+            for reference in REFERENCE_PATTERN.findall(contents.group(1))
+        )
+        pages.append(content_text(content, _page_fonts(objects, header, cmaps)))
+    return '\n'.join(page for page in pages if page)
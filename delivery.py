@@ -0,0 +1,238 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from metrics import OUTBOUND_LATENCY, timed
+
+logger = logging.getLogger(__name__)
+
+# Per-channel concurrency and rate limits (sends/second); override with e.g.
+# WHATSAPP_MAX_CONCURRENCY=100 or EMAIL_RATE_LIMIT=5
+DEFAULT_CHANNEL_LIMITS = {
+    'whatsapp': {'concurrency': 200, 'rate': 80},
+    'sms': {'concurrency': 100, 'rate': 30},
+    'email': {'concurrency': 4, 'rate': 10},
+}
+
+def channel_limits(channel):
+    limits = dict(DEFAULT_CHANNEL_LIMITS.get(channel, {'concurrency': 10, 'rate': 10}))
+    prefix = channel.upper()
+    if os.environ.get(f'{prefix}_MAX_CONCURRENCY'):
+        limits['concurrency'] = int(os.environ[f'{prefix}_MAX_CONCURRENCY'])
+    if os.environ.get(f'{prefix}_RATE_LIMIT'):
+        limits['rate'] = float(os.environ[f'{prefix}_RATE_LIMIT'])
+    return limits
+
+class Route:
+    """One way of reaching a recipient: a channel, an address and the transport to use"""
+
+    def __init__(self, channel, recipient, transport):
+        self.channel = channel
+        self.recipient = recipient
+        self.transport = transport
+
+class Delivery:
+    """An outbound message with its fallback chain of routes, tried in order"""
+
+    def __init__(self, message, routes, subject=None, application_id=None):
+        self.message = message
+        self.routes = routes
+        self.subject = subject
+        self.application_id = application_id
+
+class DeliveryResult:
+    def __init__(self, delivery):
+        self.delivery = delivery
+        self.success = False
+        self.channel = None
+        self.recipient = None
+        self.provider_sid = None
+        # (route, error) for every route tried; error is None for the one that worked
+        self.attempts = []
+
+class TwilioTransport:
+    """Async Twilio REST client for WhatsApp or SMS sends"""
+
+    def __init__(self, account_sid, auth_token, from_number, address_prefix='', status_callback=None):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self.address_prefix = address_prefix
+        self.status_callback = status_callback
+        self._client = None
+
+    def _get_client(self):
+        # Created inside the engine's loop so the aiohttp session binds to it
+        if self._client is None:
+            from twilio.rest import Client
+            from twilio.http.async_http_client import AsyncTwilioHttpClient
+            self._client = Client(self.account_sid, self.auth_token, http_client=AsyncTwilioHttpClient())
+        return self._client
+
+    async def send(self, delivery, recipient):
+        options = {}
+        if self.status_callback:
+            options['status_callback'] = self.status_callback
+        message = await self._get_client().messages.create_async(
+            body=delivery.message,
+            from_=f"{self.address_prefix}{self.from_number}",
+            to=f"{self.address_prefix}{recipient}",
+            **options
+        )
+        return message.sid
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.http_client.close()
+            self._client = None
+
+class SMTPTransport:
+    """Sends email over the shared SMTP connection pool.
+
+    smtplib is blocking, so sends run on the loop's thread pool; the email
+    channel's concurrency limit keeps that bounded to the pool size.
+    """
+
+    def __init__(self, pool, from_email):
+        self.pool = pool
+        self.from_email = from_email
+
+    async def send(self, delivery, recipient):
+        from communication import build_email
+        msg = build_email(self.from_email, recipient, delivery.subject or '', delivery.message)
+        await asyncio.to_thread(self.pool.send, msg)
+        return None
+
+    async def close(self):
+        pass
+
+class RateLimiter:
+    """Token bucket shared by every send on one channel"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class DeliveryEngine:
+    """Runs outbound sends concurrently on an asyncio loop in a background thread.
+
+    Callers in request or worker threads hand over Delivery objects and get
+    back concurrent futures (or block on send/send_many), so a single worker
+    can keep thousands of sends in flight.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._limiters = {}
+        self._transports = {}
+
+    def _ensure_loop(self):
+        with self._lock:
+            # A loop inherited from a forking parent has no thread behind it
+            if self._loop is not None and self._pid == os.getpid():
+                return self._loop
+            self._loop = asyncio.new_event_loop()
+            self._pid = os.getpid()
+            self._semaphores = {}
+            self._limiters = {}
+            self._transports = {}
+            self._thread = threading.Thread(target=self._loop.run_forever, name='delivery-engine', daemon=True)
+            self._thread.start()
+            return self._loop
+
+    def transport(self, key, factory):
+        """Reuse one transport (and its HTTP session) per set of credentials"""
+        self._ensure_loop()
+        with self._lock:
+            transport = self._transports.get(key)
+            if transport is None:
+                transport = self._transports[key] = factory()
+            return transport
+
+    def submit(self, delivery):
+        """Schedule a delivery; returns a concurrent.futures.Future of its DeliveryResult"""
+        return asyncio.run_coroutine_threadsafe(self._deliver(delivery), self._ensure_loop())
+
+    def send(self, delivery, timeout=60):
+        return self.submit(delivery).result(timeout)
+
+    def send_many(self, deliveries, timeout=None):
+        """Send every delivery concurrently and wait for all of them"""
+        if not deliveries:
+            return []
+        future = asyncio.run_coroutine_threadsafe(self._deliver_all(deliveries), self._ensure_loop())
+        return future.result(timeout)
+
+    async def _deliver_all(self, deliveries):
+        return await asyncio.gather(*(self._deliver(d) for d in deliveries))
+
+    async def _deliver(self, delivery):
+        result = DeliveryResult(delivery)
+        for route in delivery.routes:
+            try:
+                sid = await self._attempt(route, delivery)
+            except Exception as e:
+                logger.warning(f"{route.channel} delivery to {route.recipient} failed: {e}")
+                result.attempts.append((route, e))
+                continue
+            result.attempts.append((route, None))
+            result.success = True
+            result.channel = route.channel
+            result.recipient = route.recipient
+            result.provider_sid = sid
+            break
+        return result
+
+    async def _attempt(self, route, delivery):
+        semaphore = self._semaphores.get(route.channel)
+        if semaphore is None:
+            limits = channel_limits(route.channel)
+            semaphore = self._semaphores[route.channel] = asyncio.Semaphore(limits['concurrency'])
+            self._limiters[route.channel] = RateLimiter(limits['rate'])
+        limiter = self._limiters[route.channel]
+
+        async with semaphore:
+            await limiter.acquire()
+            with timed(OUTBOUND_LATENCY, channel=route.channel):
+                return await route.transport.send(delivery, route.recipient)
+
+    def close(self):
+        with self._lock:
+            loop, transports = self._loop, list(self._transports.values())
+            self._loop = None
+            self._transports = {}
+        if loop is None:
+            return
+
+        async def _close():
+            for transport in transports:
+                await transport.close()
+
+        try:
+            asyncio.run_coroutine_threadsafe(_close(), loop).result(10)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+
+_engine = DeliveryEngine()
+
+def get_engine():
+    return _engine
@@ -0,0 +1,169 @@
+import os
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from app import app, db
+from models import NotificationLog
+
+logger = logging.getLogger(__name__)
+
+# Callbacks can arrive out of order, so a status only ever moves forward
+STATUS_RANK = {
+    'pending': 0,
+    'queued': 0,
+    'accepted': 0,
+    'sending': 0,
+    'sent': 1,
+    'delivered': 2,
+    'read': 3,
+    'undelivered': 4,
+    'failed': 4,
+}
+TRACKED_STATUSES = ('sent', 'delivered', 'read', 'undelivered', 'failed')
+
+FLUSH_SIZE = int(os.environ.get('DELIVERY_STATUS_FLUSH_SIZE', '200'))
+FLUSH_INTERVAL = float(os.environ.get('DELIVERY_STATUS_FLUSH_INTERVAL', '2'))
+UPDATE_CHUNK = 500
+# Callbacks only match messages created this recently, which lets a
+# partitioned notification_logs table skip older months
+LOOKBACK = timedelta(days=int(os.environ.get('DELIVERY_STATUS_LOOKBACK_DAYS', '30')))
+# A callback can beat the commit that stores the message's SID; unmatched
+# callbacks are retried on later flushes for this long before being dropped
+UNMATCHED_GRACE = timedelta(seconds=float(os.environ.get('DELIVERY_STATUS_UNMATCHED_GRACE_SECONDS', '60')))
+
+def statuses_below(status):
+    rank = STATUS_RANK[status]
+    return [name for name, other in STATUS_RANK.items() if other < rank]
+
+class StatusBatcher:
+    """Buffers provider status callbacks and applies them in batched UPDATEs"""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def add(self, provider_sid, status, error_message=None, timestamp=None):
+        status = (status or '').lower()
+        if not provider_sid or status not in TRACKED_STATUSES:
+            return
+        now = datetime.utcnow()
+        with self._lock:
+            current = self._pending.get(provider_sid)
+            # Collapse several callbacks for the same message into the latest stage
+            if current is None or STATUS_RANK[status] >= STATUS_RANK[current[0]]:
+                first_seen = current[3] if current else now
+                self._pending[provider_sid] = (status, error_message, timestamp or now, first_seen)
+            full = len(self._pending) >= FLUSH_SIZE
+        self._ensure_thread()
+        if full:
+            self._wakeup.set()
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='delivery-status', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(FLUSH_INTERVAL)
+            self._wakeup.clear()
+            try:
+                with app.app_context():
+                    self.flush()
+            except Exception as e:
+                logger.error(f"Error applying delivery status updates: {e}")
+
+    def flush(self):
+        """Apply everything buffered so far; returns the number of rows updated"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        # Group by outcome so each group becomes one set-based UPDATE
+        groups = {}
+        for sid, (status, error_message, timestamp, _) in pending.items():
+            groups.setdefault((status, error_message), []).append((sid, timestamp))
+
+        updated = 0
+        unmatched = []
+        try:
+            for (status, error_message), updates in groups.items():
+                values = {
+                    'status': status,
+                    'status_updated_at': max(timestamp for _, timestamp in updates),
+                }
+                if error_message:
+                    values['error_message'] = error_message
+                sids = [sid for sid, _ in updates]
+                since = min(timestamp for _, timestamp in updates) - LOOKBACK
+                for start in range(0, len(sids), UPDATE_CHUNK):
+                    chunk = sids[start:start + UPDATE_CHUNK]
+                    # The status filter keeps late, lower-ranked callbacks
+                    # from overwriting newer ones
+                    chunk_updated = NotificationLog.query.filter(
+                        NotificationLog.provider_sid.in_(chunk),
+                        NotificationLog.status.in_(statuses_below(status)),
+                        NotificationLog.created_at >= since
+                    ).update(values, synchronize_session=False)
+                    updated += chunk_updated
+                    if chunk_updated < len(chunk):
+                        unmatched.extend(self._unmatched(chunk, since))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # Put the batch back so the next flush retries it
+            with self._lock:
+                for sid, value in pending.items():
+                    self._pending.setdefault(sid, value)
+            raise
+
+        # Keep callbacks for messages not logged yet, until the grace period is up
+        cutoff = datetime.utcnow() - UNMATCHED_GRACE
+        retry = [sid for sid in unmatched if pending[sid][3] >= cutoff]
+        if retry:
+            with self._lock:
+                for sid in retry:
+                    self._pending.setdefault(sid, pending[sid])
+        if len(retry) < len(unmatched):
+            logger.info(f"Dropped {len(unmatched) - len(retry)} status callbacks for unknown messages")
+        return updated
+
+    @staticmethod
+    def _unmatched(sids, since):
+        """The SIDs among `sids` without a notification log row (yet)"""
+        found = {sid for sid, in db.session.query(NotificationLog.provider_sid).filter(
+            NotificationLog.provider_sid.in_(sids),
+            NotificationLog.created_at >= since
+        )}
+        return [sid for sid in sids if sid not in found]
+
+batcher = StatusBatcher()
+
+def record_status(provider_sid, status, error_message=None, timestamp=None):
+    batcher.add(provider_sid, status, error_message, timestamp)
+
+def delivery_summary(since=None):
+    """Counts of outbound notifications per channel and delivery status"""
+    query = db.session.query(
+        NotificationLog.channel, NotificationLog.status, func.count(NotificationLog.id)
+    )
+    if since:
+        query = query.filter(NotificationLog.created_at >= since)
+    summary = {}
+    for channel, status, count in query.group_by(NotificationLog.channel, NotificationLog.status):
+        summary.setdefault(channel, {})[status] = count
+    return summary
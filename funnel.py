@@ -0,0 +1,161 @@
+import os
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from app import app, db
+from models import Application, ApplicationStatusChange, Internship, InternshipFunnel
+import scheduler
+
+logger = logging.getLogger(__name__)
+
+FUNNEL_STAGES = ('started', 'reached_name', 'reached_email', 'cv_received', 'completed', 'shortlisted', 'selected')
+# Review outcomes only count towards the funnel on the way up
+STATUS_RANK = {'pending': 0, 'rejected': 0, 'shortlisted': 1, 'selected': 2}
+# The scheduler thread reconciles the funnels this often (0 turns it
+# off); workers see each other's runs through rolled_up_at
+ROLLUP_INTERVAL = timedelta(minutes=float(os.environ.get('FUNNEL_ROLLUP_INTERVAL_MINUTES', '60')))
+
+def increment(internship_id, **deltas):
+    """Atomically add to an internship's funnel counters in the current transaction.
+
+    Uses `column = column + n` so concurrent webhooks never lose updates; the
+    row is created on first use.
+    """
+    deltas = {name: amount for name, amount in deltas.items() if amount}
+    if not internship_id or not deltas:
+        return
+    values = {getattr(InternshipFunnel, name): getattr(InternshipFunnel, name) + amount
+              for name, amount in deltas.items()}
+    values[InternshipFunnel.updated_at] = datetime.utcnow()
+    if InternshipFunnel.query.filter_by(internship_id=internship_id).update(values, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(InternshipFunnel(internship_id=internship_id, updated_at=datetime.utcnow(), **deltas))
+    except IntegrityError:
+        # Another transaction created the row in the meantime
+        InternshipFunnel.query.filter_by(internship_id=internship_id).update(values, synchronize_session=False)
+
+def record_stage(internship_id, stage):
+    increment(internship_id, **{stage: 1})
+
+def record_completion(internship_id, started_at=None):
+    """Count a completed application and, when known, how long the conversation took"""
+    seconds = None
+    if started_at:
+        try:
+            seconds = (datetime.utcnow() - datetime.fromisoformat(started_at)).total_seconds()
+        except (TypeError, ValueError):
+            seconds = None
+    if seconds is None or seconds < 0:
+        increment(internship_id, completed=1)
+    else:
+        increment(internship_id, completed=1, completion_seconds_total=seconds, completion_samples=1)
+
+def review_deltas(old_status, new_status):
+    """Funnel stages newly reached by a status change, e.g. pending -> selected reaches both"""
+    old_rank = STATUS_RANK.get(old_status or 'pending', 0)
+    new_rank = STATUS_RANK.get(new_status, 0)
+    return {
+        stage: 1 for stage in ('shortlisted', 'selected')
+        if old_rank < STATUS_RANK[stage] <= new_rank
+    }
+
+def record_status_change(internship_id, old_status, new_status):
+    increment(internship_id, **review_deltas(old_status, new_status))
+
+def funnel_rows():
+    """Funnel rows for active internships, newest first, in one query"""
+    return (
+        db.session.query(Internship, InternshipFunnel)
+        .outerjoin(InternshipFunnel, InternshipFunnel.internship_id == Internship.id)
+        .filter(Internship.is_active == True)
+        .order_by(Internship.created_at.desc())
+        .all()
+    )
+
+def _new_funnel(internship_id):
+    """An all-zero funnel row, or the one a concurrent increment() just created"""
+    try:
+        with db.session.begin_nested():
+            funnel = InternshipFunnel(internship_id=internship_id, started=0, reached_name=0, reached_email=0,
+                                      cv_received=0, completed=0, shortlisted=0, selected=0,
+                                      completion_seconds_total=0.0, completion_samples=0)
+            db.session.add(funnel)
+        return funnel
+    except IntegrityError:
+        return InternshipFunnel.query.filter_by(internship_id=internship_id).one()
+
+def rollup():
+    """Reconcile the funnel tables with the source data.
+
+    Completed, CVs received, shortlisted and selected are recomputed exactly
+    with one grouped query each. Earlier stages can't be recomputed (abandoned
+    conversations are cleaned up), so they are only raised to at least the
+    count of the stage after them; completion times are left as recorded.
+    Returns the number of internships rolled up.
+    """
+    def grouped(query):
+        return dict(query.group_by(Application.internship_id).all())
+
+    completed = grouped(
+        db.session.query(Application.internship_id, func.count(Application.id))
+        .filter(Application.conversation_state == 'completed')
+    )
+    processing = grouped(
+        db.session.query(Application.internship_id, func.count(Application.id))
+        .filter(Application.conversation_state == 'processing_cv')
+    )
+    reached = {}
+    for stage in ('shortlisted', 'selected'):
+        statuses = [status for status, rank in STATUS_RANK.items() if rank >= STATUS_RANK[stage]]
+        # Current status, or any recorded change into the stage or beyond
+        reached[stage] = grouped(
+            db.session.query(Application.internship_id, func.count(func.distinct(Application.id)))
+            .outerjoin(ApplicationStatusChange, ApplicationStatusChange.application_id == Application.id)
+            .filter(
+                Application.conversation_state == 'completed',
+                or_(Application.status.in_(statuses), ApplicationStatusChange.new_status.in_(statuses))
+            )
+        )
+
+    now = datetime.utcnow()
+    funnels = {funnel.internship_id: funnel for funnel in InternshipFunnel.query.all()}
+    internship_ids = [row.id for row in db.session.query(Internship.id)]
+    for internship_id in internship_ids:
+        funnel = funnels.get(internship_id)
+        if funnel is None:
+            funnel = _new_funnel(internship_id)
+        funnel.completed = completed.get(internship_id, 0)
+        funnel.shortlisted = reached['shortlisted'].get(internship_id, 0)
+        funnel.selected = reached['selected'].get(internship_id, 0)
+        funnel.cv_received = max(funnel.cv_received, funnel.completed + processing.get(internship_id, 0))
+        funnel.reached_email = max(funnel.reached_email, funnel.cv_received)
+        funnel.reached_name = max(funnel.reached_name, funnel.reached_email)
+        funnel.started = max(funnel.started, funnel.reached_name)
+        funnel.rolled_up_at = now
+    db.session.commit()
+    return len(internship_ids)
+
+@scheduler.periodic('Funnel rollup')
+def rollup_if_due(now=None):
+    """Run rollup() unless some worker did within ROLLUP_INTERVAL.
+
+    Returns when the next one is due, or None when periodic rollups are off.
+    """
+    if not ROLLUP_INTERVAL:
+        return None
+    now = now or datetime.utcnow()
+    last = db.session.query(func.max(InternshipFunnel.rolled_up_at)).scalar()
+    if last is not None and last > now - ROLLUP_INTERVAL:
+        return last + ROLLUP_INTERVAL
+    count = rollup()
+    logger.info(f"Rolled up funnels for {count} internships")
+    return now + ROLLUP_INTERVAL
+
+@app.cli.command('rollup-funnels')
+def rollup_funnels_command():
+    """Recompute the per-internship funnel aggregates from the source tables"""
+    count = rollup()
+    print(f"Rolled up funnels for {count} internships")
@@ -0,0 +1,101 @@
+# Cross-posting duplicates: the same person applying to several internships,
+# recognised by email, phone number or identical CV file. Completed
+# applications carry normalized copies of those keys in indexed columns, so
+# "also applied to" is a handful of index lookups rather than a table scan.
+import logging
+import click
+from sqlalchemy import or_
+from app import app, db
+from models import Application, Internship
+from utils import format_phone_number
+
+logger = logging.getLogger(__name__)
+
+# Providers that ignore dots in the local part
+DOTLESS_DOMAINS = {'gmail.com': 'gmail.com', 'googlemail.com': 'gmail.com'}
+BACKFILL_BATCH_SIZE = 500
+
+def canonical_email(email):
+    """Lowercased, without +tags (and without dots for Gmail), or None"""
+    email = (email or '').strip().lower()
+    local, _, domain = email.rpartition('@')
+    if not local or not domain:
+        return None
+    local = local.split('+', 1)[0]
+    if domain in DOTLESS_DOMAINS:
+        domain = DOTLESS_DOMAINS[domain]
+        local = local.replace('.', '')
+    return f'{local}@{domain}' if local else None
+
+def canonical_phone(phone_number):
+    """E.164 form (see utils.format_phone_number), or None"""
+    if not phone_number:
+        return None
+    phone = format_phone_number(phone_number)
+    return phone if len(phone) > 1 else None
+
+def assign(application):
+    """Fill in the identity keys; called when an application is completed"""
+    application.canonical_email = canonical_email(application.email)
+    application.canonical_phone = canonical_phone(application.phone_number or application.whatsapp_number)
+
+KEYS = ('canonical_email', 'canonical_phone', 'cv_sha256')
+
+def _keys(application):
+    return {(key, getattr(application, key)) for key in KEYS if getattr(application, key)}
+
+def other_applications(applications):
+    """{application id: [other completed applications by the same person]} for `applications`.
+
+    One query for the whole list; each entry has id, application_id,
+    internship_id, internship_title, status and applied_at, newest first.
+    """
+    keys = set().union(*(_keys(application) for application in applications)) if applications else set()
+    if not keys:
+        return {}
+    conditions = []
+    for key in KEYS:
+        values = [value for name, value in keys if name == key]
+        if values:
+            conditions.append(getattr(Application, key).in_(values))
+    rows = db.session.query(
+        Application.id, Application.application_id, Application.internship_id,
+        Internship.title.label('internship_title'), Application.status, Application.applied_at,
+        *(getattr(Application, key) for key in KEYS)
+    ).outerjoin(Internship, Application.internship_id == Internship.id).filter(
+        Application.conversation_state == 'completed',
+        or_(*conditions)
+    ).order_by(Application.applied_at.desc()).all()
+
+    matches = {}
+    for application in applications:
+        wanted = _keys(application)
+        others = [row for row in rows if row.id != application.id and _keys(row) & wanted]
+        if others:
+            matches[application.id] = others
+    return matches
+
+def backfill(batch_size=BACKFILL_BATCH_SIZE):
+    """Fill in the identity keys of applications completed before they existed"""
+    filled = 0
+    last_id = 0
+    while True:
+        applications = Application.query.filter(
+            Application.id > last_id,
+            Application.conversation_state == 'completed',
+            Application.canonical_email.is_(None),
+            Application.canonical_phone.is_(None)
+        ).order_by(Application.id).limit(batch_size).all()
+        if not applications:
+            return filled
+        for application in applications:
+            assign(application)
+        db.session.commit()
+        filled += len(applications)
+        last_id = applications[-1].id
+
+@app.cli.command('backfill-identities')
+@click.option('--batch-size', default=BACKFILL_BATCH_SIZE, show_default=True, help='Applications updated per transaction')
+def backfill_identities_command(batch_size):
+    """Compute the duplicate-detection keys of applications completed before they were added"""
+    print(f"Updated {backfill(batch_size)} applications")
@@ -0,0 +1,249 @@
+# Photographed CVs: JPEG and PNG pages combined into one PDF. Conversion runs
+# in the CV processing pool, whose processes import this module, so only the
+# standard library is imported here. JPEGs are embedded as they are (PDF
+# readers decode them natively); PNGs keep their compressed pixel data unless
+# they have an alpha channel, which is flattened onto white.
+import os
+import zlib
+import struct
+
+# Opt-in: without it, only PDF CVs are accepted
+ENABLED = os.environ.get('IMAGE_CVS', '0') == '1'
+MAX_IMAGES = int(os.environ.get('IMAGE_CV_MAX_IMAGES', '10'))
+# PNGs with alpha are unfiltered and flattened in pure Python at a few
+# seconds per megapixel; this keeps them well inside CV_PROCESS_TIMEOUT
+MAX_PIXELS = 12_000_000
+CONTENT_TYPES = ('image/jpeg', 'image/jpg', 'image/png')
+# A4 width in points; each page takes its image's aspect ratio
+PAGE_WIDTH = 595.28
+
+class InvalidImage(Exception):
+    pass
+
+class ImageTooLarge(InvalidImage):
+    pass
+
+def accepts(content_type):
+    return ENABLED and (content_type or '').split(';')[0].strip().lower() in CONTENT_TYPES
+
+def _jpeg_orientation(segment):
+    """EXIF orientation from an APP1 segment, or 1"""
+    if not segment.startswith(b'Exif\x00\x00'):
+        return 1
+    tiff = segment[6:]
+    order = '<' if tiff[:2] == b'II' else '>'
+    try:
+        ifd = struct.unpack(f'{order}I', tiff[4:8])[0]
+        count = struct.unpack(f'{order}H', tiff[ifd:ifd + 2])[0]
+        for index in range(count):
+            entry = tiff[ifd + 2 + index * 12:ifd + 14 + index * 12]
+            if struct.unpack(f'{order}H', entry[:2])[0] == 0x0112:
+                return struct.unpack(f'{order}H', entry[8:10])[0]
+    except struct.error:
+        pass
+    return 1
+
+def read_jpeg(data):
+    """Image XObject fields for a JPEG, embedded unchanged"""
+    if data[:2] != b'\xff\xd8':
+        raise InvalidImage('not a JPEG')
+    orientation = 1
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            raise InvalidImage('corrupt JPEG')
+        marker = data[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        length = struct.unpack('>H', data[position + 2:position + 4])[0]
+        segment = data[position + 4:position + 2 + length]
+        if marker == 0xE1:
+            orientation = _jpeg_orientation(segment)
+        elif marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+            height, width, components = struct.unpack('>HHB', segment[1:6])
+            colorspace = {1: '/DeviceGray', 3: '/DeviceRGB', 4: '/DeviceCMYK'}.get(components)
+            if not colorspace or not width or not height:
+                raise InvalidImage('unsupported JPEG')
+            return {
+                'width': width, 'height': height, 'colorspace': colorspace, 'bits': 8,
+                'filter': '/DCTDecode', 'data': data,
+                # Phones store photos sideways and record the turn in EXIF
+                'rotate': {3: 180, 6: 90, 8: 270}.get(orientation, 0),
+            }
+        position += 2 + length
+    raise InvalidImage('JPEG has no frame header')
+
+def _paeth(left, up, up_left):
+    estimate = left + up - up_left
+    distance_left, distance_up, distance_up_left = abs(estimate - left), abs(estimate - up), abs(estimate - up_left)
+    if distance_left <= distance_up and distance_left <= distance_up_left:
+        return left
+    return up if distance_up <= distance_up_left else up_left
+
+def _unfilter(raw, width, height, bpp):
+    """Undo PNG's per-row filters; returns the rows as bytearrays"""
+    stride = width * bpp
+    previous = bytearray(stride)
+    rows = []
+    position = 0
+    for _ in range(height):
+        kind = raw[position]
+        row = bytearray(raw[position + 1:position + 1 + stride])
+        position += stride + 1
+        if kind == 1:
+            for i in range(bpp, stride):
+                row[i] = (row[i] + row[i - bpp]) & 0xFF
+        elif kind == 2:
+            for i in range(stride):
+                row[i] = (row[i] + previous[i]) & 0xFF
+        elif kind == 3:
+            for i in range(stride):
+                left = row[i - bpp] if i >= bpp else 0
+                row[i] = (row[i] + ((left + previous[i]) >> 1)) & 0xFF
+        elif kind == 4:
+            for i in range(stride):
+                left = row[i - bpp] if i >= bpp else 0
+                up_left = previous[i - bpp] if i >= bpp else 0
+                row[i] = (row[i] + _paeth(left, previous[i], up_left)) & 0xFF
+        elif kind != 0:
+            raise InvalidImage('corrupt PNG')
+        rows.append(row)
+        previous = row
+    return rows
+
+def _flatten_alpha(rows, channels):
+    """Composite 8-bit rows with a trailing alpha channel onto white, re-encoded unfiltered"""
+    out = bytearray()
+    for row in rows:
+        out.append(0)
+        for i in range(0, len(row), channels):
+            alpha = row[i + channels - 1]
+            for value in row[i:i + channels - 1]:
+                out.append((value * alpha + 255 * (255 - alpha)) // 255)
+    return zlib.compress(bytes(out), 6)
+
+def read_png(data):
+    """Image XObject fields for a PNG"""
+    if data[:8] != b'\x89PNG\r\n\x1a\n':
+        raise InvalidImage('not a PNG')
+    position = 8
+    header = palette = None
+    idat = []
+    while position + 8 <= len(data):
+        length, kind = struct.unpack('>I4s', data[position:position + 8])
+        chunk = data[position + 8:position + 8 + length]
+        position += 12 + length
+        if kind == b'IHDR':
+            header = struct.unpack('>IIBBBBB', chunk)
+        elif kind == b'PLTE':
+            palette = chunk
+        elif kind == b'IDAT':
+            idat.append(chunk)
+        elif kind == b'IEND':
+            break
+    if header is None or not idat:
+        raise InvalidImage('PNG has no image data')
+    width, height, bits, color_type, _, _, interlace = header
+    if not width or not height or width * height > MAX_PIXELS:
+        raise ImageTooLarge(f'PNG of {width}x{height} pixels')
+    if interlace:
+        raise InvalidImage('interlaced PNGs are not supported')
+    compressed = b''.join(idat)
+
+    if color_type in (4, 6):
+        if bits != 8:
+            raise InvalidImage('unsupported PNG')
+        channels = 2 if color_type == 4 else 4
+        rows = _unfilter(zlib.decompress(compressed), width, height, channels)
+        return {
+            'width': width, 'height': height, 'bits': 8,
+            'colorspace': '/DeviceGray' if color_type == 4 else '/DeviceRGB',
+            'filter': '/FlateDecode', 'data': _flatten_alpha(rows, channels), 'rotate': 0,
+        }
+
+    colors = {0: 1, 2: 3, 3: 1}.get(color_type)
+    if colors is None:
+        raise InvalidImage('unsupported PNG')
+    if color_type == 3:
+        if not palette:
+            raise InvalidImage('PNG palette missing')
+        hex_palette = palette.hex().upper()
+        colorspace = f'[/Indexed /DeviceRGB {len(palette) // 3 - 1} <{hex_palette}>]'
+    else:
+        colorspace = '/DeviceGray' if colors == 1 else '/DeviceRGB'
+    # PDF's PNG predictors undo the row filters, so the data goes in as it is
+    return {
+        'width': width, 'height': height, 'bits': bits, 'colorspace': colorspace,
+        'filter': '/FlateDecode', 'data': compressed, 'rotate': 0,
+        'decode_parms': f'<< /Predictor 15 /Colors {colors} /BitsPerComponent {bits} /Columns {width} >>',
+    }
+
+def read_image(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data[:2] == b'\xff\xd8':
+        return read_jpeg(data)
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return read_png(data)
+    raise InvalidImage('not a JPEG or PNG')
+
+def images_to_pdf(image_paths, pdf_path):
+    """Write one page per image to `pdf_path`; returns the page count.
+
+    Raises InvalidImage when a file can't be used.
+    """
+    images = [read_image(path) for path in image_paths]
+    if not images:
+        raise InvalidImage('no images')
+
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages = add(None)
+    page_ids = []
+    for index, image in enumerate(images):
+        parms = f" /DecodeParms {image['decode_parms']}" if image.get('decode_parms') else ''
+        image_id = add((
+            (f"<< /Type /XObject /Subtype /Image /Width {image['width']} /Height {image['height']}"
+             f" /ColorSpace {image['colorspace']} /BitsPerComponent {image['bits']}"
+             f" /Filter {image['filter']}{parms} /Length {len(image['data'])} >>").encode(),
+            image['data']
+        ))
+        page_height = round(PAGE_WIDTH * image['height'] / image['width'], 2)
+        content = f"q {PAGE_WIDTH} 0 0 {page_height} 0 0 cm /Im{index} Do Q".encode()
+        content_id = add((f"<< /Length {len(content)} >>".encode(), content))
+        rotate = f" /Rotate {image['rotate']}" if image['rotate'] else ''
+        page_ids.append(add(
+            (f"<< /Type /Page /Parent {pages} 0 R /MediaBox [0 0 {PAGE_WIDTH} {page_height}]{rotate}"
+             f" /Resources << /XObject << /Im{index} {image_id} 0 R >> >> /Contents {content_id} 0 R >>").encode()
+        ))
+    objects[catalog - 1] = f"<< /Type /Catalog /Pages {pages} 0 R >>".encode()
+    kids = ' '.join(f'{page_id} 0 R' for page_id in page_ids)
+    objects[pages - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    out = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n'.encode()
+        if isinstance(body, tuple):
+            out += body[0] + b'\nstream\n' + body[1] + b'\nendstream'
+        else:
+            out += body
+        out += b'\nendobj\n'
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    for offset in offsets:
+        out += f'{offset:010d} 00000 n \n'.encode()
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root {catalog} 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+
+    partial = f'{pdf_path}.partial'
+    with open(partial, 'wb') as f:
+        f.write(out)
+    os.replace(partial, pdf_path)
+    return len(page_ids)
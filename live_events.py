@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import queue
+import select
+import logging
+import threading
+from sqlalchemy import event, text
+from app import app, db
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'live_events'
+# auto picks postgres (LISTEN/NOTIFY, reaches every worker) on PostgreSQL and
+# local (this process only) otherwise
+BACKEND = os.environ.get('LIVE_EVENTS_BACKEND', 'auto')
+# Each open stream holds a worker thread, so keep some for normal requests
+MAX_STREAMS = int(os.environ.get('LIVE_EVENTS_MAX_STREAMS', '4'))
+# Streams are closed after this long and the browser reconnects, which
+# returns the thread to the pool now and then
+STREAM_SECONDS = float(os.environ.get('LIVE_EVENTS_STREAM_SECONDS', '300'))
+KEEPALIVE_SECONDS = 15
+RECONNECT_MS = 3000
+# Events buffered per stream before it is told to resync instead
+SUBSCRIBER_QUEUE_SIZE = 100
+LISTEN_RETRY_SECONDS = 5
+
+class Subscription:
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def put(self, live_event):
+        try:
+            self.queue.put_nowait(live_event)
+        except queue.Full:
+            # A stalled client: drop what it missed and have it reload the counts
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait({'type': 'resync', 'data': {}})
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class EventBroker:
+    """Fans events out to the streams open in this process"""
+
+    def __init__(self, max_subscribers=MAX_STREAMS):
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        """A new subscription, or None when this worker already has enough streams"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            subscription = Subscription()
+            self._subscribers.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def deliver(self, live_event):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.put(live_event)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+broker = EventBroker()
+
+class LocalBackend:
+    """Delivers straight to this process's streams once the change is committed"""
+
+    name = 'local'
+    transactional = False
+
+    def publish(self, events, session=None):
+        for live_event in events:
+            broker.deliver(live_event)
+
+    def start(self):
+        pass
+
+class PostgresBackend:
+    """NOTIFY on publish, and one LISTEN connection per worker feeding the broker.
+
+    NOTIFY is sent inside the committing transaction, so PostgreSQL only
+    delivers it if the change is committed.
+    """
+
+    name = 'postgres'
+    transactional = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listener_pid = None
+
+    def publish(self, events, session):
+        # Payloads are kept well under NOTIFY's 8000 byte limit by the
+        # publishers (status events carry at most CHUNK_SIZE ids)
+        for live_event in events:
+            session.execute(text('SELECT pg_notify(:channel, :payload)'),
+                            {'channel': CHANNEL, 'payload': json.dumps(live_event)})
+
+    def start(self):
+        """Start the listener thread in this process if it isn't running yet"""
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+        threading.Thread(target=self._listen_forever, name='live-events-listener', daemon=True).start()
+
+    def _listen_forever(self):
+        with app.app_context():
+            while True:
+                try:
+                    self._listen()
+                except Exception as e:
+                    logger.error(f"Live events listener failed, reconnecting: {e}")
+                time.sleep(LISTEN_RETRY_SECONDS)
+
+    def _listen(self):
+        # A dedicated connection taken out of the pool for good
+        pooled = db.engine.raw_connection()
+        pooled.detach()
+        connection = pooled.dbapi_connection
+        try:
+            connection.autocommit = True
+            connection.cursor().execute(f'LISTEN {CHANNEL}')
+            logger.info(f"Listening for live events on {CHANNEL}")
+            while True:
+                if select.select([connection], [], [], KEEPALIVE_SECONDS) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notification = connection.notifies.pop(0)
+                    broker.deliver(json.loads(notification.payload))
+        finally:
+            connection.close()
+
+_backend = None
+
+def backend():
+    global _backend
+    if _backend is None:
+        name = BACKEND
+        if name == 'auto':
+            name = 'postgres' if db.engine.dialect.name == 'postgresql' else 'local'
+        _backend = PostgresBackend() if name == 'postgres' else LocalBackend()
+    return _backend
+
+def publish_on_commit(event_type, **data):
+    """Publish an event to the open streams once the current transaction commits"""
+    db.session.info.setdefault('live_events', []).append({'type': event_type, 'data': data})
+
+def publish_counters(**deltas):
+    """Counter deltas for the dashboard cards, e.g. pending_applications=-1"""
+    deltas = {name: amount for name, amount in deltas.items() if amount}
+    if deltas:
+        publish_on_commit('counters', **deltas)
+
+def subscribe():
+    """A subscription for a new stream, or None when the worker is at MAX_STREAMS"""
+    subscription = broker.subscribe()
+    if subscription is not None:
+        backend().start()
+    return subscription
+
+def format_event(live_event):
+    return f"event: {live_event['type']}\ndata: {json.dumps(live_event['data'])}\n\n"
+
+def stream(subscription, duration=STREAM_SECONDS):
+    """The text/event-stream body for one subscription; unsubscribes when closed"""
+    try:
+        yield f"retry: {RECONNECT_MS}\n\n"
+        deadline = time.monotonic() + duration
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            live_event = subscription.get(timeout=min(KEEPALIVE_SECONDS, remaining))
+            # Comments keep proxies from timing out an idle stream
+            yield format_event(live_event) if live_event else ': keepalive\n\n'
+    finally:
+        broker.unsubscribe(subscription)
+
+@event.listens_for(db.session, 'before_commit')
+def _notify_before_commit(session):
+    if session.info.get('live_events') and backend().transactional:
+        backend().publish(session.info.pop('live_events'), session)
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_after_commit(session):
+    events = session.info.pop('live_events', None)
+    if events:
+        backend().publish(events)
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_after_rollback(session):
+    session.info.pop('live_events', None)
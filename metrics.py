@@ -0,0 +1,253 @@
+import os
+import time
+import threading
+from bisect import bisect_left
+from flask import g, request, has_request_context, Response, abort
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app
+
+# Latency buckets in seconds, shared by every histogram unless overridden
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.kind}']
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}')
+        return lines
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.label_names)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket (non-cumulative) counts, plus sum and count
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names + ('le',), key + (_format_value(bound),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.label_names, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, func):
+        """Register a callback that refreshes gauges right before each scrape"""
+        self._collectors.append(func)
+        return func
+
+    def render(self):
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception as e:
+                app.logger.debug(f"Metrics collector {collect.__name__} failed: {e}")
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+def counter(name, description, labels=()):
+    return registry.register(Counter(name, description, labels))
+
+def gauge(name, description, labels=()):
+    return registry.register(Gauge(name, description, labels))
+
+def histogram(name, description, labels=(), buckets=DEFAULT_BUCKETS):
+    return registry.register(Histogram(name, description, labels, buckets))
+
+HTTP_REQUESTS = counter('http_requests_total', 'HTTP requests handled', ('route', 'method', 'status'))
+HTTP_LATENCY = histogram('http_request_duration_seconds', 'HTTP request latency', ('route', 'method'))
+DB_QUERIES_PER_REQUEST = histogram(
+    'http_request_db_queries', 'Database statements executed per request', ('route',),
+    buckets=(1, 2, 5, 10, 20, 50, 100, 250)
+)
+DB_TIME_PER_REQUEST = histogram('http_request_db_seconds', 'Time spent in the database per request', ('route',))
+DB_QUERIES = counter('db_queries_total', 'Database statements executed')
+DB_QUERY_SECONDS = counter('db_query_seconds_total', 'Time spent executing database statements')
+OUTBOUND_LATENCY = histogram('outbound_send_duration_seconds', 'Outbound send latency by channel', ('channel', 'outcome'))
+MEDIA_LATENCY = histogram('media_download_duration_seconds', 'WhatsApp media download latency', ('outcome',))
+QUEUE_DEPTH = gauge('queue_depth', 'Items waiting in background queues', ('queue', 'state'))
+STAGE_JOBS = gauge('pipeline_stage_jobs', 'Completed pipeline stage jobs', ('stage', 'outcome'))
+STAGE_AVG_SECONDS = gauge('pipeline_stage_avg_seconds', 'Average pipeline stage job latency', ('stage',))
+
+class timed:
+    """Context manager that observes elapsed time on a histogram.
+
+    Set `.outcome` inside the block to label failures.
+    """
+
+    def __init__(self, metric, **labels):
+        self.metric = metric
+        self.labels = labels
+        self.outcome = 'ok'
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.outcome = 'error'
+        labels = dict(self.labels)
+        if 'outcome' in self.metric.label_names:
+            labels['outcome'] = self.outcome
+        self.metric.observe(time.perf_counter() - self.started, **labels)
+        return False
+
+# Database statement counting, attributed to the current request when there is one
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+    if context is not None:
+        context.query_timed = True
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    if context is not None:
+        context.query_timed = False
+    elapsed = time.perf_counter() - started
+    DB_QUERIES.inc()
+    DB_QUERY_SECONDS.inc(elapsed)
+    if has_request_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_seconds += elapsed
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(exception_context):
+    # A statement that raises never reaches after_cursor_execute; drop its
+    # start time so later statements on the connection aren't timed against it
+    context = exception_context.execution_context
+    if context is not None and getattr(context, 'query_timed', False):
+        context.query_timed = False
+        exception_context.connection.info['query_started'].pop()
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+    g.db_queries = 0
+    g.db_seconds = 0.0
+
+@app.after_request
+def _record_request(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    # The URL rule keeps label cardinality bounded (no ids in the route label)
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    HTTP_LATENCY.observe(time.perf_counter() - started, route=route, method=request.method)
+    HTTP_REQUESTS.inc(route=route, method=request.method, status=response.status_code)
+    DB_QUERIES_PER_REQUEST.observe(g.db_queries, route=route)
+    DB_TIME_PER_REQUEST.observe(g.db_seconds, route=route)
+    return response
+
+@registry.collector
+def _collect_queue_depths():
+    from models import OutboxMessage
+    from app import db
+    from pipeline import stage_stats
+    from delivery_status import batcher
+
+    for stage, stats in stage_stats().items():
+        QUEUE_DEPTH.set(stats['queued'], queue=f'stage_{stage}', state='queued')
+        QUEUE_DEPTH.set(stats['in_flight'], queue=f'stage_{stage}', state='in_flight')
+        STAGE_JOBS.set(stats['succeeded'], stage=stage, outcome='succeeded')
+        STAGE_JOBS.set(stats['failed'], stage=stage, outcome='failed')
+        STAGE_AVG_SECONDS.set(stats['avg_seconds'], stage=stage)
+
+    counts = dict(db.session.query(OutboxMessage.status, db.func.count(OutboxMessage.id))
+                  .filter(OutboxMessage.status.in_(['pending', 'sending', 'dead']))
+                  .group_by(OutboxMessage.status))
+    for state in ('pending', 'sending', 'dead'):
+        QUEUE_DEPTH.set(counts.get(state, 0), queue='outbox', state=state)
+
+    QUEUE_DEPTH.set(batcher.pending_count(), queue='delivery_status', state='buffered')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition of this worker's metrics"""
+    token = os.environ.get('METRICS_TOKEN')
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            abort(401)
+    elif not current_user.is_authenticated:
+        # Without a token only signed-in admins can scrape; hidden from everyone else
+        abort(404)
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -1,5 +1,7 @@
 from datetime import datetime, timedelta
+from sqlalchemy import event
 from app import db
+from application_ids import allocator as application_id_allocator
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
@@ -95,6 +97,10 @@ To: {whatsapp_number}
 
 class Application(db.Model):
     __tablename__ = 'applications'
+    __table_args__ = (
+        # Finds CV jobs lost with a restarted worker (see whatsapp_handler.requeue_stalled_cvs)
+        db.Index('ix_applications_state_updated', 'conversation_state', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     application_id = db.Column(db.String(20), unique=True, nullable=False)  # Unique identifier for each application
@@ -106,6 +112,16 @@ class Application(db.Model):
     cover_letter = db.Column(db.Text, nullable=True)  # Allow null during conversation
     cv_filename = db.Column(db.String(255))
     cv_original_filename = db.Column(db.String(255))
+    # Set by cv_processing once the CV has been checked
+    cv_status = db.Column(db.String(20))  # ok, normalized
+    cv_pages = db.Column(db.Integer)
+    cv_size = db.Column(db.Integer)
+    cv_sha256 = db.Column(db.String(64), index=True)
+    # Extracted for relevance ranking (see ranking); deferred since lists never show it
+    cv_text = db.deferred(db.Column(db.Text))
+    # Normalized on completion to find the same person's other applications (see identities)
+    canonical_email = db.Column(db.String(120), index=True)
+    canonical_phone = db.Column(db.String(20), index=True)
     status = db.Column(db.String(20), default='pending')  # pending, shortlisted, selected, rejected
     applied_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -115,30 +131,26 @@ class Application(db.Model):
     temp_data = db.Column(db.JSON)  # Store temporary data during application process
     
     @staticmethod
-    def generate_application_id():
-        """Generate unique application ID"""
-        import string
-        import random
-        
-        # Generate format: APP-YYYYMMDD-XXXX (e.g., APP-20250716-A1B2)
-        date_str = datetime.utcnow().strftime('%Y%m%d')
-        
-        # Generate random 4-character suffix
-        chars = string.ascii_uppercase + string.digits
-        suffix = ''.join(random.choice(chars) for _ in range(4))
-        
-        application_id = f"APP-{date_str}-{suffix}"
-        
-        # Ensure uniqueness
-        while Application.query.filter_by(application_id=application_id).first():
-            suffix = ''.join(random.choice(chars) for _ in range(4))
-            application_id = f"APP-{date_str}-{suffix}"
-        
-        return application_id
+    def generate_application_id(connection=None):
+        """Allocate the next APP-YYYYMMDD-XXXX id (see application_ids)"""
+        return application_id_allocator.allocate(connection or db.session.connection())
     
     def __repr__(self):
         return f'<Application {self.full_name} for {self.internship.title}>'
 
+@event.listens_for(Application, 'before_insert')
+def assign_application_id(mapper, connection, application):
+    """Conversations get their id when first saved, not on every incoming message"""
+    if not application.application_id:
+        application.application_id = Application.generate_application_id(connection)
+
+class IdCounter(db.Model):
+    """Named counters for databases without sequences (SQLite)"""
+    __tablename__ = 'id_counters'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False)
+
 class WhatsAppMessage(db.Model):
     __tablename__ = 'whatsapp_messages'
     
@@ -151,31 +163,129 @@ class WhatsAppMessage(db.Model):
     media_url = db.Column(db.String(500))
     media_content_type = db.Column(db.String(100))  # MIME type for media files
     status = db.Column(db.String(20), default='received')  # received, processed, failed
-    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     processed_at = db.Column(db.DateTime)
     
     def __repr__(self):
         return f'<WhatsAppMessage {self.message_id} from {self.from_number}>'
 
+class ApplicationStatusChange(db.Model):
+    """Audit trail of status changes, one row per application per change"""
+    __tablename__ = 'application_status_changes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    application_id = db.Column(db.Integer, db.ForeignKey('applications.id', ondelete='CASCADE'), nullable=False, index=True)
+    old_status = db.Column(db.String(20))
+    new_status = db.Column(db.String(20), nullable=False)
+    changed_by = db.Column(db.Integer, db.ForeignKey('admins.id'))
+    batch_id = db.Column(db.String(32), index=True)  # Set when the change came from a bulk update
+    changed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ApplicationStatusChange {self.application_id}: {self.old_status} -> {self.new_status}>'
+
+class InternshipFunnel(db.Model):
+    """Per-internship conversation funnel, incremented on each state transition"""
+    __tablename__ = 'internship_funnels'
+    
+    internship_id = db.Column(db.Integer, db.ForeignKey('internships.id', ondelete='CASCADE'), primary_key=True)
+    started = db.Column(db.Integer, nullable=False, default=0)
+    reached_name = db.Column(db.Integer, nullable=False, default=0)
+    reached_email = db.Column(db.Integer, nullable=False, default=0)
+    cv_received = db.Column(db.Integer, nullable=False, default=0)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+    shortlisted = db.Column(db.Integer, nullable=False, default=0)
+    selected = db.Column(db.Integer, nullable=False, default=0)
+    completion_seconds_total = db.Column(db.Float, nullable=False, default=0.0)
+    completion_samples = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    rolled_up_at = db.Column(db.DateTime)
+    
+    internship = db.relationship('Internship')
+    
+    @property
+    def average_completion_seconds(self):
+        if not self.completion_samples:
+            return None
+        return self.completion_seconds_total / self.completion_samples
+    
+    def __repr__(self):
+        return f'<InternshipFunnel {self.internship_id}: {self.started} started, {self.completed} completed>'
+
 class NotificationLog(db.Model):
     __tablename__ = 'notification_logs'
     
     id = db.Column(db.Integer, primary_key=True)
-    application_id = db.Column(db.Integer, db.ForeignKey('applications.id'))
+    application_id = db.Column(db.Integer, db.ForeignKey('applications.id'), index=True)
     channel = db.Column(db.String(20), nullable=False)  # whatsapp, email, sms
     recipient = db.Column(db.String(200), nullable=False)
     message = db.Column(db.Text, nullable=False)
-    status = db.Column(db.String(20), default='pending')  # pending, sent, failed
+    status = db.Column(db.String(20), default='pending')  # pending, sent, delivered, read, failed, undelivered
     sent_at = db.Column(db.DateTime)
     error_message = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    provider_sid = db.Column(db.String(64), index=True)  # Twilio message SID, matched by status callbacks
+    status_updated_at = db.Column(db.DateTime)
     
     # Relationships
-    application = db.relationship('Application', backref='notifications')
+    # Dynamic so touching application.notifications never loads the whole history
+    application = db.relationship('Application', backref=db.backref('notifications', lazy='dynamic'))
     
     def __repr__(self):
         return f'<NotificationLog {self.channel} to {self.recipient}>'
 
+class OutboxMessage(db.Model):
+    __tablename__ = 'outbox_messages'
+    __table_args__ = (
+        db.Index('ix_outbox_messages_due', 'status', 'next_attempt_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    application_id = db.Column(db.Integer, db.ForeignKey('applications.id', ondelete='SET NULL'))
+    channel = db.Column(db.String(20), nullable=False)  # whatsapp, email, sms
+    recipient = db.Column(db.String(200), nullable=False)
+    subject = db.Column(db.String(255))
+    message = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default='pending')  # pending, sending, sent, dead
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=6)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(64))
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    batch_id = db.Column(db.String(32), index=True)  # Bulk action that queued the message, for progress tracking
+    
+    def __repr__(self):
+        return f'<OutboxMessage {self.channel} to {self.recipient} ({self.status})>'
+
+class ScheduledMessage(db.Model):
+    """A message handed to the outbox once due_at has passed (see scheduler)"""
+    __tablename__ = 'scheduled_messages'
+    __table_args__ = (
+        db.Index('ix_scheduled_messages_due', 'status', 'due_at'),
+        db.Index('ix_scheduled_messages_kind_due', 'kind', 'status', 'due_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)  # interview_invite, interview_reminder, nudge, drip
+    application_id = db.Column(db.Integer, db.ForeignKey('applications.id', ondelete='SET NULL'), index=True)
+    channel = db.Column(db.String(20), nullable=False)  # whatsapp, email, sms
+    recipient = db.Column(db.String(200), nullable=False)
+    subject = db.Column(db.String(255))
+    message = db.Column(db.Text, nullable=False)
+    due_at = db.Column(db.DateTime, nullable=False)
+    requires_state = db.Column(db.String(50))  # Nudges: only sent if the conversation is still in this state
+    status = db.Column(db.String(20), default='pending')  # pending, queued, cancelled
+    claimed_by = db.Column(db.String(64))
+    batch_id = db.Column(db.String(32), index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    released_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<ScheduledMessage {self.kind} to {self.recipient} at {self.due_at} ({self.status})>'
+
 class SystemSettings(db.Model):
     __tablename__ = 'system_settings'
     
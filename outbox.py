@@ -0,0 +1,262 @@
+import os
+import uuid
+import logging
+import threading
+import click
+from datetime import datetime, timedelta
+from sqlalchemy import event, or_, and_
+from app import app, db
+from models import OutboxMessage
+from pipeline import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+# Retry schedule for failed sends: 30s, 1m, 2m, 4m... capped at an hour, with jitter
+RETRY_POLICY = RetryPolicy(max_attempts=6, base_delay=30, max_delay=3600)
+BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', '100'))
+POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', '5'))
+# A claim older than this is assumed to belong to a crashed dispatcher
+CLAIM_LEASE = timedelta(minutes=5)
+# Messages for a channel without credentials are checked again this often,
+# without using up their attempts, until the credentials are configured
+UNCONFIGURED_RETRY = timedelta(minutes=5)
+
+def queue_message(channel, recipient, message, application_id=None, subject=None, max_attempts=None):
+    """Add an outbound message to the outbox in the current transaction.
+
+    Nothing is sent until the caller commits, so the message is recorded
+    together with the state change that triggered it.
+    """
+    outbox_message = OutboxMessage(
+        application_id=application_id,
+        channel=channel,
+        recipient=recipient,
+        subject=subject,
+        message=message,
+        status='pending',
+        attempts=0,
+        max_attempts=max_attempts or RETRY_POLICY.max_attempts,
+        next_attempt_at=datetime.utcnow()
+    )
+    db.session.add(outbox_message)
+    db.session.info['outbox_pending'] = True
+    return outbox_message
+
+def queue_messages(messages, batch_id=None):
+    """Bulk-insert outbox rows in the current transaction; returns how many were queued.
+
+    Each message is a dict with channel, recipient and message, plus optional
+    subject and application_id. Rows skip the ORM, which keeps queueing
+    thousands of notifications for a bulk action to a few statements.
+    """
+    if not messages:
+        return 0
+    now = datetime.utcnow()
+    rows = [{
+        'application_id': message.get('application_id'),
+        'channel': message['channel'],
+        'recipient': message['recipient'],
+        'subject': message.get('subject'),
+        'message': message['message'],
+        'status': 'pending',
+        'attempts': 0,
+        'max_attempts': RETRY_POLICY.max_attempts,
+        'next_attempt_at': now,
+        'created_at': now,
+        'batch_id': batch_id,
+    } for message in messages]
+    db.session.execute(OutboxMessage.__table__.insert(), rows)
+    db.session.info['outbox_pending'] = True
+    return len(rows)
+
+def queue_whatsapp(to_number, message, application_id=None):
+    return queue_message('whatsapp', to_number, message, application_id=application_id)
+
+def queue_email(to_email, subject, message, application_id=None):
+    return queue_message('email', to_email, message, application_id=application_id, subject=subject)
+
+@event.listens_for(db.session, 'after_commit')
+def _wake_after_commit(session):
+    if session.info.pop('outbox_pending', False):
+        dispatcher.wake()
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_after_rollback(session):
+    session.info.pop('outbox_pending', None)
+
+def _due_filter(now):
+    return or_(
+        and_(OutboxMessage.status == 'pending', OutboxMessage.next_attempt_at <= now),
+        and_(OutboxMessage.status == 'sending', OutboxMessage.locked_until < now)
+    )
+
+def claim_due_messages(limit=BATCH_SIZE):
+    """Atomically claim a batch of due messages for this dispatcher"""
+    now = datetime.utcnow()
+    due_ids = [row.id for row in db.session.query(OutboxMessage.id)
+               .filter(_due_filter(now))
+               .order_by(OutboxMessage.next_attempt_at)
+               .limit(limit)]
+    if not due_ids:
+        return []
+
+    # The due condition is re-checked by the UPDATE, so when two workers race
+    # for the same rows each row ends up with exactly one claim token
+    token = uuid.uuid4().hex
+    OutboxMessage.query.filter(
+        OutboxMessage.id.in_(due_ids),
+        _due_filter(now)
+    ).update({
+        OutboxMessage.status: 'sending',
+        OutboxMessage.claimed_by: token,
+        OutboxMessage.locked_until: now + CLAIM_LEASE,
+    }, synchronize_session=False)
+    db.session.commit()
+
+    return OutboxMessage.query.filter_by(claimed_by=token, status='sending').all()
+
+def dispatch_due(limit=BATCH_SIZE):
+    """Send one batch of due messages; returns how many were claimed"""
+    from communication import whatsapp_transport, email_transport, sms_transport, log_delivery_result
+    from delivery import Delivery, Route, get_engine
+
+    messages = claim_due_messages(limit)
+    if not messages:
+        return 0
+
+    transport_factories = {
+        'whatsapp': whatsapp_transport,
+        'email': email_transport,
+        'sms': sms_transport,
+    }
+    transports = {}
+    deliveries = []
+    sendable = []
+    for outbox_message in messages:
+        channel = outbox_message.channel
+        if channel not in transports:
+            factory = transport_factories.get(channel)
+            transports[channel] = factory() if factory else None
+        if transports[channel] is None:
+            # Credentials missing or unknown channel: nothing was tried, so keep it
+            # pending for when they are configured
+            postpone(outbox_message, f"{channel} credentials not configured")
+            continue
+        deliveries.append(Delivery(
+            outbox_message.message,
+            [Route(channel, outbox_message.recipient, transports[channel])],
+            subject=outbox_message.subject,
+            application_id=outbox_message.application_id
+        ))
+        sendable.append(outbox_message)
+
+    results = get_engine().send_many(deliveries) if deliveries else []
+    for outbox_message, result in zip(sendable, results):
+        log_delivery_result(result, commit=False)
+        if result.success:
+            outbox_message.status = 'sent'
+            outbox_message.sent_at = datetime.utcnow()
+            outbox_message.attempts += 1
+            outbox_message.last_error = None
+        else:
+            error = result.attempts[-1][1] if result.attempts else 'No route attempted'
+            schedule_retry(outbox_message, str(error))
+        outbox_message.claimed_by = None
+        outbox_message.locked_until = None
+
+    db.session.commit()
+    return len(messages)
+
+def schedule_retry(outbox_message, error):
+    """Back off exponentially, or dead-letter once attempts are used up"""
+    outbox_message.attempts = (outbox_message.attempts or 0) + 1
+    outbox_message.last_error = error
+    outbox_message.claimed_by = None
+    outbox_message.locked_until = None
+    if outbox_message.attempts >= outbox_message.max_attempts:
+        outbox_message.status = 'dead'
+        logger.error(f"Outbox message {outbox_message.id} to {outbox_message.recipient} dead-lettered after {outbox_message.attempts} attempts: {error}")
+    else:
+        outbox_message.status = 'pending'
+        delay = RETRY_POLICY.delay_for(outbox_message.attempts)
+        outbox_message.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+        logger.warning(f"Outbox message {outbox_message.id} attempt {outbox_message.attempts} failed ({error}), retrying in {delay:.0f}s")
+
+def postpone(outbox_message, error, delay=UNCONFIGURED_RETRY):
+    """Put a message back as pending without counting an attempt"""
+    outbox_message.status = 'pending'
+    outbox_message.last_error = error
+    outbox_message.claimed_by = None
+    outbox_message.locked_until = None
+    outbox_message.next_attempt_at = datetime.utcnow() + delay
+
+def requeue_dead(ids=None):
+    """Give dead-lettered messages a fresh set of attempts"""
+    query = OutboxMessage.query.filter_by(status='dead')
+    if ids:
+        query = query.filter(OutboxMessage.id.in_(ids))
+    count = query.update({
+        OutboxMessage.status: 'pending',
+        OutboxMessage.attempts: 0,
+        OutboxMessage.next_attempt_at: datetime.utcnow(),
+    }, synchronize_session=False)
+    db.session.info['outbox_pending'] = True
+    db.session.commit()
+    return count
+
+class OutboxDispatcher:
+    """Background thread that drains the outbox for this worker process"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='outbox-dispatcher', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self.start()
+        self._event.set()
+
+    def _run(self):
+        while True:
+            self._event.clear()
+            try:
+                with app.app_context():
+                    # Keep draining while full batches come back
+                    while dispatch_due() >= BATCH_SIZE:
+                        pass
+            except Exception as e:
+                logger.error(f"Outbox dispatcher error: {e}")
+            self._event.wait(POLL_INTERVAL)
+
+dispatcher = OutboxDispatcher()
+
+@app.before_request
+def _ensure_dispatcher():
+    # Picks up messages left pending by a previous process
+    dispatcher.start()
+
+@app.cli.command('dispatch-outbox')
+def dispatch_outbox_command():
+    """Send every message that is currently due"""
+    total = 0
+    while True:
+        claimed = dispatch_due()
+        total += claimed
+        if claimed < BATCH_SIZE:
+            break
+    print(f"Dispatched {total} outbox messages")
+
+@app.cli.command('requeue-outbox')
+@click.option('--id', 'ids', multiple=True, type=int, help='Only these dead-lettered messages (default: all of them)')
+def requeue_outbox_command(ids):
+    """Give dead-lettered outbox messages a fresh set of attempts"""
+    print(f"Requeued {requeue_dead(list(ids) or None)} dead-lettered outbox messages")
@@ -0,0 +1,234 @@
+import os
+import logging
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import text
+from sqlalchemy.schema import AddConstraint
+from app import app, db
+import scheduler
+
+logger = logging.getLogger(__name__)
+
+# Tables that can be range partitioned by month, and their partition key
+PARTITIONED_TABLES = {
+    'whatsapp_messages': 'received_at',
+    'notification_logs': 'created_at',
+}
+MONTHS_AHEAD = int(os.environ.get('PARTITION_MONTHS_AHEAD', '3'))
+# How often the scheduler thread makes sure the upcoming partitions exist
+CHECK_INTERVAL = timedelta(hours=6)
+
+def is_postgres():
+    return db.engine.dialect.name == 'postgresql'
+
+def month_start(value):
+    return datetime(value.year, value.month, 1)
+
+def add_months(value, months):
+    index = value.year * 12 + value.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def partition_name(table, start):
+    return f'{table}_{start:%Y_%m}'
+
+def is_partitioned(conn, table):
+    return bool(conn.execute(
+        text('SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))'),
+        {'table': table}
+    ).scalar())
+
+def partitions(conn, table):
+    """(name, start) of each monthly partition, oldest first; the default partition is left out"""
+    names = conn.execute(text(
+        'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+        'WHERE i.inhparent = to_regclass(:table) ORDER BY c.relname'
+    ), {'table': table}).scalars()
+    result = []
+    for name in names:
+        try:
+            result.append((name, datetime.strptime(name[len(table) + 1:], '%Y_%m')))
+        except ValueError:
+            continue
+    return result
+
+def default_partition(conn, table):
+    """Name of the table's default partition, or None"""
+    name = f'{table}_default'
+    return name if conn.execute(text('SELECT to_regclass(:name) IS NOT NULL'), {'name': name}).scalar() else None
+
+def create_partitions(conn, table, start, end):
+    """Create the monthly partitions covering [start, end); returns the names created.
+
+    PostgreSQL refuses a partition for a month the default partition already
+    holds rows of, so those rows are moved into the new partition first,
+    which is then attached.
+    """
+    existing = {name for name, _ in partitions(conn, table)}
+    key = PARTITIONED_TABLES[table]
+    default = default_partition(conn, table)
+    created = []
+    month = month_start(start)
+    while month < end:
+        name = partition_name(table, month)
+        bounds = f"FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+        if name not in existing:
+            stranded = default and conn.execute(
+                text(f'SELECT EXISTS (SELECT 1 FROM {default} WHERE {key} >= :start AND {key} < :end)'),
+                {'start': month, 'end': add_months(month, 1)}
+            ).scalar()
+            if stranded:
+                conn.execute(text(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'))
+                moved = conn.execute(text(
+                    f'WITH moved AS (DELETE FROM {default} WHERE {key} >= :start AND {key} < :end RETURNING *) '
+                    f'INSERT INTO {name} SELECT * FROM moved'
+                ), {'start': month, 'end': add_months(month, 1)}).rowcount
+                conn.execute(text(f'ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES {bounds}'))
+                logger.info(f"Moved {moved} rows from {default} into {name}")
+            else:
+                conn.execute(text(f'CREATE TABLE {name} PARTITION OF {table} FOR VALUES {bounds}'))
+            created.append(name)
+        month = add_months(month, 1)
+    return created
+
+def ensure_partitions(months_ahead=MONTHS_AHEAD):
+    """Create this month's and the next `months_ahead` months' partitions.
+
+    Runs from `flask init-db`, `flask create-partitions` and every worker's
+    scheduler thread (ensure_partitions_if_due); a no-op on SQLite and for
+    tables that were never converted. Rows outside every partition land in
+    the default partition, so a missed run never rejects inserts, and are
+    moved out once their month's partition is created.
+    """
+    if not is_postgres():
+        return {}
+    created = {}
+    this_month = month_start(datetime.utcnow())
+    with db.engine.begin() as conn:
+        # Every worker's scheduler runs this; only one creates partitions at a time
+        conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('ensure_partitions'))"))
+        for table in PARTITIONED_TABLES:
+            if is_partitioned(conn, table):
+                # Months that only exist in the default partition get theirs too, so
+                # their rows can be archived and dropped by month
+                default = default_partition(conn, table)
+                stranded_from = default and conn.execute(
+                    text(f'SELECT min({PARTITIONED_TABLES[table]}) FROM {default}')
+                ).scalar()
+                start = min(month_start(stranded_from), this_month) if stranded_from else this_month
+                created[table] = create_partitions(conn, table, start, add_months(this_month, months_ahead + 1))
+                for name in created[table]:
+                    logger.info(f"Created partition {name}")
+    return created
+
+@scheduler.periodic('Partition upkeep')
+def ensure_partitions_if_due(now=None):
+    """Create upcoming partitions from the scheduler thread; off on SQLite"""
+    if not is_postgres():
+        return None
+    ensure_partitions()
+    return (now or datetime.utcnow()) + CHECK_INTERVAL
+
+def convert_table(table, months_ahead=MONTHS_AHEAD):
+    """Rebuild a plain table as a partitioned one, in a single transaction.
+
+    The rows are copied into monthly partitions, so this holds an exclusive
+    lock for as long as the copy takes: run it in a maintenance window.
+    Partitioned tables can only enforce uniqueness together with the
+    partition key, so the primary key becomes (id, key) and
+    whatsapp_messages.message_id is unique per received_at.
+    """
+    model_table = db.metadata.tables[table]
+    key = PARTITIONED_TABLES[table]
+    legacy = f'{table}_unpartitioned'
+    columns = ', '.join(column.name for column in model_table.columns)
+
+    with db.engine.begin() as conn:
+        if is_partitioned(conn, table):
+            return False
+        conn.execute(text(f'LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE'))
+        oldest = conn.execute(text(f'SELECT min({key}) FROM {table}')).scalar()
+        sequence = conn.execute(text('SELECT pg_get_serial_sequence(:table, :column)'),
+                                {'table': table, 'column': 'id'}).scalar()
+        if not sequence:
+            raise RuntimeError(f'{table}.id is not a serial column')
+
+        conn.execute(text(f'ALTER TABLE {table} RENAME TO {legacy}'))
+        conn.execute(text(f'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE ({key})'))
+        conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {key} SET DEFAULT (now() AT TIME ZONE 'utc')"))
+        conn.execute(text(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT'))
+        this_month = month_start(datetime.utcnow())
+        create_partitions(conn, table, min(oldest or this_month, this_month), add_months(this_month, months_ahead + 1))
+
+        # Rows without a timestamp go with the oldest ones
+        select_columns = ', '.join(
+            f'COALESCE({column.name}, :oldest)' if column.name == key else column.name
+            for column in model_table.columns
+        )
+        conn.execute(text(f'INSERT INTO {table} ({columns}) SELECT {select_columns} FROM {legacy}'),
+                     {'oldest': oldest or this_month})
+        conn.execute(text(f'ALTER SEQUENCE {sequence} OWNED BY {table}.id'))
+        conn.execute(text(f'DROP TABLE {legacy}'))
+
+        # Constraints and indexes are built once, after the copy
+        conn.execute(text(f'ALTER TABLE {table} ADD PRIMARY KEY (id, {key})'))
+        for column in model_table.columns:
+            if column.unique:
+                conn.execute(text(f'ALTER TABLE {table} ADD CONSTRAINT {table}_{column.name}_{key}_key UNIQUE ({column.name}, {key})'))
+        for constraint in model_table.foreign_key_constraints:
+            conn.execute(AddConstraint(constraint))
+        for index in model_table.indexes:
+            index.create(bind=conn)
+    logger.info(f"Partitioned {table} by month on {key}")
+    return True
+
+def expired_partitions(conn, table, cutoff):
+    """Monthly partitions whose whole range is older than `cutoff`, as (name, start, end)"""
+    return [
+        (name, start, add_months(start, 1))
+        for name, start in partitions(conn, table)
+        if add_months(start, 1) <= cutoff
+    ]
+
+def drop_partition(table, name, keep=False):
+    """Detach a partition (cheap, unlike deleting its rows) and drop it unless `keep`"""
+    with db.engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE {table} DETACH PARTITION {name}'))
+        if not keep:
+            conn.execute(text(f'DROP TABLE {name}'))
+    logger.info(f"{'Detached' if keep else 'Dropped'} partition {name}")
+
+@app.cli.command('partition-tables')
+@click.option('--table', 'tables', multiple=True, type=click.Choice(sorted(PARTITIONED_TABLES)), help='Limit to these tables')
+@click.option('--months-ahead', default=MONTHS_AHEAD, show_default=True, help='Future monthly partitions to create')
+def partition_tables_command(tables, months_ahead):
+    """Convert the message history tables to monthly range partitions (PostgreSQL only)"""
+    if not is_postgres():
+        print("Partitioning needs PostgreSQL; SQLite databases stay unpartitioned")
+        return
+    for table in tables or PARTITIONED_TABLES:
+        converted = convert_table(table, months_ahead)
+        print(f"{table}: {'partitioned' if converted else 'already partitioned'}")
+
+@app.cli.command('create-partitions')
+@click.option('--months-ahead', default=MONTHS_AHEAD, show_default=True, help='Future monthly partitions to create')
+def create_partitions_command(months_ahead):
+    """Create upcoming monthly partitions"""
+    for table, created in ensure_partitions(months_ahead).items():
+        print(f"{table}: created {', '.join(created) if created else 'nothing'}")
+
+@app.cli.command('detach-partitions')
+@click.argument('table', type=click.Choice(sorted(PARTITIONED_TABLES)))
+@click.option('--before', required=True, type=click.DateTime(formats=['%Y-%m']), help='Detach the months before this one (YYYY-MM)')
+@click.option('--keep', is_flag=True, help='Leave the detached partitions as standalone tables instead of dropping them')
+def detach_partitions_command(table, before, keep):
+    """Drop whole months of history without a row-by-row delete (see also archive-old-rows)"""
+    if not is_postgres():
+        print("Partitioning needs PostgreSQL")
+        return
+    with db.engine.connect() as conn:
+        expired = expired_partitions(conn, table, before)
+    for name, _, _ in expired:
+        drop_partition(table, name, keep)
+        print(f"{'Detached' if keep else 'Dropped'} {name}")
+    if not expired:
+        print("Nothing to detach")
@@ -0,0 +1,150 @@
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+class RetryPolicy:
+    """How often and how patiently a stage retries a failing job"""
+
+    def __init__(self, max_attempts=3, base_delay=1.0, max_delay=30.0, retry_on=(Exception,)):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = retry_on
+
+    def delay_for(self, attempt):
+        """Exponential backoff with full jitter for the given (1-based) attempt"""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, delay)
+
+class StageStats:
+    """Thread-safe latency and outcome counters for one stage"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.in_flight = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_seconds = 0.0
+
+    def record(self, field, delta=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + delta)
+
+    def observe(self, seconds):
+        with self._lock:
+            self.total_seconds += seconds
+            self.last_seconds = seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def snapshot(self):
+        with self._lock:
+            completed = self.succeeded + self.failed
+            return {
+                'queued': self.queued,
+                'in_flight': self.in_flight,
+                'succeeded': self.succeeded,
+                'failed': self.failed,
+                'retries': self.retries,
+                'avg_seconds': self.total_seconds / completed if completed else 0.0,
+                'max_seconds': self.max_seconds,
+                'last_seconds': self.last_seconds,
+            }
+
+class Stage:
+    """A named pool of background workers that run jobs inside the Flask app context"""
+
+    def __init__(self, name, workers=2, retry_policy=None, on_failure=None):
+        self.name = name
+        self.workers = workers
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.on_failure = on_failure
+        self.stats = StageStats()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Threads are only started on first use so importing the app stays cheap
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix=f"stage-{self.name}"
+                )
+            return self._executor
+
+    def submit(self, func, *args, **kwargs):
+        """Queue a job; it is retried according to the stage's retry policy"""
+        self.stats.record('queued')
+        return self._get_executor().submit(self._run, func, args, kwargs)
+
+    def _run(self, func, args, kwargs):
+        from app import app
+
+        self.stats.record('queued', -1)
+        self.stats.record('in_flight')
+        started = time.perf_counter()
+        attempt = 0
+        try:
+            while True:
+                attempt += 1
+                try:
+                    with app.app_context():
+                        result = func(*args, **kwargs)
+                    self.stats.record('succeeded')
+                    return result
+                except self.retry_policy.retry_on as e:
+                    if attempt >= self.retry_policy.max_attempts:
+                        logger.error(f"Stage {self.name}: {func.__name__} failed after {attempt} attempts: {e}")
+                        self.stats.record('failed')
+                        self._handle_failure(func, args, kwargs, e)
+                        return None
+                    delay = self.retry_policy.delay_for(attempt)
+                    logger.warning(f"Stage {self.name}: {func.__name__} attempt {attempt} failed ({e}), retrying in {delay:.1f}s")
+                    self.stats.record('retries')
+                    time.sleep(delay)
+        finally:
+            self.stats.record('in_flight', -1)
+            self.stats.observe(time.perf_counter() - started)
+
+    def _handle_failure(self, func, args, kwargs, error):
+        if not self.on_failure:
+            return
+        from app import app
+        try:
+            with app.app_context():
+                self.on_failure(func, args, kwargs, error)
+        except Exception as e:
+            logger.error(f"Stage {self.name}: failure handler raised: {e}")
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+# Registry of all stages so metrics and health checks can find them
+_stages = {}
+_stages_lock = threading.Lock()
+
+def get_stage(name, **kwargs):
+    """Return the named stage, creating it with the given options on first use"""
+    with _stages_lock:
+        stage = _stages.get(name)
+        if stage is None:
+            stage = _stages[name] = Stage(name, **kwargs)
+        return stage
+
+def all_stages():
+    return dict(_stages)
+
+def stage_stats():
+    """Snapshot of every registered stage's counters"""
+    return {name: stage.stats.snapshot() for name, stage in _stages.items()}
@@ -0,0 +1,88 @@
+import os
+import time
+import logging
+import threading
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from app import db
+from models import Admin
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on how long another worker keeps serving a changed or
+# deactivated admin; the worker that made the change drops it on commit
+TTL = float(os.environ.get('ADMIN_CACHE_TTL', '60'))
+
+class AdminPrincipal(UserMixin):
+    """The logged-in admin as requests see it: no ORM row, no session.
+
+    Views that change the account load the Admin row itself.
+    """
+
+    def __init__(self, id, username, role, active):
+        self.id = id
+        self.username = username
+        self.role = role
+        self._active = active
+
+    @property
+    def is_active(self):
+        return self._active
+
+    def __repr__(self):
+        return f'<AdminPrincipal {self.username}>'
+
+class PrincipalCache:
+    """Per-worker cache of admin principals, refreshed after `ttl` seconds"""
+
+    def __init__(self, ttl=TTL):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, admin_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(admin_id)
+        if entry and entry[1] > now:
+            return entry[0]
+        row = db.session.query(Admin.id, Admin.username, Admin.role, Admin.is_active).filter_by(id=admin_id).first()
+        principal = AdminPrincipal(row.id, row.username, row.role, bool(row.is_active)) if row else None
+        with self._lock:
+            self._entries[admin_id] = (principal, now + self.ttl)
+        return principal
+
+    def invalidate(self, admin_id=None):
+        with self._lock:
+            if admin_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(admin_id, None)
+
+cache = PrincipalCache()
+
+def load_principal(admin_id):
+    """The principal for a session's user id, or None to log the session out"""
+    principal = cache.get(admin_id)
+    if principal is None or not principal.is_active:
+        return None
+    return principal
+
+@event.listens_for(Admin, 'after_update')
+@event.listens_for(Admin, 'after_delete')
+def _admin_changed(mapper, connection, admin):
+    session = object_session(admin)
+    if session is not None:
+        session.info.setdefault('admins_changed', set()).add(admin.id)
+
+# Dropped only once the change is committed, so a concurrent request can't
+# cache the old row again in between
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_after_commit(session):
+    for admin_id in session.info.pop('admins_changed', ()):
+        cache.invalidate(admin_id)
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_after_rollback(session):
+    session.info.pop('admins_changed', None)
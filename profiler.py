@@ -0,0 +1,135 @@
+import os
+import re
+import time
+import threading
+from collections import deque, OrderedDict
+from flask import g, request, has_request_context, jsonify
+from flask_login import login_required
+from markupsafe import escape
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import app
+
+# Development/staging only: SQL_PROFILER=1 turns it on, as does running with debug
+ENABLED = os.environ.get('SQL_PROFILER', '').lower() in ('1', 'true', 'yes') or app.debug
+# An identical statement shape executed this many times in one request is an N+1 suspect
+N1_THRESHOLD = int(os.environ.get('SQL_PROFILER_N1_THRESHOLD', '3'))
+# Recent request reports kept for /_profiler
+HISTORY_SIZE = 50
+
+_WHITESPACE = re.compile(r'\s+')
+_IN_LIST = re.compile(r'IN \((?:[^()]*?)\)', re.IGNORECASE)
+_NUMBER = re.compile(r'\b\d+\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+
+_history = deque(maxlen=HISTORY_SIZE)
+_history_lock = threading.Lock()
+
+def statement_shape(statement):
+    """Normalize a statement so repeats that only differ in values group together"""
+    shape = _WHITESPACE.sub(' ', statement).strip()
+    shape = _STRING.sub('?', shape)
+    shape = _NUMBER.sub('?', shape)
+    return _IN_LIST.sub('IN (?)', shape)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_profile' in g:
+        conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not (has_request_context() and 'sql_profile' in g):
+        return
+    started_stack = conn.info.get('profile_started')
+    if not started_stack:
+        return
+    elapsed = time.perf_counter() - started_stack.pop()
+    shapes = g.sql_profile
+    shape = statement_shape(statement)
+    entry = shapes.get(shape)
+    if entry is None:
+        entry = shapes[shape] = {'count': 0, 'seconds': 0.0}
+    entry['count'] += 1
+    entry['seconds'] += elapsed
+
+def build_report(shapes):
+    total = sum(entry['count'] for entry in shapes.values())
+    seconds = sum(entry['seconds'] for entry in shapes.values())
+    suspects = [
+        {'statement': shape, 'count': entry['count'], 'ms': round(entry['seconds'] * 1000, 2)}
+        for shape, entry in shapes.items()
+        if entry['count'] >= N1_THRESHOLD and shape.upper().startswith('SELECT')
+    ]
+    suspects.sort(key=lambda suspect: suspect['count'], reverse=True)
+    return {
+        'queries': total,
+        'ms': round(seconds * 1000, 2),
+        'distinct_statements': len(shapes),
+        'n1_suspects': suspects,
+    }
+
+def _render_panel(report):
+    summary = f'{report["queries"]} queries, {report["ms"]} ms'
+    if report['n1_suspects']:
+        summary += f', {len(report["n1_suspects"])} N+1 suspect(s)'
+    rows = ''.join(
+        f'<li><strong>{suspect["count"]}&times;</strong> <code>{escape(suspect["statement"][:300])}</code></li>'
+        for suspect in report['n1_suspects']
+    )
+    suspects = f'<ul class="mb-0 mt-1">{rows}</ul>' if rows else ''
+    return (
+        '<div id="sql-profiler" class="position-fixed bottom-0 end-0 m-2 p-2 bg-dark border border-warning small" '
+        'style="z-index:2000;max-width:40rem;max-height:40vh;overflow:auto">'
+        f'<div><i class="fas fa-database"></i> {summary}</div>{suspects}</div>'
+    )
+
+def _start_profile():
+    if request.path.startswith('/static'):
+        return
+    g.sql_profile = OrderedDict()
+
+def _finish_profile(response):
+    shapes = g.pop('sql_profile', None)
+    if shapes is None:
+        return response
+    report = build_report(shapes)
+    report['path'] = request.path
+    report['method'] = request.method
+    with _history_lock:
+        _history.appendleft(report)
+
+    response.headers['X-SQL-Queries'] = str(report['queries'])
+    response.headers['X-SQL-Time-Ms'] = str(report['ms'])
+    response.headers['X-SQL-N1-Suspects'] = str(len(report['n1_suspects']))
+    if report['n1_suspects']:
+        worst = report['n1_suspects'][0]
+        app.logger.warning(
+            f"Possible N+1 on {request.method} {request.path}: {worst['count']}x {worst['statement'][:200]}"
+        )
+
+    # Debug panel on full HTML pages
+    if response.mimetype == 'text/html' and not response.direct_passthrough:
+        body = response.get_data(as_text=True)
+        if '</body>' in body:
+            response.set_data(body.replace('</body>', _render_panel(report) + '</body>', 1))
+    return response
+
+def last_reports():
+    with _history_lock:
+        return list(_history)
+
+def init_profiler():
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
+
+    @app.route('/_profiler')
+    @login_required
+    def sql_profiler_reports():
+        """Recent per-request SQL reports, newest first"""
+        return jsonify(last_reports())
+
+    app.logger.info("SQL profiler enabled")
+
+if ENABLED:
+    init_profiler()
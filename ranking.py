@@ -0,0 +1,211 @@
+# Relevance ranking of applications against their internship's requirements.
+# Each internship gets an in-memory index per worker: its vocabulary is the
+# terms of the requirements, and each completed application (CV text plus
+# cover letter) is reduced to counts of those terms once, when it is first
+# seen. A ranking request scores the whole index in one pass - TF-IDF cosine
+# similarity, vectorized with NumPy when it is installed and in plain Python
+# otherwise - and the scores are kept until the index changes.
+import os
+import re
+import math
+import hashlib
+import logging
+import threading
+import importlib.util
+from collections import Counter, OrderedDict
+import click
+from sqlalchemy import func
+from app import app, db
+from models import Application
+import cv_processing
+
+logger = logging.getLogger(__name__)
+
+# Internships whose index is kept, least recently ranked dropped first
+MAX_INDEXES = int(os.environ.get('RANKING_MAX_INDEXES', '50'))
+HAS_NUMPY = importlib.util.find_spec('numpy') is not None
+BACKFILL_BATCH_SIZE = 50
+
+# Keeps c++, c#, node.js and .net-style terms whole
+TOKEN_PATTERN = re.compile(r'[a-z0-9+#][a-z0-9+#.]*[a-z0-9+#]|[a-z0-9]')
+STOPWORDS = frozenset('''
+    a an and are as at be by can etc for from have has in is it of on or our should the their this to
+    we will with you your able ability must strong good excellent knowledge experience skills skill
+    understanding including plus least year years work working candidate candidates required preferred
+'''.split())
+ONE_LETTER_TERMS = frozenset('cr')
+
+def tokenize(text):
+    terms = []
+    for token in TOKEN_PATTERN.findall((text or '').lower()):
+        token = token.rstrip('.')
+        if token in STOPWORDS or (len(token) == 1 and token not in ONE_LETTER_TERMS) or token.isdigit():
+            continue
+        terms.append(token)
+    return terms
+
+def _fingerprint(requirements):
+    return hashlib.sha1((requirements or '').encode()).hexdigest()
+
+class InternshipIndex:
+    """Requirement-term counts of one internship's completed applications, in CSR layout.
+
+    Row i is application ids[i]; its terms are columns[offsets[i]:offsets[i + 1]]
+    with counts[...] occurrences, columns indexing `terms`.
+    """
+
+    def __init__(self, internship_id, requirements):
+        self.internship_id = internship_id
+        self.fingerprint = _fingerprint(requirements)
+        query_counts = Counter(tokenize(requirements))
+        self.terms = sorted(query_counts)
+        self.columns_by_term = {term: column for column, term in enumerate(self.terms)}
+        self.query_counts = [query_counts[term] for term in self.terms]
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.ids = []
+        self.offsets = [0]
+        self.columns = []
+        self.counts = []
+        self.high_water = 0
+        self.with_text = 0
+        self._scores = None
+
+    def add(self, application_id, cv_text, cover_letter):
+        text = f'{cv_text or ""}\n{cover_letter or ""}'
+        counts = Counter(column for column in map(self.columns_by_term.get, tokenize(text)) if column is not None)
+        self.ids.append(application_id)
+        self.with_text += cv_text is not None
+        self.columns.extend(counts)
+        self.counts.extend(counts.values())
+        self.offsets.append(len(self.columns))
+        self.high_water = max(self.high_water, application_id)
+        self._scores = None
+
+    def scores(self):
+        """{application id: cosine similarity to the requirements, 0..1}"""
+        if self._scores is None:
+            compute = _scores_numpy if HAS_NUMPY else _scores_python
+            self._scores = dict(zip(self.ids, compute(self))) if self.terms else dict.fromkeys(self.ids, 0.0)
+        return self._scores
+
+def _scores_numpy(index):
+    import numpy as np
+    rows = len(index.ids)
+    if not rows:
+        return []
+    columns = np.asarray(index.columns, dtype=np.int64)
+    counts = np.asarray(index.counts, dtype=np.float64)
+    row_of = np.repeat(np.arange(rows), np.diff(np.asarray(index.offsets)))
+    document_frequency = np.bincount(columns, minlength=len(index.terms))
+    idf = np.log((1 + rows) / (1 + document_frequency)) + 1
+    query = (1 + np.log(np.asarray(index.query_counts, dtype=np.float64))) * idf
+    weights = (1 + np.log(counts)) * idf[columns] if len(columns) else counts
+    dots = np.bincount(row_of, weights * query[columns], minlength=rows)
+    norms = np.sqrt(np.bincount(row_of, weights * weights, minlength=rows)) * np.linalg.norm(query)
+    return np.divide(dots, norms, out=np.zeros(rows), where=norms > 0).tolist()
+
+def _scores_python(index):
+    rows = len(index.ids)
+    document_frequency = Counter(index.columns)
+    idf = [math.log((1 + rows) / (1 + document_frequency[column])) + 1 for column in range(len(index.terms))]
+    query = [(1 + math.log(count)) * weight for count, weight in zip(index.query_counts, idf)]
+    query_norm = math.sqrt(sum(weight * weight for weight in query))
+    scores = []
+    for row in range(rows):
+        dot = norm = 0.0
+        for position in range(index.offsets[row], index.offsets[row + 1]):
+            column = index.columns[position]
+            weight = (1 + math.log(index.counts[position])) * idf[column]
+            dot += weight * query[column]
+            norm += weight * weight
+        scores.append(dot / (math.sqrt(norm) * query_norm) if norm else 0.0)
+    return scores
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+def _completed(internship_id):
+    return db.session.query(Application.id, Application.cv_text, Application.cover_letter).filter(
+        Application.internship_id == internship_id,
+        Application.conversation_state == 'completed'
+    )
+
+def _index_for(internship):
+    with _indexes_lock:
+        index = _indexes.get(internship.id)
+        if index is None or index.fingerprint != _fingerprint(internship.requirements):
+            index = _indexes[internship.id] = InternshipIndex(internship.id, internship.requirements)
+        _indexes.move_to_end(internship.id)
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+        return index
+
+def _refresh(index):
+    """Add applications completed since the last call; rebuild when rows went
+    away, an older row became complete or CV text was backfilled meanwhile.
+    """
+    total, newest, with_text = db.session.query(
+        func.count(Application.id), func.max(Application.id), func.count(Application.cv_text)
+    ).filter(
+        Application.internship_id == index.internship_id,
+        Application.conversation_state == 'completed'
+    ).one()
+    if (total, newest or 0, with_text) == (len(index.ids), index.high_water, index.with_text):
+        return
+    for row in _completed(index.internship_id).filter(Application.id > index.high_water).order_by(Application.id):
+        index.add(*row)
+    if (len(index.ids), index.with_text) != (total, with_text):
+        logger.info(f"Rebuilding the ranking index of internship {index.internship_id}")
+        index.clear()
+        for row in _completed(index.internship_id).order_by(Application.id):
+            index.add(*row)
+
+def scores(internship):
+    """{application id: relevance 0..1} for the internship's completed applications"""
+    index = _index_for(internship)
+    with index.lock:
+        _refresh(index)
+        return index.scores()
+
+def invalidate(internship_id=None):
+    with _indexes_lock:
+        if internship_id is None:
+            _indexes.clear()
+        else:
+            _indexes.pop(internship_id, None)
+
+def backfill_cv_text(batch_size=BACKFILL_BATCH_SIZE):
+    """Extract the text of stored CVs that predate cv_text; returns how many were filled in"""
+    filled = 0
+    last_id = 0
+    while True:
+        rows = db.session.query(Application.id, Application.cv_filename).filter(
+            Application.id > last_id,
+            Application.cv_filename.isnot(None),
+            Application.cv_text.is_(None)
+        ).order_by(Application.id).limit(batch_size).all()
+        if not rows:
+            return filled
+        for application_id, cv_filename in rows:
+            path = os.path.join(app.config['UPLOAD_FOLDER'], cv_filename)
+            if not os.path.exists(path):
+                continue
+            try:
+                text = cv_processing.run_in_pool(cv_processing.extract_text, path)
+            except Exception as e:
+                logger.warning(f"Could not extract the CV text of application {application_id}: {e}")
+                continue
+            # Empty rather than NULL, so scanned CVs aren't tried again
+            Application.query.filter_by(id=application_id).update({'cv_text': text or ''}, synchronize_session=False)
+            filled += 1
+        db.session.commit()
+        last_id = rows[-1].id
+
+@app.cli.command('backfill-cv-text')
+@click.option('--batch-size', default=BACKFILL_BATCH_SIZE, show_default=True, help='CVs extracted per transaction')
+def backfill_cv_text_command(batch_size):
+    """Extract the text of CVs received before relevance ranking, so they can be ranked"""
+    print(f"Extracted the text of {backfill_cv_text(batch_size)} CVs")
@@ -0,0 +1,293 @@
+import os
+import gzip
+import json
+import time
+import logging
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import select, delete
+from app import app, db
+from models import WhatsAppMessage, NotificationLog
+import partitioning
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archives')
+BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', '1000'))
+# Pause between batches so other writers get the table in between
+BATCH_PAUSE = float(os.environ.get('RETENTION_BATCH_PAUSE', '0.1'))
+DELETE_CHUNK = 500
+# Index files cover this many consecutive key values each
+INDEX_BUCKET_SIZE = 1000
+INDEX_DIR = 'index'
+
+class RetentionPolicy:
+    """How long rows of one table stay in the database before being archived"""
+
+    def __init__(self, model, time_column, days, index_field=None):
+        self.model = model
+        self.table = model.__table__
+        self.name = self.table.name
+        self.time_column = self.table.c[time_column]
+        self.days = days
+        # Archive files are indexed by this field, so lookups by it open only the files that match
+        self.index_field = index_field
+
+    def cutoff(self, now=None):
+        return (now or datetime.utcnow()) - timedelta(days=self.days)
+
+POLICIES = {
+    policy.name: policy for policy in (
+        RetentionPolicy(WhatsAppMessage, 'received_at', int(os.environ.get('RETENTION_WHATSAPP_MESSAGES_DAYS', '90'))),
+        RetentionPolicy(NotificationLog, 'created_at', int(os.environ.get('RETENTION_NOTIFICATION_LOGS_DAYS', '180')),
+                        index_field='application_id'),
+    )
+}
+
+def _serialize(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def archive_path(name, month, first_id, last_id):
+    return os.path.join(ARCHIVE_DIR, name, month, f'{name}-{first_id:010d}-{last_id:010d}.jsonl.gz')
+
+def write_archive_file(path, rows):
+    """Write rows as gzip JSONL, atomically: readers never see a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+            for row in rows:
+                archive.write(json.dumps({key: _serialize(value) for key, value in row.items()}).encode() + b'\n')
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+
+def index_path(name, field, value):
+    return os.path.join(ARCHIVE_DIR, name, INDEX_DIR, field, f'{value // INDEX_BUCKET_SIZE:08d}.jsonl')
+
+def index_archive_file(policy, path, rows):
+    """Record which index field values `path` holds.
+
+    Appended after the archive file is written and before the rows are
+    deleted; a crash in between only leaves a duplicate entry behind.
+    """
+    if not policy.index_field:
+        return
+    relative = os.path.relpath(path, os.path.join(ARCHIVE_DIR, policy.name))
+    buckets = {}
+    for value in sorted({row[policy.index_field] for row in rows if row[policy.index_field] is not None}):
+        buckets.setdefault(index_path(policy.name, policy.index_field, value), []).append(value)
+    for bucket, values in buckets.items():
+        os.makedirs(os.path.dirname(bucket), exist_ok=True)
+        with open(bucket, 'a') as index:
+            index.write(''.join(json.dumps({policy.index_field: value, 'file': relative}) + '\n' for value in values))
+
+def write_archive(policy, month, rows):
+    path = archive_path(policy.name, month, rows[0]['id'], rows[-1]['id'])
+    write_archive_file(path, rows)
+    index_archive_file(policy, path, rows)
+
+def archive_batch(policy, cutoff, batch_size=BATCH_SIZE):
+    """Archive and delete one batch of rows older than `cutoff`; returns the row count.
+
+    The file is written before the rows are deleted, so a crash in between
+    only means the same rows are archived again next run (readers skip
+    duplicate ids).
+    """
+    table = policy.table
+    rows = db.session.execute(
+        select(table).where(policy.time_column < cutoff).order_by(table.c.id).limit(batch_size)
+    ).mappings().all()
+    if not rows:
+        return 0
+
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(row[policy.time_column.name].strftime('%Y-%m'), []).append(row)
+    for month, month_rows in by_month.items():
+        write_archive(policy, month, month_rows)
+
+    ids = [row['id'] for row in rows]
+    for start in range(0, len(ids), DELETE_CHUNK):
+        db.session.execute(delete(table).where(table.c.id.in_(ids[start:start + DELETE_CHUNK])))
+    db.session.commit()
+    return len(rows)
+
+def archive_expired_partitions(policy, cutoff, batch_size=BATCH_SIZE):
+    """On a partitioned table, archive whole months past the cutoff and drop
+    their partitions instead of deleting the rows one batch at a time"""
+    if not partitioning.is_postgres():
+        return 0
+    with db.engine.connect() as conn:
+        if not partitioning.is_partitioned(conn, policy.name):
+            return 0
+        expired = partitioning.expired_partitions(conn, policy.name, cutoff)
+
+    table = policy.table
+    total = 0
+    for name, start, end in expired:
+        last_id = 0
+        while True:
+            rows = db.session.execute(
+                select(table)
+                .where(policy.time_column >= start, policy.time_column < end, table.c.id > last_id)
+                .order_by(table.c.id).limit(batch_size)
+            ).mappings().all()
+            if not rows:
+                break
+            write_archive(policy, f'{start:%Y-%m}', rows)
+            last_id = rows[-1]['id']
+            total += len(rows)
+        # End the read transaction first: detaching needs an exclusive lock on the parent
+        db.session.commit()
+        partitioning.drop_partition(policy.name, name)
+    return total
+
+def count_expired(policy, now=None):
+    return db.session.query(db.func.count(policy.table.c.id)).filter(policy.time_column < policy.cutoff(now)).scalar()
+
+def run_retention(names=None, batch_size=BATCH_SIZE, max_batches=None):
+    """Archive everything past its retention window; returns rows archived per table"""
+    archived = {}
+    for name in names or POLICIES:
+        policy = POLICIES[name]
+        cutoff = policy.cutoff()
+        total = archive_expired_partitions(policy, cutoff, batch_size)
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            count = archive_batch(policy, cutoff, batch_size)
+            if not count:
+                break
+            total += count
+            batches += 1
+            if BATCH_PAUSE:
+                time.sleep(BATCH_PAUSE)
+        archived[name] = total
+        if total:
+            logger.info(f"Archived {total} {name} rows older than {cutoff:%Y-%m-%d}")
+    return archived
+
+def _month_dirs(name, since=None, until=None):
+    root = os.path.join(ARCHIVE_DIR, name)
+    if not os.path.isdir(root):
+        return []
+    months = sorted(entry for entry in os.listdir(root)
+                    if entry != INDEX_DIR and os.path.isdir(os.path.join(root, entry)))
+    if since:
+        months = [month for month in months if month >= since.strftime('%Y-%m')]
+    if until:
+        months = [month for month in months if month <= until.strftime('%Y-%m')]
+    return [os.path.join(root, month) for month in months]
+
+def _indexed_files(policy, value):
+    """Archive files holding rows with index_field == value, or None when the table has no index"""
+    bucket = index_path(policy.name, policy.index_field, value)
+    if not os.path.isdir(os.path.dirname(bucket)):
+        return None
+    files = set()
+    if os.path.exists(bucket):
+        with open(bucket) as index:
+            for line in index:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn write from a crash mid-append
+                    continue
+                if entry[policy.index_field] == value:
+                    files.add(entry['file'])
+    return files
+
+def _archive_files(policy, since, until, equals):
+    """Paths of the archive files that may hold matching rows, oldest month first"""
+    indexed = None
+    if policy.index_field and isinstance(equals.get(policy.index_field), int):
+        indexed = _indexed_files(policy, equals[policy.index_field])
+    for month_dir in _month_dirs(policy.name, since, until):
+        month = os.path.basename(month_dir)
+        for filename in sorted(os.listdir(month_dir)):
+            if filename.endswith('.jsonl.gz') and (indexed is None or os.path.join(month, filename) in indexed):
+                yield os.path.join(month_dir, filename)
+
+def search_archive(name, since=None, until=None, limit=None, **equals):
+    """Archived rows of one table, oldest month first, filtered by time range and exact field values.
+
+    Only the month directories that overlap the time range are opened, and
+    of those only the files the index lists when filtering on the table's
+    index field.
+    """
+    policy = POLICIES[name]
+    time_field = policy.time_column.name
+    seen = set()
+    results = []
+    for path in _archive_files(policy, since, until, equals):
+        with gzip.open(path, 'rt') as archive:
+            for line in archive:
+                row = json.loads(line)
+                if row['id'] in seen:
+                    continue
+                timestamp = row.get(time_field)
+                if since and timestamp and timestamp < since.isoformat():
+                    continue
+                if until and timestamp and timestamp > until.isoformat():
+                    continue
+                if any(row.get(field) != value for field, value in equals.items()):
+                    continue
+                seen.add(row['id'])
+                results.append(row)
+                if limit and len(results) >= limit:
+                    return results
+    return results
+
+@app.cli.command('archive-old-rows')
+@click.option('--table', 'tables', multiple=True, type=click.Choice(sorted(POLICIES)), help='Limit to these tables')
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True, help='Rows archived and deleted per transaction')
+@click.option('--dry-run', is_flag=True, help='Only report how many rows are past their retention window')
+def archive_old_rows_command(tables, batch_size, dry_run):
+    """Move rows past their retention window into gzip JSONL archives"""
+    for name in tables or POLICIES:
+        policy = POLICIES[name]
+        if dry_run:
+            print(f"{name}: {count_expired(policy)} rows older than {policy.days} days")
+    if not dry_run:
+        for name, count in run_retention(list(tables) or None, batch_size).items():
+            print(f"{name}: archived {count} rows")
+
+def rebuild_index(policy):
+    """Index every archive file of a table from scratch; returns how many files were read"""
+    index_dir = os.path.join(ARCHIVE_DIR, policy.name, INDEX_DIR, policy.index_field)
+    if os.path.isdir(index_dir):
+        for filename in os.listdir(index_dir):
+            os.remove(os.path.join(index_dir, filename))
+    os.makedirs(index_dir, exist_ok=True)
+    files = 0
+    for month_dir in _month_dirs(policy.name):
+        for filename in sorted(os.listdir(month_dir)):
+            if not filename.endswith('.jsonl.gz'):
+                continue
+            path = os.path.join(month_dir, filename)
+            with gzip.open(path, 'rt') as archive:
+                index_archive_file(policy, path, [json.loads(line) for line in archive])
+            files += 1
+    return files
+
+@app.cli.command('index-archive')
+def index_archive_command():
+    """Rebuild the archive indexes; run once for archives written before they were indexed"""
+    for policy in POLICIES.values():
+        if policy.index_field:
+            print(f"{policy.name}: indexed {rebuild_index(policy)} files by {policy.index_field}")
+
+@app.cli.command('search-archive')
+@click.argument('table', type=click.Choice(sorted(POLICIES)))
+@click.option('--since', type=click.DateTime(), help='Earliest timestamp')
+@click.option('--until', type=click.DateTime(), help='Latest timestamp')
+@click.option('--where', 'conditions', multiple=True, help='field=value filter, e.g. --where application_id=42')
+@click.option('--limit', type=int, help='Stop after this many rows')
+def search_archive_command(table, since, until, conditions, limit):
+    """Print archived rows as JSON lines"""
+    equals = {}
+    for condition in conditions:
+        field, _, value = condition.partition('=')
+        equals[field] = int(value) if value.isdigit() else value
+    for row in search_archive(table, since, until, limit, **equals):
+        print(json.dumps(row))
@@ -2,17 +2,33 @@ import os
 import csv
 import zipfile
 from io import StringIO
-from datetime import datetime
-from flask import render_template, request, redirect, url_for, flash, jsonify, send_file, current_app
+from datetime import datetime, timedelta
+from flask import Response, render_template, request, redirect, url_for, flash, jsonify, send_file, current_app, abort
 from flask_login import login_user, logout_user, login_required, current_user
+from sqlalchemy.orm import joinedload
+from flask_sqlalchemy.pagination import Pagination
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import RequestEntityTooLarge
 from app import app, db
 import os
-from models import Admin, Internship, Application, NotificationLog, SystemSettings
+from models import Admin, Internship, Application, NotificationLog, ScheduledMessage, SystemSettings
 from utils import allowed_file, save_uploaded_file
 from communication import send_whatsapp_message, send_email, send_sms
 import whatsapp_handler
+from pipeline import stage_stats
+from outbox import queue_whatsapp
+from delivery_status import record_status, delivery_summary
+from status_updates import VALID_STATUSES, change_status, bulk_update_status, batch_progress
+from funnel import FUNNEL_STAGES, funnel_rows
+from retention import search_archive
+import live_events
+import thumbnails
+import ranking
+import identities
+import scheduler
+import metrics  # noqa: F401  (request instrumentation and /metrics)
+import profiler  # noqa: F401  (SQL profiler when SQL_PROFILER=1)
+import schema  # noqa: F401  (flask init-db)
 
 def auto_deactivate_expired_internships():
     """Automatically stop accepting applications for internships that have passed their deadline"""
@@ -41,9 +57,21 @@ def auto_deactivate_expired_internships():
 def cleanup_incomplete_applications():
     """Remove incomplete applications from database to keep admin dashboard clean"""
     try:
-        # Delete applications that are not completed (incomplete conversation state)
+        # Delete applications that are not completed (incomplete conversation state),
+        # leaving alone the ones whose CV is still being fetched in the background
+        # and the ones with a nudge still scheduled or recently sent (the
+        # applicant may be replying to it)
+        nudged_since = datetime.utcnow() - scheduler.NUDGE_AFTER
         incomplete_apps = Application.query.filter(
-            Application.conversation_state != 'completed'
+            Application.conversation_state.notin_(['completed', 'processing_cv']),
+            ~db.exists().where(
+                ScheduledMessage.application_id == Application.id,
+                ScheduledMessage.kind == 'nudge',
+                db.or_(
+                    ScheduledMessage.status == 'pending',
+                    db.and_(ScheduledMessage.status == 'queued', ScheduledMessage.released_at >= nudged_since)
+                )
+            )
         ).all()
         
         if incomplete_apps:
@@ -72,7 +100,9 @@ def health_check():
             'admins': admin_count,
             'internships': internship_count,
             'version': '1.0.0',
-            'webhook_url': f"{request.url_root}webhook/whatsapp"
+            'webhook_url': f"{request.url_root}webhook/whatsapp",
+            'status_callback_url': f"{request.url_root}webhook/whatsapp/status",
+            'pipeline': stage_stats()
         }), 200
     except Exception as e:
         return jsonify({
@@ -118,16 +148,50 @@ def dashboard():
     # Clean up incomplete applications
     cleanup_incomplete_applications()
     
-    total_internships = Internship.query.filter_by(is_active=True).count()
-    total_applications = Application.query.filter_by(conversation_state='completed').count()
-    pending_applications = Application.query.filter_by(status='pending', conversation_state='completed').count()
-    recent_applications = Application.query.filter_by(conversation_state='completed').order_by(Application.applied_at.desc()).limit(5).all()
+    recent_applications = Application.query.options(joinedload(Application.internship)).filter_by(conversation_state='completed').order_by(Application.applied_at.desc()).limit(5).all()
     
     return render_template('dashboard.html',
-                         total_internships=total_internships,
-                         total_applications=total_applications,
-                         pending_applications=pending_applications,
-                         recent_applications=recent_applications)
+                         recent_applications=recent_applications,
+                         **dashboard_counts())
+
+def dashboard_counts():
+    return {
+        'total_internships': Internship.query.filter_by(is_active=True).count(),
+        'total_applications': Application.query.filter_by(conversation_state='completed').count(),
+        'pending_applications': Application.query.filter_by(status='pending', conversation_state='completed').count(),
+    }
+
+@app.route('/api/dashboard-stats')
+@login_required
+def dashboard_stats():
+    """Dashboard card counts; main.js reloads them when its live feed (re)connects"""
+    return jsonify(dashboard_counts())
+
+@app.route('/events')
+@login_required
+def live_event_stream():
+    """Server-Sent Events feed of new applications, status changes and counter deltas"""
+    subscription = live_events.subscribe()
+    if subscription is None:
+        # The page falls back to polling /api/dashboard-stats
+        return jsonify({'error': 'Too many live streams on this worker'}), 503, {'Retry-After': '60'}
+    response = Response(live_events.stream(subscription), mimetype='text/event-stream')
+    # The generator's cleanup doesn't run if it never started
+    response.call_on_close(lambda: live_events.broker.unsubscribe(subscription))
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/analytics')
+@login_required
+def analytics():
+    """Per-internship funnels, read from the aggregates table"""
+    rows = funnel_rows()
+    funnels = [funnel for _, funnel in rows if funnel]
+    totals = {stage: sum(getattr(funnel, stage) for funnel in funnels) for stage in FUNNEL_STAGES}
+    rollups = [funnel.rolled_up_at for funnel in funnels if funnel.rolled_up_at]
+    return render_template('analytics.html', rows=rows, totals=totals,
+                         last_rollup=max(rollups) if rollups else None)
 
 # Internship management routes
 @app.route('/internships')
@@ -149,7 +213,16 @@ def internships():
     internships = query.order_by(Internship.created_at.desc()).paginate(
         page=page, per_page=10, error_out=False)
     
-    return render_template('internships.html', internships=internships, status_filter=status_filter)
+    # One grouped count for the whole page instead of a COUNT per card
+    page_ids = [internship.id for internship in internships.items]
+    application_counts = dict(
+        db.session.query(Application.internship_id, db.func.count(Application.id))
+        .filter(Application.internship_id.in_(page_ids))
+        .group_by(Application.internship_id)
+    ) if page_ids else {}
+    
+    return render_template('internships.html', internships=internships, status_filter=status_filter,
+                         application_counts=application_counts)
 
 @app.route('/internships/create', methods=['GET', 'POST'])
 @login_required
@@ -167,6 +240,7 @@ def create_internship():
             )
             
             db.session.add(internship)
+            live_events.publish_counters(total_internships=1)
             db.session.commit()
             
             flash(f'Internship created successfully! Position Code: {internship.position_code}', 'success')
@@ -213,6 +287,8 @@ def regenerate_secret(id):
 @login_required
 def deactivate_internship(id):
     internship = Internship.query.get_or_404(id)
+    if internship.is_active:
+        live_events.publish_counters(total_internships=-1)
     internship.is_active = False
     db.session.commit()
     flash('Internship deactivated successfully!', 'success')
@@ -240,26 +316,52 @@ def get_share_message(id):
     
     return jsonify({'message': share_message})
 
+class RankedPagination(Pagination):
+    """Pagination over application ids already in display order; loads only the current page"""
+
+    def _query_items(self):
+        ids = self._query_args['ids'][self._query_offset:self._query_offset + self.per_page]
+        rows = {application.id: application for application in self._query_args['query'].filter(Application.id.in_(ids))}
+        return [rows[id] for id in ids if id in rows]
+
+    def _query_count(self):
+        return len(self._query_args['ids'])
+
+def relevance_scores(internship_id):
+    """{application id: relevance 0..1} for an internship's applications, or None without one"""
+    internship = db.session.get(Internship, internship_id) if internship_id else None
+    return ranking.scores(internship) if internship else None
+
 # Application management routes
 @app.route('/shortlisted')
 @login_required
 def shortlisted_dashboard():
     """Shortlisted applicants dashboard with bulk messaging"""
     internship_id = request.args.get('internship_id', type=int)
+    sort = request.args.get('sort')
     
     # Get shortlisted applications
-    query = Application.query.filter_by(status='shortlisted')
+    query = Application.query.options(joinedload(Application.internship)).filter_by(status='shortlisted')
     
     if internship_id:
         query = query.filter_by(internship_id=internship_id)
     
     shortlisted_applications = query.order_by(Application.applied_at.desc()).all()
+    relevance = relevance_scores(internship_id) if sort == 'relevance' else None
+    if relevance is not None:
+        # Stable, so equally relevant applicants stay newest first
+        shortlisted_applications.sort(key=lambda application: relevance.get(application.id, 0.0), reverse=True)
     internships = Internship.query.filter_by(is_active=True).all()
     
     return render_template('shortlisted_dashboard.html', 
                          applications=shortlisted_applications,
                          internships=internships,
-                         current_internship_id=internship_id)
+                         current_internship_id=internship_id,
+                         current_sort=sort,
+                         relevance=relevance,
+                         also_applied=identities.other_applications(shortlisted_applications),
+                         reminder_hours=[f'{hours:g}' for hours in scheduler.INTERVIEW_REMINDER_HOURS],
+                         interview_timezone=scheduler.INTERVIEW_TIMEZONE)
 
 @app.route('/shortlisted/bulk-message', methods=['POST'])
 @login_required
@@ -276,13 +378,17 @@ def send_bulk_message():
             flash('Please select applicants and provide a message template.', 'warning')
             return redirect(url_for('shortlisted_dashboard'))
         
-        sent_count = 0
-        failed_count = 0
+        # Load every selected applicant (and their internship) in one query
+        selected_applications = Application.query.options(joinedload(Application.internship)).filter(
+            Application.id.in_([int(app_id) for app_id in application_ids]),
+            Application.status == 'shortlisted'
+        ).all()
         
-        for app_id in application_ids:
-            application = Application.query.get(app_id)
-            if not application or application.status != 'shortlisted':
-                continue
+        invitations = []
+        reminders = []
+        interview_at = scheduler.interview_datetime(interview_date, interview_time)
+        now = datetime.utcnow()
+        for application in selected_applications:
                 
             # Personalize the message
             personalized_message = message_template.format(
@@ -292,45 +398,40 @@ def send_bulk_message():
                 interview_time=interview_time or "[Time to be confirmed]", 
                 interview_location=interview_location or "[Location to be confirmed]"
             )
+            invitations.append({'channel': 'whatsapp', 'recipient': application.whatsapp_number,
+                                'message': personalized_message, 'application_id': application.id})
             
-            try:
-                from communication import send_whatsapp_message
-                send_whatsapp_message(application.whatsapp_number, personalized_message)
-                sent_count += 1
-                
-                # Log the notification
-                from communication import log_notification
-                log_notification(
-                    application.id,
-                    'whatsapp',
-                    application.whatsapp_number,
-                    personalized_message,
-                    'sent'
-                )
-                
-            except Exception as e:
-                failed_count += 1
-                current_app.logger.error(f"Failed to send message to {application.whatsapp_number}: {e}")
-                
-                # Log the failed notification
-                from communication import log_notification
-                log_notification(
-                    application.id,
-                    'whatsapp',
-                    application.whatsapp_number,
-                    personalized_message,
-                    'failed',
-                    str(e)
-                )
+            if interview_at:
+                for hours in scheduler.INTERVIEW_REMINDER_HOURS:
+                    due_at = interview_at - timedelta(hours=hours)
+                    if due_at > now:
+                        reminders.append({
+                            'channel': 'whatsapp', 'recipient': application.whatsapp_number,
+                            'application_id': application.id, 'due_at': due_at,
+                            'message': f"⏰ Reminder: your interview for **{application.internship.title}** is on "
+                                       f"{interview_date} at {interview_time}"
+                                       f"{f' ({interview_location})' if interview_location else ''}. Good luck!"
+                        })
+        
+        # Sent gradually so large batches aren't throttled; handed to the
+        # outbox (which retries failed sends) as each one comes due
+        last_at = scheduler.schedule_drip('interview_invite', invitations)
+        if interview_at:
+            # A new date replaces the reminders for an earlier one
+            scheduler.cancel([application.id for application in selected_applications], ['interview_reminder'])
+            scheduler.schedule_many('interview_reminder', reminders)
+        db.session.commit()
         
-        if sent_count > 0:
-            flash(f'✅ Successfully sent messages to {sent_count} applicants!', 'success')
-        if failed_count > 0:
-            flash(f'⚠️ Failed to send {failed_count} messages. Check logs for details.', 'warning')
+        if invitations:
+            minutes = (last_at - now).total_seconds() / 60
+            flash(f'✅ Queued messages to {len(invitations)} applicants'
+                  f'{f" (sent over the next {minutes:.0f} minutes)" if minutes >= 1 else ""}'
+                  f'{f", with {len(reminders)} interview reminders scheduled" if reminders else ""}!', 'success')
             
         return redirect(url_for('shortlisted_dashboard'))
         
     except Exception as e:
+        db.session.rollback()
         flash(f'Error sending bulk messages: {str(e)}', 'danger')
         return redirect(url_for('shortlisted_dashboard'))
 
@@ -341,12 +442,13 @@ def applications():
     internship_id = request.args.get('internship_id', type=int)
     status = request.args.get('status')
     search = request.args.get('search', '')
+    sort = request.args.get('sort')
     
     # Clean up incomplete applications first
     cleanup_incomplete_applications()
     
     # Build query for applications - ONLY show completed applications
-    query = Application.query.filter_by(conversation_state='completed')
+    query = Application.query.options(joinedload(Application.internship)).filter_by(conversation_state='completed')
     
     if internship_id:
         query = query.filter_by(internship_id=internship_id)
@@ -363,23 +465,109 @@ def applications():
             )
         )
     
-    applications = query.order_by(Application.applied_at.desc()).paginate(
-        page=page, per_page=20, error_out=False)
+    # Relevance needs an internship to rank against
+    relevance = relevance_scores(internship_id) if sort == 'relevance' else None
+    if relevance is not None:
+        ids = [id for id, in query.with_entities(Application.id).order_by(Application.applied_at.desc())]
+        ids.sort(key=lambda id: relevance.get(id, 0.0), reverse=True)
+        applications = RankedPagination(page=page, per_page=20, error_out=False, ids=ids, query=query)
+    else:
+        applications = query.order_by(Application.applied_at.desc()).paginate(
+            page=page, per_page=20, error_out=False)
     
     internships = Internship.query.filter_by(is_active=True).all()
     
+    # Current filters for the pagination links, which set their own page
+    filter_args = request.args.to_dict()
+    filter_args.pop('page', None)
+    
     return render_template('applications.html', 
                          applications=applications,
                          internships=internships,
                          current_internship_id=internship_id,
                          current_status=status,
-                         search=search)
+                         current_sort=sort,
+                         relevance=relevance,
+                         also_applied=identities.other_applications(applications.items),
+                         search=search,
+                         filter_args=filter_args)
 
 @app.route('/applications/<int:id>')
 @login_required
 def application_detail(id):
+    # Notification history is loaded on demand from application_notifications()
+    application = Application.query.options(joinedload(Application.internship)).filter_by(id=id).first_or_404()
+    other_applications = identities.other_applications([application]).get(application.id, [])
+    return render_template('application_detail.html', application=application, other_applications=other_applications)
+
+NOTIFICATION_PREVIEW_LENGTH = 100
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+@app.route('/applications/<int:id>/notifications')
+@login_required
+def application_notifications(id):
+    """One page of an application's notification history, newest first.
+
+    Returns summary columns and a short preview of each message; full bodies
+    come from application_notification_body(). Pass `before` (the previous
+    page's next_before) to get the next page.
+    """
+    application = db.session.query(Application.id, Application.applied_at).filter_by(id=id).first()
+    if application is None:
+        return jsonify({'success': False, 'error': 'Application not found'}), 404
+    per_page = max(1, min(request.args.get('per_page', 20, type=int), 100))
+    before = request.args.get('before', type=int)
+
+    query = db.session.query(
+        NotificationLog.id, NotificationLog.channel, NotificationLog.recipient, NotificationLog.status,
+        NotificationLog.error_message, NotificationLog.created_at, NotificationLog.sent_at,
+        NotificationLog.status_updated_at,
+        db.func.substr(NotificationLog.message, 1, NOTIFICATION_PREVIEW_LENGTH).label('preview'),
+        db.func.length(NotificationLog.message).label('message_length')
+    ).filter(NotificationLog.application_id == id)
+    if application.applied_at:
+        # Lets partitioned history skip the months before the application
+        query = query.filter(NotificationLog.created_at >= application.applied_at)
+    if before:
+        query = query.filter(NotificationLog.id < before)
+    rows = query.order_by(NotificationLog.id.desc()).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    return jsonify({
+        'notifications': [{
+            'id': row.id,
+            'channel': row.channel,
+            'recipient': row.recipient,
+            'status': row.status,
+            'error_message': row.error_message,
+            'created_at': _isoformat(row.created_at),
+            'sent_at': _isoformat(row.sent_at),
+            'status_updated_at': _isoformat(row.status_updated_at),
+            'preview': row.preview,
+            'truncated': (row.message_length or 0) > NOTIFICATION_PREVIEW_LENGTH,
+        } for row in rows],
+        'next_before': rows[-1].id if has_more else None,
+    })
+
+@app.route('/applications/<int:id>/notifications/<int:notification_id>')
+@login_required
+def application_notification_body(id, notification_id):
+    """Full message body of one notification"""
+    message = db.session.query(NotificationLog.message).filter_by(id=notification_id, application_id=id).first()
+    if message is None:
+        return jsonify({'success': False, 'error': 'Notification not found'}), 404
+    return jsonify({'id': notification_id, 'message': message.message})
+
+@app.route('/applications/<int:id>/notifications/archived')
+@login_required
+def archived_notifications(id):
+    """Notification history that retention moved out of the database"""
     application = Application.query.get_or_404(id)
-    return render_template('application_detail.html', application=application)
+    rows = search_archive('notification_logs', since=application.applied_at, application_id=application.id)
+    return jsonify({'application_id': application.id, 'notifications': rows})
 
 @app.route('/applications/<int:id>/cv')
 @login_required
@@ -399,55 +587,140 @@ def view_cv(id):
     download = request.args.get('download') == '1'
     return send_file(cv_path, as_attachment=download, download_name=application.cv_original_filename or 'cv.pdf')
 
+# Shown until the thumbnail has been rendered; not cached, so the next view asks again
+THUMBNAIL_PLACEHOLDER = (
+    f'<svg xmlns="http://www.w3.org/2000/svg" width="{thumbnails.WIDTH}" height="{thumbnails.WIDTH * 22 // 17}">'
+    '<rect width="100%" height="100%" fill="#e9ecef"/></svg>'
+)
+# Thumbnail URLs carry the CV's cache key, so a response never goes stale
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600
+
+@app.template_global()
+def cv_thumbnail_url(application):
+    """Thumbnail URL for the lists, or None to show the plain CV icon"""
+    if not application.cv_filename or not thumbnails.available():
+        return None
+    return url_for('cv_thumbnail', id=application.id, v=thumbnails.thumbnail_key(application.cv_filename))
+
+@app.route('/applications/<int:id>/cv/thumbnail')
+@login_required
+def cv_thumbnail(id):
+    """First page of the CV as a small PNG, so screening a list doesn't download every PDF"""
+    cv_filename = db.session.query(Application.cv_filename).filter_by(id=id).scalar()
+    if not cv_filename or not thumbnails.available():
+        abort(404)
+    key = thumbnails.thumbnail_key(cv_filename)
+    path = thumbnails.cache.get(key)
+    if path is None:
+        cv_path = os.path.join(app.config.get('UPLOAD_FOLDER', 'uploads'), cv_filename)
+        if not os.path.exists(cv_path):
+            abort(404)
+        thumbnails.request_thumbnail(key, cv_path)
+        return Response(THUMBNAIL_PLACEHOLDER, mimetype='image/svg+xml', headers={'Cache-Control': 'no-store'})
+    response = send_file(os.path.abspath(path), mimetype='image/png', max_age=THUMBNAIL_MAX_AGE)
+    response.headers['Cache-Control'] = f'private, max-age={THUMBNAIL_MAX_AGE}, immutable'
+    return response
+
 @app.route('/applications/<int:id>/update_status', methods=['POST'])
 @login_required
 def update_application_status(id):
-    application = Application.query.get_or_404(id)
-    new_status = request.form['status']
-    send_notification = request.form.get('send_notification') == 'on'
+    """Change one application's status.
+
+    Inline edits from main.js ask for JSON and get a compact response with no
+    template rendering; the detail page form gets the usual redirect.
+    """
+    wants_json = request.is_json or \
+        request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+    data = request.get_json(silent=True) if request.is_json else request.form
+    data = data or {}
+    new_status = data.get('status')
+    send_notification = data.get('send_notification') in ('on', 'true', '1', True)
+    
+    if new_status not in VALID_STATUSES:
+        error = f"Status must be one of: {', '.join(VALID_STATUSES)}"
+        if wants_json:
+            return jsonify({'success': False, 'error': error}), 400
+        flash(error, 'danger')
+        return redirect(url_for('application_detail', id=id))
     
-    old_status = application.status
-    application.status = new_status
-    application.updated_at = datetime.utcnow()
+    # The internship is only needed for the notification text
+    query = Application.query.options(joinedload(Application.internship)) if send_notification else Application.query
+    application = query.get(id)
+    if application is None:
+        if wants_json:
+            return jsonify({'success': False, 'error': 'Application not found'}), 404
+        abort(404)
     
     try:
+        changed = change_status(application, new_status, send_notification, changed_by=current_user.id)
         db.session.commit()
-        
-        if send_notification and new_status != old_status:
-            # Send personalized notification to applicant with emojis
-            if new_status == 'selected':
-                message = f"🎉 **CONGRATULATIONS {application.full_name}!** 🎉\n\n✨ We are delighted to inform you that you have been **SELECTED** for the {application.internship.title} position!\n\n🚀 This is an amazing achievement and we're excited to have you join our team!\n\n📧 Please check your email for next steps and onboarding details.\n\n🎊 Welcome aboard! 🎊"
-            elif new_status == 'rejected':
-                message = f"📧 Dear {application.full_name},\n\n😔 We regret to inform you that your application for {application.internship.title} was not successful this time.\n\n💪 Please don't be discouraged! This doesn't reflect your abilities or potential.\n\n🌟 We encourage you to:\n• Keep developing your skills\n• Apply for future opportunities with us\n• Stay connected for upcoming positions\n\n🙏 Thank you for your interest in our company. We wish you all the best in your career journey!\n\n💼 Keep pushing forward - your perfect opportunity is coming!"
-            elif new_status == 'shortlisted':
-                message = f"🎯 **Great News {application.full_name}!** 🎯\n\n✅ You have been **SHORTLISTED** for the {application.internship.title} position!\n\n📋 You've made it to the next round! This means your application stood out among many candidates.\n\n📞 **Next Steps:**\n• Keep your phone available for contact\n• Check your email regularly\n• Prepare for potential interviews\n\n🤞 Best of luck! We'll be in touch soon."
-            else:  # pending or other status
-                message = f"📋 Hello {application.full_name},\n\n📄 Your application status for **{application.internship.title}** has been updated to: **{new_status.title()}**\n\n🔍 We'll keep you informed of any changes.\n\n📧 Thank you for your patience!"
-            
-            # Send WhatsApp notification
-            try:
-                send_whatsapp_message(application.whatsapp_number, message)
-            except Exception as e:
-                current_app.logger.error(f"Failed to send WhatsApp notification: {e}")
-            
-            # Send email notification
-            try:
-                send_email(
-                    application.email,
-                    f"Application Status Update - {application.internship.title}",
-                    message
-                )
-            except Exception as e:
-                current_app.logger.error(f"Failed to send email notification: {e}")
-        
-        flash('Application status updated successfully!', 'success')
-        
     except Exception as e:
         db.session.rollback()
+        current_app.logger.error(f"Error updating status of application {id}: {e}")
+        if wants_json:
+            return jsonify({'success': False, 'error': str(e)}), 500
         flash(f'Error updating application status: {str(e)}', 'danger')
+        return redirect(url_for('application_detail', id=id))
     
+    if wants_json:
+        return jsonify({
+            'success': True,
+            'id': application.id,
+            'status': new_status,
+            'changed': changed,
+            'notified': changed and send_notification,
+        })
+    
+    flash('Application status updated successfully!', 'success')
     return redirect(url_for('application_detail', id=id))
 
+@app.route('/applications/bulk-status', methods=['POST'])
+@login_required
+def bulk_update_application_status():
+    """Change the status of many applications at once.
+
+    Accepts JSON ({"application_ids": [...], "status": ..., "send_notification": true})
+    or form data, and returns 202 with a batch id straight away; notifications
+    are delivered by the outbox dispatcher and tracked by the progress endpoint.
+    """
+    data = request.get_json(silent=True)
+    if data is None:
+        application_ids = request.form.getlist('application_ids')
+        new_status = request.form.get('status')
+        send_notification = request.form.get('send_notification') in ('on', 'true', '1')
+    else:
+        application_ids = data.get('application_ids') or []
+        new_status = data.get('status')
+        send_notification = bool(data.get('send_notification'))
+    
+    if new_status not in VALID_STATUSES:
+        return jsonify({'success': False, 'error': f"Status must be one of: {', '.join(VALID_STATUSES)}"}), 400
+    try:
+        application_ids = [int(app_id) for app_id in application_ids]
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'application_ids must be integers'}), 400
+    if not application_ids:
+        return jsonify({'success': False, 'error': 'No applications selected'}), 400
+    
+    try:
+        result = bulk_update_status(application_ids, new_status, send_notification, changed_by=current_user.id)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Bulk status update failed: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    progress_url = url_for('bulk_status_progress', batch_id=result['batch_id'])
+    return jsonify(dict(result, success=True, progress_url=progress_url)), 202, {'Location': progress_url}
+
+@app.route('/applications/bulk-status/<batch_id>')
+@login_required
+def bulk_status_progress(batch_id):
+    """Delivery progress of a bulk status update's notifications"""
+    progress = batch_progress(batch_id)
+    if progress is None:
+        return jsonify({'success': False, 'error': 'Unknown batch'}), 404
+    return jsonify(dict(progress, success=True))
+
 @app.route('/applications/export')
 @login_required
 def export_applications():
@@ -455,7 +728,7 @@ def export_applications():
     status = request.args.get('status')
     format_type = request.args.get('format', 'csv')
     
-    query = Application.query
+    query = Application.query.options(joinedload(Application.internship))
     
     if internship_id:
         query = query.filter_by(internship_id=internship_id)
@@ -572,9 +845,7 @@ def whatsapp_webhook():
         try:
             # Twilio sends form data, not JSON
             data = request.form.to_dict()
-            current_app.logger.info(f"=== TWILIO WHATSAPP WEBHOOK RECEIVED ===")
-            current_app.logger.info(f"Form data: {data}")
-            current_app.logger.info(f"Request headers: {dict(request.headers)}")
+            current_app.logger.debug(f"Twilio WhatsApp webhook received: {data}")
             
             # Convert Twilio format to our internal format
             if 'From' in data:
@@ -610,7 +881,11 @@ def whatsapp_webhook():
                                             'mime_type': media_content_type,
                                         } if 'document' in media_content_type else None,
                                         'media_url': media_url,
-                                        'media_content_type': media_content_type
+                                        'media_content_type': media_content_type,
+                                        'extra_media': [{
+                                            'url': data.get(f'MediaUrl{index}', ''),
+                                            'content_type': data.get(f'MediaContentType{index}', ''),
+                                        } for index in range(1, num_media)]
                                     }]
                                 }
                             }]
@@ -650,6 +925,46 @@ def whatsapp_webhook():
             current_app.logger.error(f"Traceback: {traceback.format_exc()}")
             return 'Error', 500, {'Content-Type': 'text/plain'}
 
+def valid_twilio_signature():
+    """Whether X-Twilio-Signature matches the request; always true without a Twilio auth token.
+
+    The WhatsApp sender uses TWILIO_AUTH_TOKEN and the SMS sender prefers the
+    token in the settings, so a signature made with either is accepted.
+    """
+    auth_tokens = {token for token in (
+        SystemSettings.get_setting('twilio_auth_token'), os.environ.get('TWILIO_AUTH_TOKEN')
+    ) if token}
+    if not auth_tokens:
+        return True
+    from twilio.request_validator import RequestValidator  # kept off the startup path
+    params = request.form.to_dict()
+    signature = request.headers.get('X-Twilio-Signature', '')
+    return any(RequestValidator(token).validate(request.url, params, signature) for token in auth_tokens)
+
+# Twilio delivery status callbacks (set TWILIO_STATUS_CALLBACK_URL to this endpoint)
+@app.route('/webhook/whatsapp/status', methods=['POST'])
+def whatsapp_status_callback():
+    """Record sent/delivered/read/failed updates for an outbound message"""
+    if not valid_twilio_signature():
+        abort(403)
+    data = request.form
+    error_code = data.get('ErrorCode')
+    record_status(
+        data.get('MessageSid'),
+        data.get('MessageStatus'),
+        error_message=f"Twilio error {error_code}" if error_code else None
+    )
+    # Updates are applied in batches in the background
+    return '', 204
+
+@app.route('/notifications/stats')
+@login_required
+def notification_stats():
+    """Delivery analytics per channel and status"""
+    days = request.args.get('days', type=int)
+    since = datetime.utcnow() - timedelta(days=days) if days else None
+    return jsonify(delivery_summary(since))
+
 @app.route('/test-whatsapp', methods=['POST'])
 @login_required
 def test_whatsapp_bot():
@@ -826,51 +1141,41 @@ def upload_file():
     
     return jsonify({'error': 'Invalid file type'}), 400
 
-# Create default admin user if none exists
-def create_default_admin():
-    if not Admin.query.first():
-        admin = Admin(
-            username='admin',
-            email='admin@example.com',
-            role='admin'
-        )
-        admin.set_password('admin123')
-        db.session.add(admin)
-        db.session.commit()
-        print("Default admin user created: username=admin, password=admin123")
-
 # Admin account management routes
 @app.route('/account')
 @login_required
 def account_settings():
     """Show admin account settings page"""
-    return render_template('account_settings.html', admin=current_user)
+    admin = db.session.get(Admin, current_user.id)
+    return render_template('account_settings.html', admin=admin)
 
 @app.route('/account/update', methods=['POST'])
 @login_required
 def update_account():
     """Update admin account details"""
+    # current_user is a cached principal; changes go through the Admin row
+    admin = db.session.get(Admin, current_user.id)
     try:
         # Update basic info
         if 'username' in request.form:
             new_username = request.form['username'].strip()
-            if new_username != current_user.username:
+            if new_username != admin.username:
                 # Check if username is already taken
                 existing_admin = Admin.query.filter_by(username=new_username).first()
-                if existing_admin and existing_admin.id != current_user.id:
+                if existing_admin and existing_admin.id != admin.id:
                     flash('Username already exists', 'danger')
                     return redirect(url_for('account_settings'))
-                current_user.username = new_username
+                admin.username = new_username
         
         if 'email' in request.form:
             new_email = request.form['email'].strip().lower()
-            if new_email != current_user.email:
+            if new_email != admin.email:
                 # Check if email is already taken
                 existing_admin = Admin.query.filter_by(email=new_email).first()
-                if existing_admin and existing_admin.id != current_user.id:
+                if existing_admin and existing_admin.id != admin.id:
                     flash('Email already exists', 'danger')
                     return redirect(url_for('account_settings'))
-                current_user.email = new_email
+                admin.email = new_email
         
         db.session.commit()
         flash('Account details updated successfully!', 'success')
@@ -885,13 +1190,14 @@ def update_account():
 @login_required
 def change_password():
     """Change admin password"""
+    admin = db.session.get(Admin, current_user.id)
     try:
         current_password = request.form['current_password']
         new_password = request.form['new_password']
         confirm_password = request.form['confirm_password']
         
         # Verify current password
-        if not current_user.check_password(current_password):
+        if not admin.check_password(current_password):
             flash('Current password is incorrect', 'danger')
             return redirect(url_for('account_settings'))
         
@@ -906,7 +1212,7 @@ def change_password():
             return redirect(url_for('account_settings'))
         
         # Update password
-        current_user.set_password(new_password)
+        admin.set_password(new_password)
         db.session.commit()
         
         flash('Password changed successfully!', 'success')
@@ -916,10 +1222,3 @@ def change_password():
         flash(f'Error changing password: {str(e)}', 'danger')
     
     return redirect(url_for('account_settings'))
-
-# Call the function when the module is loaded
-with app.app_context():
-    try:
-        create_default_admin()
-    except Exception as e:
-        print(f"Error creating default admin: {e}")
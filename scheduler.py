@@ -0,0 +1,338 @@
+import os
+import heapq
+import uuid
+import logging
+import threading
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from sqlalchemy import event
+from app import app, db
+from models import Application, ScheduledMessage
+from outbox import queue_messages
+
+logger = logging.getLogger(__name__)
+
+# Each worker keeps the soonest pending messages - at most WINDOW_SIZE, due
+# within LOOKAHEAD - in a heap and sleeps until the first one is due
+WINDOW_SIZE = int(os.environ.get('SCHEDULER_WINDOW_SIZE', '500'))
+LOOKAHEAD = timedelta(seconds=float(os.environ.get('SCHEDULER_LOOKAHEAD_SECONDS', '300')))
+# Messages claimed and handed to the outbox per transaction
+RELEASE_BATCH_SIZE = 100
+ERROR_RETRY_SECONDS = 30
+# Bulk sends are spread out so providers don't throttle or flag them
+DRIP_PER_MINUTE = int(os.environ.get('SCHEDULER_DRIP_PER_MINUTE', '30'))
+# Interview dates and times are entered in this timezone
+INTERVIEW_TIMEZONE = os.environ.get('INTERVIEW_TIMEZONE', 'Africa/Harare')
+INTERVIEW_REMINDER_HOURS = [float(hours) for hours in os.environ.get('INTERVIEW_REMINDER_HOURS', '24,2').split(',') if hours.strip()]
+# Conversations stuck half way get one reminder this long after their last
+# step, brought forward so it arrives a day before the deadline
+NUDGE_AFTER = timedelta(hours=float(os.environ.get('NUDGE_AFTER_HOURS', '12')))
+NUDGE_BEFORE_DEADLINE = timedelta(hours=24)
+# Not worth sending when the applicant only just replied
+NUDGE_MIN_DELAY = timedelta(hours=1)
+
+INTERVIEW_KINDS = ('interview_invite', 'interview_reminder')
+# Share the DRIP_PER_MINUTE budget
+DRIP_KINDS = ('drip', 'interview_invite')
+INTERVIEW_STATUSES = ('shortlisted', 'selected')
+
+# Housekeeping the scheduler thread runs between releases: name -> function
+# taking the current time and returning when it next wants to run (naive
+# UTC), or None when it is turned off
+_periodic_tasks = {}
+
+def periodic(name):
+    """Register a housekeeping function with every worker's scheduler thread"""
+    def register(func):
+        _periodic_tasks[name] = func
+        return func
+    return register
+
+def _row(kind, message, due_at, batch_id=None):
+    return {
+        'kind': kind,
+        'application_id': message.get('application_id'),
+        'channel': message['channel'],
+        'recipient': message['recipient'],
+        'subject': message.get('subject'),
+        'message': message['message'],
+        'due_at': due_at,
+        'requires_state': message.get('requires_state'),
+        'status': 'pending',
+        'batch_id': batch_id,
+        'created_at': datetime.utcnow(),
+    }
+
+def _note_due(due_at):
+    # The scheduler is woken after commit only if this comes due inside its current window
+    earliest = db.session.info.get('schedule_earliest')
+    db.session.info['schedule_earliest'] = due_at if earliest is None else min(earliest, due_at)
+
+def schedule(kind, channel, recipient, message, due_at, application_id=None, subject=None, requires_state=None):
+    """Schedule one message in the current transaction; due_at is naive UTC"""
+    scheduled = ScheduledMessage(**_row(kind, {
+        'channel': channel, 'recipient': recipient, 'message': message, 'subject': subject,
+        'application_id': application_id, 'requires_state': requires_state,
+    }, due_at))
+    db.session.add(scheduled)
+    _note_due(due_at)
+    return scheduled
+
+def schedule_many(kind, messages, batch_id=None):
+    """Bulk-insert scheduled messages in the current transaction; returns how many.
+
+    Each message is a dict like outbox.queue_messages takes, plus due_at and
+    optionally requires_state.
+    """
+    if not messages:
+        return 0
+    db.session.execute(ScheduledMessage.__table__.insert(),
+                       [_row(kind, message, message['due_at'], batch_id) for message in messages])
+    _note_due(min(message['due_at'] for message in messages))
+    return len(messages)
+
+def schedule_drip(kind, messages, batch_id=None, start_at=None, per_minute=DRIP_PER_MINUTE):
+    """Schedule `messages` evenly spaced at `per_minute`; returns when the last one goes out.
+
+    A new drip starts after the last pending one, so the rate holds across
+    bulk sends made close together.
+    """
+    spacing = timedelta(minutes=1) / max(per_minute, 1)
+    start_at = start_at or datetime.utcnow()
+    for drip_kind in DRIP_KINDS:
+        # One lookup per kind on the (kind, status, due_at) index
+        latest = db.session.query(db.func.max(ScheduledMessage.due_at)).filter(
+            ScheduledMessage.kind == drip_kind,
+            ScheduledMessage.status == 'pending'
+        ).scalar()
+        if latest is not None:
+            start_at = max(start_at, latest + spacing)
+    messages = [dict(message, due_at=start_at + spacing * index) for index, message in enumerate(messages)]
+    schedule_many(kind, messages, batch_id)
+    return messages[-1]['due_at'] if messages else start_at
+
+def cancel(application_ids, kinds):
+    """Cancel the pending messages of these kinds for these applications"""
+    if not application_ids:
+        return 0
+    return ScheduledMessage.query.filter(
+        ScheduledMessage.application_id.in_(list(application_ids)),
+        ScheduledMessage.kind.in_(kinds),
+        ScheduledMessage.status == 'pending'
+    ).update({ScheduledMessage.status: 'cancelled'}, synchronize_session=False)
+
+def interview_datetime(date_text, time_text):
+    """The naive UTC time of an interview entered as YYYY-MM-DD and HH:MM local time, or None"""
+    try:
+        local = datetime.strptime(f'{date_text} {time_text}', '%Y-%m-%d %H:%M')
+    except (TypeError, ValueError):
+        return None
+    try:
+        zone = ZoneInfo(INTERVIEW_TIMEZONE)
+    except ZoneInfoNotFoundError:
+        logger.warning(f"Unknown INTERVIEW_TIMEZONE {INTERVIEW_TIMEZONE}; treating interview times as UTC")
+        return local
+    return local.replace(tzinfo=zone).astimezone(ZoneInfo('UTC')).replace(tzinfo=None)
+
+def nudge_due_at(deadline, now=None):
+    """When to remind a stalled conversation, or None if it is too close to the deadline"""
+    now = now or datetime.utcnow()
+    due_at = now + NUDGE_AFTER
+    if deadline:
+        due_at = min(due_at, deadline - NUDGE_BEFORE_DEADLINE)
+    return due_at if due_at >= now + NUDGE_MIN_DELAY else None
+
+def _still_wanted(scheduled, application):
+    """Interview messages need the applicant still shortlisted or selected, nudges the conversation still stuck"""
+    if scheduled.kind in INTERVIEW_KINDS:
+        return application is not None and application.status in INTERVIEW_STATUSES
+    if scheduled.requires_state:
+        return application is not None and application.conversation_state == scheduled.requires_state
+    return True
+
+def release(ids):
+    """Hand the due messages among `ids` to the outbox; returns how many were queued.
+
+    The claim re-checks status in the UPDATE, so when workers race for the
+    same rows each message is released exactly once.
+    """
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    claimed = ScheduledMessage.query.filter(
+        ScheduledMessage.id.in_(ids),
+        ScheduledMessage.status == 'pending',
+        ScheduledMessage.due_at <= now
+    ).update({
+        ScheduledMessage.status: 'queued',
+        ScheduledMessage.claimed_by: token,
+        ScheduledMessage.released_at: now,
+    }, synchronize_session=False)
+    if not claimed:
+        db.session.rollback()
+        return 0
+
+    scheduled_messages = ScheduledMessage.query.filter(
+        ScheduledMessage.id.in_(ids), ScheduledMessage.claimed_by == token
+    ).all()
+    application_ids = {scheduled.application_id for scheduled in scheduled_messages if scheduled.application_id}
+    applications = {row.id: row for row in db.session.query(
+        Application.id, Application.status, Application.conversation_state
+    ).filter(Application.id.in_(application_ids))} if application_ids else {}
+
+    messages = []
+    for scheduled in scheduled_messages:
+        if not _still_wanted(scheduled, applications.get(scheduled.application_id)):
+            scheduled.status = 'cancelled'
+            continue
+        messages.append({
+            'channel': scheduled.channel,
+            'recipient': scheduled.recipient,
+            'subject': scheduled.subject,
+            'message': scheduled.message,
+            'application_id': scheduled.application_id,
+        })
+    queue_messages(messages)
+    db.session.commit()
+    if len(messages) < len(scheduled_messages):
+        logger.info(f"Cancelled {len(scheduled_messages) - len(messages)} scheduled messages that no longer apply")
+    return len(messages)
+
+def release_due(limit=RELEASE_BATCH_SIZE):
+    """Release one batch of due messages; returns how many were due"""
+    ids = [id for id, in db.session.query(ScheduledMessage.id).filter(
+        ScheduledMessage.status == 'pending',
+        ScheduledMessage.due_at <= datetime.utcnow()
+    ).order_by(ScheduledMessage.due_at).limit(limit)]
+    if ids:
+        release(ids)
+    return len(ids)
+
+class MessageScheduler:
+    """Background thread that releases scheduled messages for this worker process.
+
+    The heap holds the next window of (due_at, id) pairs, read through the
+    (status, due_at) index; between windows the thread sleeps until the
+    earliest one is due. The window is reloaded when it is used up, after
+    LOOKAHEAD, and when this worker commits new schedules. The thread also
+    runs the housekeeping tasks registered with @periodic.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._reload_at = None
+        self._stale = True
+        self._event = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._next_runs = {}
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='message-scheduler', daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        self._stale = True
+        self.start()
+        self._event.set()
+
+    def scheduled(self, due_at):
+        """Wake up for a newly committed message if it is due before the window is next loaded"""
+        if self._reload_at is None or due_at < self._reload_at:
+            self.wake()
+        else:
+            self.start()
+
+    def _load_window(self, now):
+        # Cleared first so a wake during the query isn't lost
+        self._stale = False
+        horizon = now + LOOKAHEAD
+        rows = db.session.query(ScheduledMessage.due_at, ScheduledMessage.id).filter(
+            ScheduledMessage.status == 'pending',
+            ScheduledMessage.due_at <= horizon
+        ).order_by(ScheduledMessage.due_at).limit(WINDOW_SIZE).all()
+        self._heap = [tuple(row) for row in rows]
+        heapq.heapify(self._heap)
+        # A full window may have left out rows due before the horizon
+        self._reload_at = rows[-1].due_at if len(rows) == WINDOW_SIZE else horizon
+
+    def run_once(self):
+        """Release whatever is due; returns the seconds until there may be more"""
+        now = datetime.utcnow()
+        if self._stale or self._reload_at is None or now >= self._reload_at:
+            self._load_window(now)
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[1])
+        for start in range(0, len(due), RELEASE_BATCH_SIZE):
+            release(due[start:start + RELEASE_BATCH_SIZE])
+        next_at = min(self._heap[0][0], self._reload_at) if self._heap else self._reload_at
+        return max(0.0, (next_at - datetime.utcnow()).total_seconds())
+
+    def run_periodic(self):
+        """Run the housekeeping tasks that are due; returns the seconds until the next one, or None"""
+        for name, task in list(_periodic_tasks.items()):
+            now = datetime.utcnow()
+            if name in self._next_runs and (self._next_runs[name] is None or now < self._next_runs[name]):
+                continue
+            try:
+                self._next_runs[name] = task(now)
+            except Exception as e:
+                logger.error(f"{name} failed: {e}")
+                db.session.rollback()
+                self._next_runs[name] = now + timedelta(seconds=ERROR_RETRY_SECONDS)
+        upcoming = [next_run for next_run in self._next_runs.values() if next_run is not None]
+        if not upcoming:
+            return None
+        return max(0.0, (min(upcoming) - datetime.utcnow()).total_seconds())
+
+    def _run(self):
+        while True:
+            self._event.clear()
+            timeout = ERROR_RETRY_SECONDS
+            try:
+                with app.app_context():
+                    timeout = self.run_once()
+            except Exception as e:
+                logger.error(f"Message scheduler error: {e}")
+                self._stale = True
+            try:
+                with app.app_context():
+                    periodic_in = self.run_periodic()
+                if periodic_in is not None:
+                    timeout = min(timeout, periodic_in)
+            except Exception as e:
+                logger.error(f"Scheduler housekeeping error: {e}")
+            self._event.wait(timeout)
+
+scheduler = MessageScheduler()
+
+@event.listens_for(db.session, 'after_commit')
+def _wake_after_commit(session):
+    earliest = session.info.pop('schedule_earliest', None)
+    if earliest is not None:
+        scheduler.scheduled(earliest)
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_after_rollback(session):
+    session.info.pop('schedule_earliest', None)
+
+@app.before_request
+def _ensure_scheduler():
+    # Picks up messages that came due while no worker was running
+    scheduler.start()
+
+@app.cli.command('send-scheduled')
+def send_scheduled_command():
+    """Hand every scheduled message that is due to the outbox"""
+    total = 0
+    while True:
+        due = release_due()
+        total += due
+        if due < RELEASE_BATCH_SIZE:
+            break
+    print(f"Released {total} scheduled messages")
@@ -0,0 +1,71 @@
+import logging
+from sqlalchemy import inspect, text
+from app import app, db
+
+logger = logging.getLogger(__name__)
+
+def upgrade_schema():
+    """Bring existing tables up to date with the models.
+
+    db.create_all() only creates missing tables, so columns and indexes that
+    were added to a model later are created here. New columns must be
+    nullable (or have a server default) for this to work on a populated table.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            logger.info(f"Added column {table.name}.{column.name}")
+
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(bind=engine)
+                logger.info(f"Created index {index.name}")
+
+def create_default_admin():
+    from models import Admin
+    if not Admin.query.first():
+        admin = Admin(
+            username='admin',
+            email='admin@example.com',
+            role='admin'
+        )
+        admin.set_password('admin123')
+        db.session.add(admin)
+        db.session.commit()
+        print("Default admin user created: username=admin, password=admin123")
+
+def init_db():
+    """Create missing tables, bring existing ones up to date and seed the default admin.
+
+    Safe to run repeatedly. Deployments run it once per release (see
+    `flask init-db`) so worker processes don't touch the schema at startup.
+    """
+    import models  # noqa: F401
+    from partitioning import ensure_partitions
+    db.create_all()
+    upgrade_schema()
+    try:
+        ensure_partitions()
+    except Exception as e:
+        # Inserts still succeed through the default partition
+        logger.error(f"Could not create upcoming partitions: {e}")
+    create_default_admin()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create or upgrade the database schema and the default admin"""
+    init_db()
+    print("Database initialized")
@@ -0,0 +1,179 @@
+import time
+import logging
+import smtplib
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+def is_connection_error(error):
+    """True when the connection itself is unusable and should be replaced"""
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    # SMTPException subclasses OSError, but recipient/data errors leave the session usable
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+class PooledConnection:
+    """An authenticated SMTP connection plus the bookkeeping the pool needs"""
+
+    def __init__(self, server):
+        self.server = server
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.messages_sent = 0
+
+    def close(self):
+        try:
+            self.server.quit()
+        except Exception:
+            try:
+                self.server.close()
+            except Exception:
+                pass
+
+class SMTPConnectionPool:
+    """Keeps authenticated SMTP connections alive and reuses them across messages"""
+
+    def __init__(self, host, port, username, password, max_connections=4,
+                 max_idle_seconds=60, max_messages_per_connection=100, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.max_idle_seconds = max_idle_seconds
+        self.max_messages_per_connection = max_messages_per_connection
+        self.timeout = timeout
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._closed = False
+
+    def _connect(self):
+        if self.port == 465:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            server.starttls()
+        server.login(self.username, self.password)
+        logger.debug(f"Opened SMTP connection to {self.host}:{self.port}")
+        return PooledConnection(server)
+
+    def _is_reusable(self, conn):
+        if conn.messages_sent >= self.max_messages_per_connection:
+            return False
+        # Servers drop idle sessions; don't bother probing ones we know are stale
+        return time.monotonic() - conn.last_used < self.max_idle_seconds
+
+    def acquire(self):
+        """Take a live connection from the pool, opening a new one if needed"""
+        self._slots.acquire()
+        try:
+            while True:
+                with self._lock:
+                    conn = self._idle.popleft() if self._idle else None
+                if conn is None:
+                    return self._connect()
+                if self._is_reusable(conn):
+                    return conn
+                conn.close()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool, or close it if it is broken"""
+        try:
+            if discard or self._closed or not self._is_reusable(conn):
+                conn.close()
+            else:
+                conn.last_used = time.monotonic()
+                with self._lock:
+                    self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    def _send_on(self, conn, msg):
+        conn.server.send_message(msg)
+        conn.messages_sent += 1
+
+    def send(self, msg):
+        """Send one message, reconnecting once if the pooled connection went away"""
+        self.send_many([msg], raise_errors=True)
+
+    def send_many(self, messages, raise_errors=False):
+        """Send messages in batches over shared connections.
+
+        Returns a list of (message, error) pairs; error is None on success.
+        """
+        results = []
+        pending = list(messages)
+        while pending:
+            batch = pending[:self.max_messages_per_connection]
+            pending = pending[len(batch):]
+            results.extend(self._send_batch(batch, raise_errors))
+        return results
+
+    def _send_batch(self, batch, raise_errors):
+        results = []
+        conn = self.acquire()
+        discard = False
+        try:
+            for msg in batch:
+                try:
+                    try:
+                        self._send_on(conn, msg)
+                    except Exception as e:
+                        if not is_connection_error(e):
+                            raise
+                        # The connection died under us: replace it and retry this message once
+                        logger.warning(f"SMTP connection lost ({e}), reconnecting")
+                        conn.close()
+                        # Stays set if reconnecting fails (e.g. on authentication), so
+                        # the closed connection never goes back to the idle pool
+                        discard = True
+                        conn = self._connect()
+                        discard = False
+                        self._send_on(conn, msg)
+                    results.append((msg, None))
+                except Exception as e:
+                    if raise_errors:
+                        discard = discard or is_connection_error(e)
+                        raise
+                    results.append((msg, e))
+                    if discard or is_connection_error(e):
+                        # Nothing more will get through this connection
+                        discard = True
+                        results.extend((m, e) for m in batch[len(results):])
+                        break
+        finally:
+            self.release(conn, discard=discard)
+        return results
+
+    def close(self):
+        """Close every idle connection; in-use ones are closed when released"""
+        self._closed = True
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            conn.close()
+
+# One pool per SMTP account; replaced when the settings change
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_smtp_pool(host, port, username, password, **options):
+    """Return the shared pool for these SMTP credentials"""
+    key = (host, port, username, password)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            # Credentials changed: retire pools for the old settings
+            for old_key in list(_pools):
+                _pools.pop(old_key).close()
+            pool = _pools[key] = SMTPConnectionPool(host, port, username, password, **options)
+        return pool
+
+def close_all_pools():
+    with _pools_lock:
+        for key in list(_pools):
+            _pools.pop(key).close()
@@ -125,15 +125,125 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
-    // Auto-refresh for dashboard
-    if (window.location.pathname === '/' || window.location.pathname === '/dashboard') {
-        setInterval(function() {
-            // Refresh statistics without full page reload
-            refreshDashboardStats();
-        }, 30000); // 30 seconds
+    // Live updates for the dashboard and applications list
+    if (document.querySelector('[data-live-feed]')) {
+        startLiveFeed();
     }
 });
 
+var STATUS_BADGE_COLORS = { selected: 'success', pending: 'warning', shortlisted: 'info' };
+var RECENT_APPLICATIONS_SHOWN = 5;
+
+function startLiveFeed() {
+    if (!window.EventSource) {
+        startStatsPolling();
+        return;
+    }
+    var source = new EventSource('/events');
+    // Counts may have moved while the stream was down
+    source.addEventListener('open', refreshDashboardStats);
+    source.addEventListener('resync', refreshDashboardStats);
+    source.addEventListener('counters', function(e) {
+        var deltas = JSON.parse(e.data);
+        Object.keys(deltas).forEach(function(name) {
+            addToStatsCard(name.replace(/_/g, '-'), deltas[name]);
+        });
+    });
+    source.addEventListener('status', function(e) {
+        var data = JSON.parse(e.data);
+        data.ids.forEach(function(id) {
+            updateStatusBadge(id, data.status);
+        });
+    });
+    source.addEventListener('application', function(e) {
+        showNewApplication(JSON.parse(e.data));
+    });
+    source.addEventListener('error', function() {
+        // The browser reconnects by itself unless the server refused the
+        // stream (e.g. 503 when the worker has too many open)
+        if (source.readyState === EventSource.CLOSED) {
+            startStatsPolling();
+        }
+    });
+}
+
+function startStatsPolling() {
+    setInterval(function() {
+        // Refresh statistics without full page reload
+        refreshDashboardStats();
+    }, 30000); // 30 seconds
+}
+
+function addToStatsCard(elementId, delta) {
+    var element = document.getElementById(elementId);
+    if (element) {
+        element.textContent = (parseInt(element.textContent, 10) || 0) + delta;
+    }
+}
+
+function updateStatusBadge(applicationId, status) {
+    var rows = document.querySelectorAll(`tr[data-application-id="${applicationId}"]`);
+    rows.forEach(function(row) {
+        var badge = row.querySelector('.status-badge');
+        if (badge) {
+            badge.className = `badge status-badge bg-${STATUS_BADGE_COLORS[status] || 'danger'}`;
+            badge.textContent = status.charAt(0).toUpperCase() + status.slice(1);
+        }
+    });
+    var selects = document.querySelectorAll(`.status-select[data-application-id="${applicationId}"]`);
+    selects.forEach(function(select) {
+        select.value = status;
+    });
+}
+
+function showNewApplication(application) {
+    var banner = document.getElementById('new-applications-banner');
+    if (banner) {
+        var count = banner.querySelector('.count');
+        count.textContent = (parseInt(count.textContent, 10) || 0) + 1;
+        banner.classList.remove('d-none');
+        return;
+    }
+    var tbody = document.getElementById('recent-applications');
+    if (!tbody) {
+        return;
+    }
+    var row = tbody.insertRow(0);
+    row.setAttribute('data-application-id', application.id);
+
+    var applicant = row.insertCell();
+    var name = document.createElement('strong');
+    name.textContent = application.full_name;
+    var email = document.createElement('small');
+    email.className = 'text-muted';
+    email.textContent = application.email;
+    var wrapper = document.createElement('div');
+    wrapper.append(name, document.createElement('br'), email);
+    applicant.appendChild(wrapper);
+
+    row.insertCell().textContent = application.internship || '';
+
+    var applied = document.createElement('span');
+    applied.className = 'text-muted';
+    applied.textContent = application.applied_at.slice(0, 16).replace('T', ' ');
+    row.insertCell().appendChild(applied);
+
+    var badge = document.createElement('span');
+    badge.className = 'badge status-badge';
+    row.insertCell().appendChild(badge);
+
+    var link = document.createElement('a');
+    link.href = `/applications/${application.id}`;
+    link.className = 'btn btn-sm btn-outline-primary';
+    link.innerHTML = '<i class="fas fa-eye"></i>';
+    row.insertCell().appendChild(link);
+
+    updateStatusBadge(application.id, application.status);
+    while (tbody.rows.length > RECENT_APPLICATIONS_SHOWN) {
+        tbody.deleteRow(-1);
+    }
+}
+
 // Utility functions
 function updateApplicationStatus(applicationId, status) {
     var formData = new FormData();
@@ -142,6 +252,7 @@ function updateApplicationStatus(applicationId, status) {
     
     fetch(`/applications/${applicationId}/update_status`, {
         method: 'POST',
+        headers: { 'Accept': 'application/json' },
         body: formData
     })
     .then(response => response.json())
@@ -149,7 +260,7 @@ function updateApplicationStatus(applicationId, status) {
         if (data.success) {
             showNotification('Status updated successfully', 'success');
         } else {
-            showNotification('Error updating status', 'danger');
+            showNotification(data.error || 'Error updating status', 'danger');
         }
     })
     .catch(error => {
@@ -0,0 +1,222 @@
+import uuid
+import logging
+from datetime import datetime
+from sqlalchemy import func, or_, update
+from app import db
+from models import Application, ApplicationStatusChange, Internship, OutboxMessage
+from outbox import queue_whatsapp, queue_email, queue_messages
+from live_events import publish_on_commit, publish_counters
+import funnel
+
+logger = logging.getLogger(__name__)
+
+VALID_STATUSES = ('pending', 'shortlisted', 'selected', 'rejected')
+# Keeps IN lists well under SQLite's bound parameter limit
+CHUNK_SIZE = 500
+
+def status_change_message(full_name, position, new_status):
+    """Personalized notification to applicant with emojis"""
+    if new_status == 'selected':
+        return f"🎉 **CONGRATULATIONS {full_name}!** 🎉\n\n✨ We are delighted to inform you that you have been **SELECTED** for the {position} position!\n\n🚀 This is an amazing achievement and we're excited to have you join our team!\n\n📧 Please check your email for next steps and onboarding details.\n\n🎊 Welcome aboard! 🎊"
+    elif new_status == 'rejected':
+        return f"📧 Dear {full_name},\n\n😔 We regret to inform you that your application for {position} was not successful this time.\n\n💪 Please don't be discouraged! This doesn't reflect your abilities or potential.\n\n🌟 We encourage you to:\n• Keep developing your skills\n• Apply for future opportunities with us\n• Stay connected for upcoming positions\n\n🙏 Thank you for your interest in our company. We wish you all the best in your career journey!\n\n💼 Keep pushing forward - your perfect opportunity is coming!"
+    elif new_status == 'shortlisted':
+        return f"🎯 **Great News {full_name}!** 🎯\n\n✅ You have been **SHORTLISTED** for the {position} position!\n\n📋 You've made it to the next round! This means your application stood out among many candidates.\n\n📞 **Next Steps:**\n• Keep your phone available for contact\n• Check your email regularly\n• Prepare for potential interviews\n\n🤞 Best of luck! We'll be in touch soon."
+    # pending or other status
+    return f"📋 Hello {full_name},\n\n📄 Your application status for **{position}** has been updated to: **{new_status.title()}**\n\n🔍 We'll keep you informed of any changes.\n\n📧 Thank you for your patience!"
+
+def pending_delta(old_statuses, new_status):
+    """Change in the pending count when applications move from `old_statuses` to `new_status`"""
+    left = sum(1 for status in old_statuses if status == 'pending')
+    return (len(old_statuses) - left if new_status == 'pending' else 0) - left
+
+def status_notifications(application_id, full_name, whatsapp_number, email, position, new_status):
+    """The WhatsApp message and (when there is an address) email for a status change"""
+    message = status_change_message(full_name, position, new_status)
+    notifications = [{
+        'channel': 'whatsapp',
+        'recipient': whatsapp_number,
+        'message': message,
+        'application_id': application_id,
+    }]
+    if email:
+        notifications.append({
+            'channel': 'email',
+            'recipient': email,
+            'subject': f"Application Status Update - {position}",
+            'message': message,
+            'application_id': application_id,
+        })
+    return notifications
+
+def change_status(application, new_status, send_notification=False, changed_by=None):
+    """Change one application's status in the current transaction.
+
+    Records the audit entry and queues the notifications; the caller commits.
+    Returns False when the status was already `new_status`.
+    """
+    old_status = application.status
+    if old_status == new_status:
+        return False
+    application.status = new_status
+    application.updated_at = datetime.utcnow()
+    db.session.add(ApplicationStatusChange(
+        application_id=application.id,
+        old_status=old_status,
+        new_status=new_status,
+        changed_by=changed_by
+    ))
+    funnel.record_status_change(application.internship_id, old_status, new_status)
+    publish_on_commit('status', ids=[application.id], status=new_status)
+    publish_counters(pending_applications=pending_delta([old_status], new_status))
+    if send_notification:
+        # Queued in the same transaction as the status change; the outbox
+        # dispatcher sends them in the background
+        for notification in status_notifications(
+            application.id, application.full_name, application.whatsapp_number, application.email,
+            application.internship.title, new_status
+        ):
+            if notification['channel'] == 'email':
+                queue_email(notification['recipient'], notification['subject'], notification['message'], application.id)
+            else:
+                queue_whatsapp(notification['recipient'], notification['message'], application.id)
+    return True
+
+def _chunks(values):
+    for start in range(0, len(values), CHUNK_SIZE):
+        yield values[start:start + CHUNK_SIZE]
+
+def _update_unchanged(changes, new_status, now):
+    """Set `new_status` on the rows of `changes` still in the status they were read
+    with; returns the ids actually updated.
+
+    A concurrent change between the read and the UPDATE leaves its row
+    alone, so the audit trail and funnel only count real transitions.
+    """
+    by_status = {}
+    for change in changes:
+        by_status.setdefault(change.status, []).append(change.id)
+    returning = db.engine.dialect.update_returning
+    updated = set()
+    for old_status, ids in by_status.items():
+        same_status = Application.status.is_(None) if old_status is None else Application.status == old_status
+        for chunk in _chunks(ids):
+            statement = update(Application).where(Application.id.in_(chunk), same_status).values(
+                status=new_status, updated_at=now
+            ).execution_options(synchronize_session=False)
+            if returning:
+                updated.update(db.session.execute(statement.returning(Application.id)).scalars())
+            else:
+                db.session.execute(statement)
+                # Without RETURNING, the rows stamped by this statement
+                updated.update(id for id, in db.session.query(Application.id).filter(
+                    Application.id.in_(chunk), Application.status == new_status, Application.updated_at == now
+                ))
+    return updated
+
+def bulk_update_status(application_ids, new_status, send_notification=False, changed_by=None):
+    """Move many applications to `new_status` with set-based statements and commit.
+
+    Only completed applications whose status actually changes are touched.
+    Audit rows and outbox messages are bulk-inserted with a shared batch id,
+    which is the handle batch_progress() reports on.
+    """
+    batch_id = uuid.uuid4().hex
+    ids = sorted(set(application_ids))
+    now = datetime.utcnow()
+
+    changes = []
+    for chunk in _chunks(ids):
+        changes.extend(
+            db.session.query(
+                Application.id, Application.internship_id, Application.status, Application.full_name,
+                Application.whatsapp_number, Application.email, Internship.title
+            )
+            .outerjoin(Internship, Application.internship_id == Internship.id)
+            .filter(
+                Application.id.in_(chunk),
+                Application.conversation_state == 'completed',
+                or_(Application.status != new_status, Application.status.is_(None))
+            )
+            .all()
+        )
+    updated_ids = _update_unchanged(changes, new_status, now)
+    if len(updated_ids) < len(changes):
+        logger.info(f"Bulk status update {batch_id}: {len(changes) - len(updated_ids)} applications changed concurrently, skipped")
+        changes = [change for change in changes if change.id in updated_ids]
+    changed_ids = [change.id for change in changes]
+
+    if changes:
+        db.session.execute(ApplicationStatusChange.__table__.insert(), [{
+            'application_id': change.id,
+            'old_status': change.status,
+            'new_status': new_status,
+            'changed_by': changed_by,
+            'batch_id': batch_id,
+            'changed_at': now,
+        } for change in changes])
+
+        # Funnel counters, one increment per internship
+        funnel_deltas = {}
+        for change in changes:
+            deltas = funnel_deltas.setdefault(change.internship_id, {})
+            for stage, amount in funnel.review_deltas(change.status, new_status).items():
+                deltas[stage] = deltas.get(stage, 0) + amount
+        for internship_id, deltas in funnel_deltas.items():
+            funnel.increment(internship_id, **deltas)
+
+        for chunk in _chunks(changed_ids):
+            publish_on_commit('status', ids=chunk, status=new_status)
+        publish_counters(pending_applications=pending_delta([change.status for change in changes], new_status))
+
+    queued = 0
+    if send_notification and changes:
+        notifications = []
+        for change in changes:
+            notifications.extend(status_notifications(
+                change.id, change.full_name, change.whatsapp_number, change.email,
+                change.title or 'the internship', new_status
+            ))
+        queued = queue_messages(notifications, batch_id=batch_id)
+
+    db.session.commit()
+    logger.info(f"Bulk status update {batch_id}: {len(changes)} of {len(ids)} applications -> {new_status}, {queued} notifications queued")
+    return {
+        'batch_id': batch_id,
+        'requested': len(ids),
+        'updated': len(changes),
+        'skipped': len(ids) - len(changes),
+        'notifications_queued': queued,
+    }
+
+def batch_progress(batch_id):
+    """Progress of a bulk update's notifications, or None for an unknown batch"""
+    updated = db.session.query(func.count(ApplicationStatusChange.id)).filter_by(batch_id=batch_id).scalar()
+    counts = dict(
+        db.session.query(OutboxMessage.status, func.count(OutboxMessage.id))
+        .filter_by(batch_id=batch_id)
+        .group_by(OutboxMessage.status)
+    )
+    if not updated and not counts:
+        return None
+
+    total = sum(counts.values())
+    sent = counts.get('sent', 0)
+    dead = counts.get('dead', 0)
+    if sent + dead < total:
+        state = 'delivering'
+    elif dead:
+        state = 'completed_with_errors'
+    else:
+        state = 'completed'
+    return {
+        'batch_id': batch_id,
+        'state': state,
+        'updated': updated,
+        'notifications': {
+            'total': total,
+            'pending': counts.get('pending', 0) + counts.get('sending', 0),
+            'sent': sent,
+            'dead': dead,
+        },
+    }
@@ -0,0 +1,137 @@
+import ssl
+import socket
+import subprocess
+from email.message import EmailMessage
+
+import pytest
+
+aiosmtpd_controller = pytest.importorskip('aiosmtpd.controller')
+from aiosmtpd.smtp import AuthResult  # noqa: E402
+
+from smtp_pool import SMTPConnectionPool  # noqa: E402
+
+USERNAME = 'mailer'
+PASSWORD = 'secret'
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope.content)
+        return '250 OK'
+
+class SMTPStandIn:
+    """An aiosmtpd server with STARTTLS and LOGIN/PLAIN auth that counts logins"""
+
+    def __init__(self, tls_context, port):
+        self.tls_context = tls_context
+        self.port = port
+        self.handler = RecordingHandler()
+        self.logins = 0
+        self.accept_logins = True
+        self.controller = None
+
+    def _authenticate(self, server, session, envelope, mechanism, auth_data):
+        ok = self.accept_logins and auth_data.login.decode() == USERNAME and auth_data.password.decode() == PASSWORD
+        if ok:
+            self.logins += 1
+        return AuthResult(success=ok)
+
+    def start(self):
+        self.controller = aiosmtpd_controller.Controller(
+            self.handler, hostname='127.0.0.1', port=self.port, tls_context=self.tls_context,
+            require_starttls=True, authenticator=self._authenticate, auth_require_tls=True
+        )
+        self.controller.start()
+
+    def stop(self):
+        self.controller.stop()
+
+    def restart(self):
+        """Drop every open session, as a server restart or idle timeout would"""
+        self.stop()
+        self.start()
+
+@pytest.fixture(scope='module')
+def tls_context(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('tls')
+    cert, key = directory / 'cert.pem', directory / 'key.pem'
+    try:
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                        '-subj', '/CN=localhost', '-keyout', str(key), '-out', str(cert)],
+                       check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip('openssl is needed to create a test certificate')
+    context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    context.load_cert_chain(cert, key)
+    return context
+
+@pytest.fixture
+def smtp_server(tls_context):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    server = SMTPStandIn(tls_context, port)
+    server.start()
+    yield server
+    server.stop()
+
+def make_pool(server, **options):
+    return SMTPConnectionPool('127.0.0.1', server.port, USERNAME, PASSWORD, timeout=5, **options)
+
+def message(number):
+    msg = EmailMessage()
+    msg['From'] = 'noreply@example.com'
+    msg['To'] = f'applicant{number}@example.com'
+    msg['Subject'] = f'Message {number}'
+    msg.set_content('Hello')
+    return msg
+
+def test_reuses_one_connection_for_sequential_sends(smtp_server):
+    pool = make_pool(smtp_server)
+    for number in range(5):
+        pool.send(message(number))
+    pool.close()
+    assert len(smtp_server.handler.messages) == 5
+    assert smtp_server.logins == 1
+
+def test_send_many_batches_per_connection(smtp_server):
+    pool = make_pool(smtp_server, max_messages_per_connection=2)
+    results = pool.send_many([message(number) for number in range(5)])
+    pool.close()
+    assert [error for _, error in results] == [None] * 5
+    assert len(smtp_server.handler.messages) == 5
+    # Batches of 2, 2 and 1, each on a fresh connection once the previous one is used up
+    assert smtp_server.logins == 3
+
+def test_rolls_over_after_max_messages(smtp_server):
+    pool = make_pool(smtp_server, max_messages_per_connection=2)
+    for number in range(3):
+        pool.send(message(number))
+    assert smtp_server.logins == 2
+    pool.close()
+
+def test_reconnects_after_server_drop(smtp_server):
+    pool = make_pool(smtp_server)
+    pool.send(message(1))
+    smtp_server.restart()
+    pool.send(message(2))
+    results = pool.send_many([message(3), message(4)])
+    pool.close()
+    assert [error for _, error in results] == [None, None]
+    assert len(smtp_server.handler.messages) == 4
+    assert smtp_server.logins == 2
+
+def test_failed_reconnect_does_not_return_connection_to_pool(smtp_server):
+    pool = make_pool(smtp_server)
+    pool.send(message(1))
+    smtp_server.restart()
+    smtp_server.accept_logins = False
+    results = pool.send_many([message(2), message(3)])
+    assert all(error is not None for _, error in results)
+    assert not pool._idle
+    smtp_server.accept_logins = True
+    pool.send(message(4))
+    pool.close()
+    assert len(smtp_server.handler.messages) == 2
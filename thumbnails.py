@@ -0,0 +1,166 @@
+# First-page CV thumbnails, rendered in the background and kept in a disk
+# cache with LRU eviction. Rendering uses PyMuPDF when it is installed (in the
+# CV processing pool, since it holds the GIL) or else poppler's pdftoppm;
+# with neither, lists keep their plain CV icon. The pool's processes import
+# this module, so only the standard library and pipeline are imported here.
+import os
+import time
+import shutil
+import logging
+import threading
+import subprocess
+import importlib.util
+from pipeline import get_stage, RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get('THUMBNAIL_DIR', 'thumbnails')
+CACHE_BYTES = int(os.environ.get('THUMBNAIL_CACHE_BYTES', str(200 * 1024 * 1024)))
+WIDTH = int(os.environ.get('THUMBNAIL_WIDTH', '160'))
+WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', '2'))
+# Renders waiting beyond this are dropped; the next page view asks again
+MAX_QUEUED = 500
+RENDER_TIMEOUT = 30
+# Recording a hit rewrites the file's mtime, so do it at most this often
+TOUCH_INTERVAL = 3600
+
+def _renderer():
+    if importlib.util.find_spec('fitz') is not None:
+        return 'pymupdf'
+    if shutil.which('pdftoppm'):
+        return 'pdftoppm'
+    return None
+
+RENDERER = _renderer()
+
+def available():
+    return RENDERER is not None
+
+def render_with_pymupdf(pdf_path, out_path, width):
+    import fitz
+    with fitz.open(pdf_path) as document:
+        page = document[0]
+        zoom = width / page.rect.width
+        page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False).save(out_path, output='png')
+
+def render_with_pdftoppm(pdf_path, out_path, width):
+    # Without an output root pdftoppm writes the image to stdout, so out_path can have any name
+    with open(out_path, 'wb') as out:
+        subprocess.run(
+            ['pdftoppm', '-png', '-f', '1', '-l', '1', '-singlefile', '-scale-to-x', str(width), '-scale-to-y', '-1',
+             pdf_path],
+            check=True, stdout=out, stderr=subprocess.PIPE, timeout=RENDER_TIMEOUT
+        )
+
+class ThumbnailCache:
+    """PNG files named by key under `directory`, evicted least recently used first.
+
+    A hit bumps the file's mtime (at most once per TOUCH_INTERVAL), so mtime
+    order is use order across every worker sharing the directory.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._approx_bytes = None
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.png')
+
+    def get(self, key):
+        """Path of the cached thumbnail, or None"""
+        path = self.path(key)
+        try:
+            modified = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+        if time.time() - modified > TOUCH_INTERVAL:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return path
+
+    def _scan(self):
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith('.png'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def added(self, path):
+        """Account for a new file and evict the oldest ones once over max_bytes"""
+        with self._lock:
+            if self._approx_bytes is None:
+                self._approx_bytes = sum(size for _, size, _ in self._scan())
+            else:
+                self._approx_bytes += os.path.getsize(path)
+            if self._approx_bytes <= self.max_bytes:
+                return
+            # Other workers write here too, so evict from a fresh listing
+            entries = sorted(self._scan())
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * 0.9
+            evicted = 0
+            for _, size, old_path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(old_path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                evicted += 1
+            self._approx_bytes = total
+        logger.info(f"Thumbnail cache: evicted {evicted} thumbnails")
+
+cache = ThumbnailCache()
+
+_pending = set()
+_pending_lock = threading.Lock()
+
+def thumbnail_key(cv_filename):
+    """Cache key for a stored CV; CV files are never overwritten, so it never goes stale"""
+    return os.path.splitext(cv_filename)[0]
+
+def render(key, pdf_path):
+    """Render job for the thumbnails stage"""
+    try:
+        if cache.get(key):
+            return
+        os.makedirs(cache.directory, exist_ok=True)
+        out_path = cache.path(key)
+        # Not a .png, so the cache never counts or serves a half-written render
+        partial = f'{out_path}.tmp'
+        try:
+            if RENDERER == 'pymupdf':
+                from cv_processing import run_in_pool
+                run_in_pool(render_with_pymupdf, pdf_path, partial, WIDTH, timeout=RENDER_TIMEOUT)
+            else:
+                render_with_pdftoppm(pdf_path, partial, WIDTH)
+            os.replace(partial, out_path)
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        cache.added(out_path)
+    finally:
+        with _pending_lock:
+            _pending.discard(key)
+
+def thumbnail_stage():
+    return get_stage('thumbnails', workers=WORKERS, retry_policy=RetryPolicy(max_attempts=2, base_delay=5.0))
+
+def request_thumbnail(key, pdf_path):
+    """Queue a render unless one is already pending or the queue is full"""
+    if not available():
+        return False
+    stage = thumbnail_stage()
+    with _pending_lock:
+        if key in _pending or stage.stats.snapshot()['queued'] >= MAX_QUEUED:
+            return False
+        _pending.add(key)
+    stage.submit(render, key, pdf_path)
+    return True
@@ -1,8 +1,8 @@
 import os
 import uuid
-import requests
 from werkzeug.utils import secure_filename
 from flask import current_app
+from metrics import MEDIA_LATENCY, timed
 
 ALLOWED_EXTENSIONS = {'pdf'}
 
@@ -44,7 +44,11 @@ def save_media_file(media_url, file_type):
                     'Authorization': f'Basic {credentials}'
                 }
         
-        response = requests.get(media_url, headers=headers)
+        import requests  # only needed here; kept off the startup path
+        with timed(MEDIA_LATENCY) as timer:
+            response = requests.get(media_url, headers=headers)
+            if response.status_code != 200:
+                timer.outcome = 'error'
         if response.status_code != 200:
             raise Exception(f"Failed to download media: {response.status_code}")
         
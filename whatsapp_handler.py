@@ -1,11 +1,20 @@
 import os
+import uuid
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from app import app, db
 from models import Application, Internship, WhatsAppMessage
-from communication import send_whatsapp_message
+from outbox import queue_whatsapp, queue_email
 from utils import save_media_file
-import requests
+from pipeline import get_stage, RetryPolicy
+from delivery_status import record_status
+from live_events import publish_on_commit, publish_counters
+import cv_processing
+import image_cvs
+import thumbnails
+import funnel
+import identities
+import scheduler
 
 logger = logging.getLogger(__name__)
 
@@ -16,8 +25,17 @@ STATE_WAITING_FOR_EMAIL = 'waiting_for_email'
 STATE_WAITING_FOR_PHONE = 'waiting_for_phone'
 STATE_WAITING_FOR_COVER_LETTER = 'waiting_for_cover_letter'
 STATE_WAITING_FOR_CV = 'waiting_for_cv'
+STATE_PROCESSING_CV = 'processing_cv'
 STATE_COMPLETED = 'completed'
 
+# How far back to look for an already stored copy of a redelivered message
+DUPLICATE_WINDOW = timedelta(days=1)
+# CV jobs live in in-memory stages and are lost when a worker restarts;
+# applications processing their CV this long are handed to the stages again
+CV_STALE_AFTER = timedelta(minutes=float(os.environ.get('CV_PROCESSING_STALE_MINUTES', '10')))
+CV_SWEEP_INTERVAL = timedelta(minutes=5)
+CV_SWEEP_BATCH_SIZE = 100
+
 def handle_webhook(data):
     """Handle incoming WhatsApp webhook data"""
     try:
@@ -102,7 +120,12 @@ def handle_incoming_message(message):
                     whatsapp_msg.message_body = message_body
         
         # Check for duplicate message ID
-        existing_msg = WhatsAppMessage.query.filter_by(message_id=message_id).first()
+        # Provider retries arrive within minutes; the time bound lets a
+        # partitioned table skip all older months
+        existing_msg = WhatsAppMessage.query.filter(
+            WhatsAppMessage.message_id == message_id,
+            WhatsAppMessage.received_at >= whatsapp_msg.received_at - DUPLICATE_WINDOW
+        ).first()
         if existing_msg:
             logger.info(f"Message {message_id} already processed, skipping duplicate")
             return
@@ -117,6 +140,10 @@ def handle_incoming_message(message):
             process_text_message(application, message_body, from_number)
         elif message_type in ['image', 'document'] and application.conversation_state == STATE_WAITING_FOR_CV:
             process_media_message(application, whatsapp_msg, from_number)
+            # Twilio delivers several photos sent together as one message
+            for media in message.get('extra_media') or ():
+                if application.conversation_state == STATE_WAITING_FOR_CV and image_cvs.accepts(media['content_type']):
+                    collect_cv_image(application, from_number, media['url'])
         
         whatsapp_msg.status = 'processed'
         whatsapp_msg.processed_at = datetime.utcnow()
@@ -134,9 +161,9 @@ def get_or_create_conversation(phone_number):
     ).filter(Application.conversation_state != STATE_COMPLETED).first()
     
     if not application:
-        # Create temporary conversation object (not saved to database until complete)
+        # Create temporary conversation object (not saved to database until complete);
+        # its application_id is allocated when it is first saved
         application = Application(
-            application_id=Application.generate_application_id(),
             whatsapp_number=phone_number,
             conversation_state=STATE_WAITING_FOR_APPLY,
             temp_data={}
@@ -155,19 +182,34 @@ def process_text_message(application, message_body, from_number):
         handle_name_input(application, message_body, from_number)
     elif state == STATE_WAITING_FOR_EMAIL:
         handle_email_input(application, message_body, from_number)
+    elif state == STATE_WAITING_FOR_CV and (application.temp_data or {}).get('cv_images'):
+        if message_body.strip().upper() == 'DONE':
+            submit_cv_images(application, from_number)
+        else:
+            queue_whatsapp(
+                from_number,
+                "📸 Send another photo of your CV, or reply **DONE** when you have sent every page."
+            )
     elif state == STATE_WAITING_FOR_CV:
         # If they send text instead of file, remind them
-        send_whatsapp_message(
+        queue_whatsapp(
             from_number,
+            "📎 Please attach your **CV as a PDF document**, or send a photo of each page, to complete your application.\n\n💡 **Tip:** If you have a cover letter from your university or college, please include it with your CV."
+            if image_cvs.ENABLED else
             "📎 Please attach your **CV as a PDF document only** to complete your application.\n\n💡 **Tip:** If you have a cover letter from your university or college, please include it with your CV document."
         )
+    elif state == STATE_PROCESSING_CV:
+        queue_whatsapp(
+            from_number,
+            "⏳ We're still processing your CV. You'll receive a confirmation shortly."
+        )
 
 def handle_apply_command(application, message_body, from_number):
     """Handle APPLY command with position and secret codes"""
     parts = message_body.upper().split()
     
     if len(parts) < 3 or parts[0] != 'APPLY':
-        send_whatsapp_message(
+        queue_whatsapp(
             from_number,
             "🚀 **Welcome to our Internship Application System!**\n\n📝 To apply for an internship, please send:\n**APPLY [POSITION_CODE] [SECRET_CODE]**\n\n💡 **Example:** APPLY WD001 SECRET123\n\n🔍 Make sure you have the correct codes from the job posting!"
         )
@@ -184,7 +226,7 @@ def handle_apply_command(application, message_body, from_number):
     ).first()
     
     if not internship:
-        send_whatsapp_message(
+        queue_whatsapp(
             from_number,
             "Invalid position code or secret code. Please check your details and try again."
         )
@@ -194,17 +236,17 @@ def handle_apply_command(application, message_body, from_number):
     if internship.is_deadline_passed():
         # Stop accepting new applications but keep internship active for admin viewing
         internship.accepting_applications = False
-        db.session.commit()
         
-        send_whatsapp_message(
+        queue_whatsapp(
             from_number,
             f"⏰ Sorry, the application deadline for **{internship.title}** has passed.\n\nDeadline was: {internship.deadline.strftime('%B %d, %Y')}\n\nPlease check for other available opportunities."
         )
+        db.session.commit()
         return
     
     # Also check if manually stopped accepting applications
     if not internship.accepting_applications:
-        send_whatsapp_message(
+        queue_whatsapp(
             from_number,
             f"📋 Applications for **{internship.title}** are currently closed.\n\nPlease check for other available opportunities."
         )
@@ -218,7 +260,7 @@ def handle_apply_command(application, message_body, from_number):
     ).first()
     
     if existing_app:
-        send_whatsapp_message(
+        queue_whatsapp(
             from_number,
             f"You have already applied for {internship.title}. Your application status is: {existing_app.status.title()}"
         )
@@ -227,21 +269,22 @@ def handle_apply_command(application, message_body, from_number):
     # Start application process with name first
     application.internship_id = internship.id
     application.conversation_state = STATE_WAITING_FOR_NAME
-    application.temp_data = {'internship_id': internship.id}
+    application.temp_data = {'internship_id': internship.id, 'started_at': datetime.utcnow().isoformat()}
+    funnel.record_stage(internship.id, 'started')
     
-    # Now save the incomplete application to track conversation state
-    db.session.add(application)
-    db.session.commit()
-    
-    send_whatsapp_message(
+    queue_whatsapp(
         from_number,
         f"🎉 Welcome! You're applying for: **{internship.title}**\n⏰ Deadline: {internship.deadline.strftime('%B %d, %Y')}\n\n⚡ **Quick Process:** Just 3 steps!\n\n👤 First, please provide your **full name**:"
     )
+    
+    # Now save the incomplete application to track conversation state
+    db.session.add(application)
+    db.session.commit()
 
 def handle_name_input(application, message_body, from_number):
     """Handle full name input"""
     if len(message_body.strip()) < 2:
-        send_whatsapp_message(
+        queue_whatsapp(
             from_number,
             "Please provide your full name (at least 2 characters):"
         )
@@ -253,11 +296,15 @@ def handle_name_input(application, message_body, from_number):
     temp_data['full_name'] = message_body.strip()
     application.temp_data = temp_data
     application.conversation_state = STATE_WAITING_FOR_EMAIL
+    funnel.record_stage(application.internship_id, 'reached_name')
+    schedule_nudge(application, from_number)
     
-    # Update the conversation state in database
-    db.session.commit()
+    queue_whatsapp(
+        from_number,
+        f"✅ Perfect {message_body.strip()}! \n\n📧 **Step 2:** Please provide your **email address**:"
+    )
     
-    # Force database commit immediately
+    # Force database commit immediately (the reply is committed with the new state)
     try:
         db.session.add(application)
         db.session.commit()
@@ -265,10 +312,24 @@ def handle_name_input(application, message_body, from_number):
     except Exception as e:
         logger.error(f"❌ Failed to save name: {e}")
         db.session.rollback()
-    
-    send_whatsapp_message(
-        from_number,
-        f"✅ Perfect {message_body.strip()}! \n\n📧 **Step 2:** Please provide your **email address**:"
+
+NUDGE_MESSAGES = {
+    STATE_WAITING_FOR_EMAIL: "⏰ Your application for **{title}** isn't finished yet. Reply with your **email address** to continue - applications close on {deadline}.",
+    STATE_WAITING_FOR_CV: "⏰ Your application for **{title}** is almost done! Just send your **CV** to finish - applications close on {deadline}.",
+}
+
+def schedule_nudge(application, from_number):
+    """Remind the applicant later if the conversation is still stuck at its current step"""
+    scheduler.cancel([application.id], ['nudge'])
+    internship = application.internship
+    message = NUDGE_MESSAGES.get(application.conversation_state)
+    due_at = scheduler.nudge_due_at(internship.deadline) if internship and message else None
+    if due_at is None:
+        return
+    scheduler.schedule(
+        'nudge', 'whatsapp', from_number,
+        message.format(title=internship.title, deadline=internship.deadline.strftime('%B %d, %Y')),
+        due_at, application_id=application.id, requires_state=application.conversation_state
     )
 
 def handle_email_input(application, message_body, from_number):
@@ -277,7 +338,7 @@ def handle_email_input(application, message_body, from_number):
     
     # Basic email validation
     if '@' not in email or '.' not in email.split('@')[1]:
-        send_whatsapp_message(
+        queue_whatsapp(
             from_number,
             "Please provide a valid email address:"
         )
@@ -289,8 +350,17 @@ def handle_email_input(application, message_body, from_number):
     temp_data['email'] = email
     application.temp_data = temp_data
     application.conversation_state = STATE_WAITING_FOR_CV
+    funnel.record_stage(application.internship_id, 'reached_email')
+    schedule_nudge(application, from_number)
+    
+    queue_whatsapp(
+        from_number,
+        "📧 Great! Email received.\n\n📎 **Final Step:** Please attach your **CV as a PDF document**, or send a photo of each page:"
+        if image_cvs.ENABLED else
+        "📧 Great! Email received.\n\n📎 **Final Step:** Please attach your **CV as a PDF document only**:"
+    )
     
-    # Force database commit immediately
+    # Force database commit immediately (the reply is committed with the new state)
     try:
         db.session.add(application)
         db.session.commit()
@@ -298,18 +368,13 @@ def handle_email_input(application, message_body, from_number):
     except Exception as e:
         logger.error(f"❌ Failed to save email: {e}")
         db.session.rollback()
-    
-    send_whatsapp_message(
-        from_number,
-        "📧 Great! Email received.\n\n📎 **Final Step:** Please attach your **CV as a PDF document only**:"
-    )
 
 def handle_phone_input(application, message_body, from_number):
     """Handle phone number input"""
     phone = message_body.strip()
     
     if len(phone) < 8:
-        send_whatsapp_message(
+        queue_whatsapp(
             from_number,
             "Please provide a valid phone number:"
         )
@@ -320,7 +385,7 @@ def handle_phone_input(application, message_body, from_number):
     application.temp_data = temp_data
     application.conversation_state = STATE_WAITING_FOR_COVER_LETTER
     
-    send_whatsapp_message(
+    queue_whatsapp(
         from_number,
         "📱 Perfect! Phone number saved.\n\n💬 Now please write a short **cover letter or motivation message** (tell us why you want this internship):"
     )
@@ -328,7 +393,7 @@ def handle_phone_input(application, message_body, from_number):
 def handle_cover_letter_input(application, message_body, from_number):
     """Handle cover letter input"""
     if len(message_body.strip()) < 20:
-        send_whatsapp_message(
+        queue_whatsapp(
             from_number,
             "Please provide a more detailed cover letter (at least 20 characters). Tell us why you want this internship:"
         )
@@ -338,142 +403,371 @@ def handle_cover_letter_input(application, message_body, from_number):
     temp_data['cover_letter'] = message_body.strip()
     application.temp_data = temp_data
     application.conversation_state = STATE_WAITING_FOR_CV
+    schedule_nudge(application, from_number)
     
-    send_whatsapp_message(
+    queue_whatsapp(
         from_number,
         "📝 Excellent! Your motivation is noted.\n\n📎 **Final Step:** Please attach your **CV** as a PDF, Word document, or image file.\n\n💡 **Tip:** If you have a cover letter from your university or college, please include it with your CV document."
     )
 
 def process_media_message(application, whatsapp_msg, from_number):
-    """Process media attachment (CV)"""
+    """Acknowledge a CV attachment and hand the download to the background fetcher"""
     try:
         media_url = getattr(whatsapp_msg, 'media_url', None)
         media_content_type = getattr(whatsapp_msg, 'media_content_type', None)
         
+        if media_url and image_cvs.accepts(media_content_type):
+            collect_cv_image(application, from_number, media_url)
+            return
+        
         # Only accept PDF documents
         if not media_content_type or 'pdf' not in media_content_type.lower():
-            send_whatsapp_message(
+            queue_whatsapp(
                 from_number,
+                "❌ Please upload a PDF document or photos of your CV only. Other file types are not accepted."
+                if image_cvs.ENABLED else
                 "❌ Please upload a PDF document only. Other file types are not accepted."
             )
             return
         
         if not media_url:
-            send_whatsapp_message(
+            queue_whatsapp(
                 from_number,
                 "Error processing your PDF file. Please try uploading again."
             )
             return
         
-        # Download and store the PDF file
-        try:
-            import requests
-            from utils import save_media_file
-            
-            # Download the media file
-            filename, original_filename = save_media_file(media_url, 'pdf')
-            
-            if not filename:
-                send_whatsapp_message(
-                    from_number,
-                    "Error downloading your CV. Please try uploading again."
-                )
-                return
-                
-        except Exception as e:
-            logger.error(f"Error downloading media file: {e}")
-            send_whatsapp_message(
-                from_number,
-                "Error downloading your CV. Please try uploading again."
-            )
-            return
-        
-        # Complete the application with real data from temp_data 
-        temp_data = application.temp_data or {}
-        
-        # ONLY save application to database when it's complete with all data
-        # If this is still an incomplete application, create a new complete one
-        if not application.full_name or not application.email:
-            # Create a new complete application
-            complete_application = Application(
-                application_id=Application.generate_application_id(),
-                internship_id=application.internship_id,
-                whatsapp_number=from_number,
-                full_name=temp_data.get('full_name'),
-                email=temp_data.get('email'),
-                phone_number=from_number,
-                cover_letter=temp_data.get('cover_letter', 'Please see attached CV for details'),
-                cv_filename=filename,
-                cv_original_filename=original_filename,
-                conversation_state=STATE_COMPLETED,
-                applied_at=datetime.utcnow(),
-                temp_data={}
-            )
-            
-            # Delete the incomplete application if it was in database
-            if application.id:
-                db.session.delete(application)
-            
-            # Add the complete application
-            db.session.add(complete_application)
-            application = complete_application
-        else:
-            # Update existing application with completion data
-            application.full_name = temp_data.get('full_name', application.full_name)
-            application.email = temp_data.get('email', application.email)
-            application.phone_number = from_number
-            application.cover_letter = temp_data.get('cover_letter', 'Please see attached CV for details')
-            application.cv_filename = filename
-            application.cv_original_filename = original_filename
-            application.conversation_state = STATE_COMPLETED
-            application.applied_at = datetime.utcnow()
-        
-        # Final safety check - if still fallback data, log error
-        if application.full_name == 'Name from CV' or 'pending.com' in application.email:
-            logger.error(f"❌ CRITICAL: Still using fallback data for {application.application_id}")
-            logger.error(f"   Full Name: {application.full_name}")
-            logger.error(f"   Email: {application.email}")
-            logger.error(f"   Temp Data: {temp_data}")
-        else:
-            logger.info(f"✅ Real data confirmed for {application.application_id}: {application.full_name}, {application.email}")
-        
-        internship = Internship.query.get(application.internship_id)
-        
-        send_whatsapp_message(
+        # Mark the application as "CV received, processing" and commit so the
+        # fetcher can pick it up from another thread
+        temp_data = dict(application.temp_data or {})
+        temp_data['cv_media_url'] = media_url
+        temp_data['cv_media_content_type'] = media_content_type
+        application.temp_data = temp_data
+        application.conversation_state = STATE_PROCESSING_CV
+        db.session.add(application)
+        funnel.record_stage(application.internship_id, 'cv_received')
+        queue_whatsapp(
             from_number,
-            f"🎉 **APPLICATION COMPLETE!**\n\n📋 Position: {internship.title}\n👤 Name: {application.full_name}\n📧 Email: {application.email}\n📎 CV: Received ✅\n\n✅ Done! We'll review your application and contact you.\n\n🤞 Good luck!"
+            "📥 **CV received!** We're processing your application now - you'll get a confirmation in a moment."
         )
+        db.session.commit()
         
-        # Send confirmation email if possible
-        try:
-            from communication import send_email
-            send_email(
-                application.email,
-                f"Application Confirmation - {internship.title}",
-                f"Dear {application.full_name},\n\nYour application for {internship.title} has been successfully submitted.\n\nWe will review your application and get back to you soon.\n\nBest regards,\nThe Team"
-            )
-        except Exception as e:
-            logger.error(f"Failed to send confirmation email: {e}")
+        cv_fetch_stage().submit(fetch_cv, application.id, from_number, media_url)
         
     except Exception as e:
         logger.error(f"Error processing media message: {e}")
-        send_whatsapp_message(
+        db.session.rollback()
+        queue_whatsapp(
             from_number,
             "Error processing your file. Please try uploading again."
         )
 
+def fetch_cv(application_id, from_number, media_url):
+    """Fetcher stage: download the CV and complete the application"""
+    application = Application.query.get(application_id)
+    if not application or application.conversation_state != STATE_PROCESSING_CV:
+        logger.warning(f"CV fetch skipped: application {application_id} is no longer waiting for its CV")
+        return
+    
+    # Raises on failure so the stage retry policy kicks in
+    filename, original_filename = save_media_file(media_url, 'pdf')
+    attach_cv(application, from_number, filename, original_filename)
+
+def collect_cv_image(application, from_number, media_url):
+    """Keep one photographed CV page until the applicant replies DONE"""
+    temp_data = dict(application.temp_data or {})
+    images = list(temp_data.get('cv_images') or [])
+    if len(images) >= image_cvs.MAX_IMAGES:
+        queue_whatsapp(
+            from_number,
+            f"📄 That's the maximum of {image_cvs.MAX_IMAGES} pages. Reply **DONE** to submit the ones you sent."
+        )
+        return
+    images.append(media_url)
+    temp_data['cv_images'] = images
+    application.temp_data = temp_data
+    db.session.add(application)
+    queue_whatsapp(
+        from_number,
+        f"📸 Page {len(images)} received. Send the next page, or reply **DONE** when you have sent them all."
+    )
+
+def submit_cv_images(application, from_number):
+    """Hand the collected CV photos to the conversion stage"""
+    images = application.temp_data['cv_images']
+    application.conversation_state = STATE_PROCESSING_CV
+    db.session.add(application)
+    funnel.record_stage(application.internship_id, 'cv_received')
+    queue_whatsapp(
+        from_number,
+        f"📥 **{len(images)} page(s) received!** We're turning them into a PDF now - you'll get a confirmation in a moment."
+    )
+    db.session.commit()
+    
+    image_cv_stage().submit(convert_image_cv, application.id, from_number, images)
+
+def convert_image_cv(application_id, from_number, media_urls):
+    """Conversion stage: download the CV photos, combine them into one PDF and complete the application"""
+    application = Application.query.get(application_id)
+    if not application or application.conversation_state != STATE_PROCESSING_CV:
+        logger.warning(f"CV conversion skipped: application {application_id} is no longer waiting for its CV")
+        return
+    
+    upload_folder = app.config['UPLOAD_FOLDER']
+    image_paths = []
+    try:
+        # Raises on failure so the stage retry policy kicks in
+        for media_url in media_urls:
+            image_paths.append(os.path.join(upload_folder, save_media_file(media_url, 'jpg')[0]))
+        filename = f"{uuid.uuid4()}.pdf"
+        pdf_path = os.path.join(upload_folder, filename)
+        try:
+            cv_processing.run_in_pool(image_cvs.images_to_pdf, image_paths, pdf_path)
+        except image_cvs.InvalidImage as e:
+            logger.info(f"CV photos for application {application_id} rejected: {e}")
+            reject_cv(application, from_number, 'image_too_large' if isinstance(e, image_cvs.ImageTooLarge) else 'invalid_image')
+            db.session.commit()
+            return
+        except Exception:
+            # Timed out or crashed part way; the retry writes a new file
+            for leftover in (pdf_path, f'{pdf_path}.partial'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            raise
+    finally:
+        for path in image_paths:
+            if os.path.exists(path):
+                os.remove(path)
+    
+    attach_cv(application, from_number, filename, 'cv_photos.pdf')
+
+def attach_cv(application, from_number, filename, original_filename):
+    """Check a stored CV and, if it passes, complete the application with it.
+
+    The stored file is removed unless the application ends up committed with
+    it, so a failed attempt (retried with a fresh download) leaves no orphan.
+    """
+    path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    try:
+        # Checked in the CV processing pool; a timeout or crash raises and is retried too
+        result = cv_processing.process_cv(path)
+        if result['status'] in cv_processing.REJECTED_STATUSES:
+            logger.info(f"CV for application {application.id} rejected: {result['status']} ({result['reason']})")
+            os.remove(path)
+            reject_cv(application, from_number, result['status'])
+            db.session.commit()
+            return
+        
+        started_at = (application.temp_data or {}).get('started_at')
+        application = complete_application(application, from_number, filename, original_filename)
+        application.cv_status = result['status']
+        application.cv_pages = result['pages']
+        application.cv_size = result['size']
+        application.cv_sha256 = result['sha256']
+        application.cv_text = result['text']
+        identities.assign(application)
+        funnel.record_completion(application.internship_id, started_at)
+        
+        # Confirmations are committed together with the completed application
+        queue_application_confirmations(application, from_number)
+        publish_new_application(application)
+        db.session.commit()
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    
+    # Warm the thumbnail cache before a reviewer opens the list
+    thumbnails.request_thumbnail(thumbnails.thumbnail_key(filename), path)
+
+def publish_new_application(application):
+    """Tell open dashboards about a completed application once it is committed"""
+    publish_on_commit(
+        'application',
+        id=application.id,
+        full_name=application.full_name,
+        email=application.email,
+        internship=application.internship.title if application.internship else None,
+        applied_at=application.applied_at.isoformat(),
+        status=application.status or 'pending',
+    )
+    publish_counters(total_applications=1, pending_applications=1 if (application.status or 'pending') == 'pending' else 0)
+
+def complete_application(application, from_number, filename, original_filename):
+    """Fill in the final application data once the CV is stored"""
+    # Complete the application with real data from temp_data 
+    temp_data = application.temp_data or {}
+    
+    # ONLY save application to database when it's complete with all data
+    # If this is still an incomplete application, create a new complete one
+    if not application.full_name or not application.email:
+        # Create a new complete application
+        completed = Application(
+            internship_id=application.internship_id,
+            whatsapp_number=from_number,
+            full_name=temp_data.get('full_name'),
+            email=temp_data.get('email'),
+            phone_number=from_number,
+            cover_letter=temp_data.get('cover_letter', 'Please see attached CV for details'),
+            cv_filename=filename,
+            cv_original_filename=original_filename,
+            conversation_state=STATE_COMPLETED,
+            applied_at=datetime.utcnow(),
+            temp_data={}
+        )
+        
+        # Delete the incomplete application if it was in database
+        if application.id:
+            db.session.delete(application)
+        
+        # Add the complete application
+        db.session.add(completed)
+        db.session.flush()
+        application = completed
+    else:
+        # Update existing application with completion data
+        application.full_name = temp_data.get('full_name', application.full_name)
+        application.email = temp_data.get('email', application.email)
+        application.phone_number = from_number
+        application.cover_letter = temp_data.get('cover_letter', 'Please see attached CV for details')
+        application.cv_filename = filename
+        application.cv_original_filename = original_filename
+        application.conversation_state = STATE_COMPLETED
+        application.applied_at = datetime.utcnow()
+    
+    # Final safety check - if still fallback data, log error
+    if application.full_name == 'Name from CV' or 'pending.com' in (application.email or ''):
+        logger.error(f"❌ CRITICAL: Still using fallback data for {application.application_id}")
+        logger.error(f"   Full Name: {application.full_name}")
+        logger.error(f"   Email: {application.email}")
+        logger.error(f"   Temp Data: {temp_data}")
+    else:
+        logger.info(f"✅ Real data confirmed for {application.application_id}: {application.full_name}, {application.email}")
+    
+    return application
+
+CV_REJECTION_MESSAGES = {
+    'invalid': "❌ We couldn't open your file as a PDF. Please export your CV as a PDF and send it again.",
+    'encrypted': "🔒 Your PDF is password protected. Please send a version without a password.",
+    'too_large': f"📦 Your PDF is larger than {cv_processing.MAX_BYTES // (1024 * 1024)} MB. Please send a smaller file.",
+    'too_many_pages': f"📄 Your CV has more than {cv_processing.MAX_PAGES} pages. Please send a shorter version.",
+    'invalid_image': "❌ We couldn't read one of your photos. Please send your CV again as JPEG or PNG photos, or as a PDF.",
+    'image_too_large': f"📦 One of your photos is larger than {image_cvs.MAX_PIXELS // 1_000_000} megapixels. Please send smaller photos (JPEG works best), or your CV as a PDF.",
+}
+
+def _forget_cv_images(application):
+    temp_data = dict(application.temp_data or {})
+    if temp_data.pop('cv_images', None) is not None:
+        application.temp_data = temp_data
+
+def reject_cv(application, from_number, status):
+    """Give the applicant their upload step back after a CV failed the checks"""
+    application.conversation_state = STATE_WAITING_FOR_CV
+    _forget_cv_images(application)
+    # The applicant will send the CV again; count it once
+    funnel.increment(application.internship_id, cv_received=-1)
+    schedule_nudge(application, from_number)
+    queue_whatsapp(from_number, CV_REJECTION_MESSAGES[status])
+
+def cv_fetch_failed(func, args, kwargs, error):
+    """Give the applicant their upload step back when the fetcher gives up"""
+    application_id, from_number = args[0], args[1]
+    application = Application.query.get(application_id)
+    if application and application.conversation_state == STATE_PROCESSING_CV:
+        application.conversation_state = STATE_WAITING_FOR_CV
+        _forget_cv_images(application)
+        # The applicant will send the CV again; count it once
+        funnel.increment(application.internship_id, cv_received=-1)
+        schedule_nudge(application, from_number)
+    
+    queue_whatsapp(
+        from_number,
+        "Error downloading your CV. Please try uploading again."
+    )
+    db.session.commit()
+
+def queue_application_confirmations(application, from_number):
+    """Queue the WhatsApp and email confirmations for a completed application"""
+    internship = Internship.query.get(application.internship_id)
+    
+    queue_whatsapp(
+        from_number,
+        f"🎉 **APPLICATION COMPLETE!**\n\n📋 Position: {internship.title}\n👤 Name: {application.full_name}\n📧 Email: {application.email}\n📎 CV: Received ✅\n\n✅ Done! We'll review your application and contact you.\n\n🤞 Good luck!",
+        application.id
+    )
+    
+    # Send confirmation email if possible
+    if application.email:
+        queue_email(
+            application.email,
+            f"Application Confirmation - {internship.title}",
+            f"Dear {application.full_name},\n\nYour application for {internship.title} has been successfully submitted.\n\nWe will review your application and get back to you soon.\n\nBest regards,\nThe Team",
+            application.id
+        )
+
+# Background stage for the CV download; keeps its own retry policy and latency stats
+def cv_fetch_stage():
+    return get_stage(
+        'cv_fetch',
+        workers=4,
+        retry_policy=RetryPolicy(max_attempts=3, base_delay=2.0),
+        on_failure=cv_fetch_failed
+    )
+
+# Image CVs get their own workers so slow conversions don't hold up PDF fetches
+def image_cv_stage():
+    return get_stage(
+        'image_cv',
+        workers=2,
+        retry_policy=RetryPolicy(max_attempts=3, base_delay=2.0),
+        on_failure=cv_fetch_failed
+    )
+
+@scheduler.periodic('CV recovery')
+def requeue_stalled_cvs(now=None):
+    """Resubmit CV downloads and conversions lost with a restarted worker; returns when to look again"""
+    now = now or datetime.utcnow()
+    stalled = db.session.query(Application.id, Application.whatsapp_number, Application.temp_data, Application.updated_at).filter(
+        Application.conversation_state == STATE_PROCESSING_CV,
+        Application.updated_at < now - CV_STALE_AFTER
+    ).limit(CV_SWEEP_BATCH_SIZE).all()
+    for application_id, from_number, temp_data, updated_at in stalled:
+        # Moving updated_at on claims the row, so only one worker resubmits it
+        # and it isn't looked at again for another CV_STALE_AFTER
+        claimed = Application.query.filter(
+            Application.id == application_id,
+            Application.conversation_state == STATE_PROCESSING_CV,
+            Application.updated_at == updated_at
+        ).update({Application.updated_at: now}, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            continue
+        temp_data = temp_data or {}
+        logger.warning(f"Resubmitting the CV of application {application_id}, processing since {updated_at}")
+        if temp_data.get('cv_images'):
+            image_cv_stage().submit(convert_image_cv, application_id, from_number, temp_data['cv_images'])
+        elif temp_data.get('cv_media_url'):
+            cv_fetch_stage().submit(fetch_cv, application_id, from_number, temp_data['cv_media_url'])
+        else:
+            # Nothing to retry from; ask for the CV again
+            cv_fetch_failed(None, (application_id, from_number), {}, None)
+    return now + CV_SWEEP_INTERVAL
+
 def handle_message_status(status):
     """Handle message delivery status updates"""
     try:
         message_id = status.get('id')
         status_type = status.get('status')
         timestamp = status.get('timestamp')
+        errors = status.get('errors') or []
         
-        # Update message status in database
-        whatsapp_msg = WhatsAppMessage.query.filter_by(message_id=message_id).first()
-        if whatsapp_msg:
-            whatsapp_msg.status = status_type
-            db.session.commit()
+        # Statuses refer to our outbound messages, matched by provider SID
+        record_status(
+            message_id,
+            status_type,
+            error_message=errors[0].get('title') if errors else None,
+            timestamp=datetime.utcfromtimestamp(int(timestamp)) if timestamp else None
+        )
             
     except Exception as e:
         logger.error(f"Error handling message status: {e}")
@@ -488,6 +782,7 @@ def get_media_url(media_id):
             'Authorization': f'Bearer {access_token}'
         }
         
+        import requests
         response = requests.get(url, headers=headers)
         if response.status_code == 200:
             data = response.json()